@@ -1,47 +1,68 @@
 import os
+import json
+import asyncio
 import logging
+from typing import Annotated
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 import uvicorn
 from dotenv import load_dotenv
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
 from semantic_kernel.contents.utils.author_role import AuthorRole
-from fastapi import FastAPI, status
-from fastapi.responses import JSONResponse
-from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
+from fastapi import FastAPI, Header, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from opentelemetry import trace
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from src.utils.constants import Constants
-from src.logging.telemetry import set_up_logging, set_up_tracing, set_up_metrics
+from src.logging.payload import LogPayload
+from src.logging.sampling import DEBUG_ATTRIBUTE
+from src.logging.telemetry import get_telemetry_config_from_environment, set_up_telemetry
 
 if os.path.exists(".env"):
     load_dotenv(override=True)
 else:
     raise FileNotFoundError("The .env file is missing")
 
-application_insights_key = os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING", None)
-if application_insights_key:
-    set_up_logging(application_insights_key)
-    set_up_tracing(application_insights_key)
-    set_up_metrics(application_insights_key)
+telemetry_config = get_telemetry_config_from_environment()
+is_telemetry_enabled = set_up_telemetry(telemetry_config)
 
 # The following imports having dependencies on the environment variables
 from src.mysql.execution_env import SqlEnv
-from src.groupchat.state_flow_chat import get_chat_client
+from src.mysql.execution_env_pool import SqlEnvPool
+from src.cache.answer_cache import AnswerCache, SchemaFingerprint
+from src.groupchat.state_flow_chat import get_chat_client, get_state_flow_agents
 
-app = FastAPI()
+sql_executor_env_pool = SqlEnvPool.get_sql_executor_env_pool_from_environment()
+answer_cache = AnswerCache.get_answer_cache_from_environment()
+schema_fingerprint_source = (
+    SchemaFingerprint.get_schema_fingerprint_from_environment(SqlEnv.SQL_CONFIG) if answer_cache is not None else None
+)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """Builds the shared agents, loads the schema catalog and fingerprint at startup and closes the pooled MySQL sessions when the API shuts down"""
+    get_state_flow_agents()
+    if schema_fingerprint_source is not None:
+        try:
+            await asyncio.to_thread(schema_fingerprint_source.refresh)
+        except Exception as err: # pylint: disable=broad-except
+            logger.warning("Schema fingerprint not computed at startup, the answer cache is used once it is: %s", err)
+    if sql_executor_env_pool.schema_catalog is not None:
+        try:
+            await asyncio.to_thread(sql_executor_env_pool.schema_catalog.refresh)
+        except Exception as err: # pylint: disable=broad-except
+            logger.warning("Schema catalog not loaded at startup, it is loaded on first use: %s", err)
+    yield
+    sql_executor_env_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 logger: logging.Logger = logging.getLogger("semantic_kernel")
-trace.set_tracer_provider(TracerProvider())
-tracer = trace.get_tracer("semantic_kernel")
-sql_executor_env = SqlEnv.get_sql_executor_env_from_environment()
 
-# OpenTelemetry setup
-if application_insights_key:
+# OpenTelemetry setup, the spans are exported by the tracer provider of the telemetry setup
+if is_telemetry_enabled:
     FastAPIInstrumentor().instrument_app(app)
-    span_processor = BatchSpanProcessor(
-        AzureMonitorTraceExporter.from_connection_string(application_insights_key)
-    )
-    trace.get_tracer_provider().add_span_processor(span_processor)
 
 if os.getenv("IS_DEVELOPMENT", "False").lower() == "true":
     logging.basicConfig(level=logging.INFO)
@@ -56,57 +77,173 @@ async def home() -> dict:
     }
 
 
+def _get_message_response(content: ChatMessageContent) -> dict:
+    """Converts an agent message to its API representation"""
+    return {
+        "role": content.role,
+        "name": content.name,
+        "content": content.content,
+        "finish_reason": content.finish_reason,
+    }
+
+
+def _get_final_response(last_response: dict | None) -> dict:
+    """Builds the final API response from the last agent message of the conversation"""
+    final_response = (
+        dict(last_response)
+        if last_response is not None
+        else {"is_error": "true", "content": Constants.default_response}
+    )
+    final_response["is_error"] = "false"
+    if (
+        not final_response.get("finish_reason")
+        or final_response.get("finish_reason") != "stop"
+    ):
+        final_response["is_error"] = "true"
+        final_response["content"] = Constants.default_response
+        return final_response
+    final_response["content"] = (
+        final_response["content"]
+        .replace(Constants.observation_identifier, "")
+        .strip()
+    )
+    return final_response
+
+
+def _get_cached_response(query: str) -> tuple[str | None, dict | None]:
+    """Looks the question up in the answer cache before any MySQL session is leased, returns the schema fingerprint and the cached answer if any"""
+    if answer_cache is None:
+        return None, None
+    schema_fingerprint = schema_fingerprint_source.get()
+    if schema_fingerprint is None:
+        return None, None
+    return schema_fingerprint, answer_cache.get(query, schema_fingerprint)
+
+
+def _set_cached_response(schema_fingerprint: str | None, query: str, final_response: dict) -> None:
+    """Caches the final answer of a successful conversation"""
+    if answer_cache is not None and schema_fingerprint is not None and final_response["is_error"] == "false":
+        answer_cache.set(query, schema_fingerprint, final_response)
+
+
+def _is_debug_request(x_debug: bool) -> bool:
+    """Honours the debug header when it is enabled, the trace of the request is then kept by the tail sampling"""
+    is_debug = x_debug and telemetry_config["log_debug_header"]
+    if is_debug:
+        trace.get_current_span().set_attribute(DEBUG_ATTRIBUTE, True)
+    return is_debug
+
+
+def _get_log_payload(value, is_debug: bool) -> LogPayload:
+    """Cuts the logged value to the max payload size, unless the request is debugged"""
+    return LogPayload(value, None if is_debug else telemetry_config["log_max_payload_chars"])
+
+
+def _log_step(content: ChatMessageContent, is_debug: bool) -> None:
+    """Logs an agent step, in full at info level for a debugged request and cut at debug level otherwise"""
+    logger.log(
+        logging.INFO if is_debug else logging.DEBUG,
+        "# %s - %s: '%s'",
+        content.role,
+        content.name or "*",
+        _get_log_payload(content.content, is_debug),
+    )
+
+
+def _format_server_sent_event(event: str, data: dict) -> str:
+    """Formats a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.get("/chat")
-async def chat(query: str) -> dict:
-    """API endpoint to interact with the chatbot"""
+async def chat(query: str, x_debug: Annotated[bool, Header()] = False) -> dict:
+    """API endpoint to interact with the chatbot, the `X-Debug: true` header logs and traces the conversation in full"""
+    is_debug = _is_debug_request(x_debug)
     try:
-        logger.info(f"Query: {query}")
-        chat = get_chat_client(sql_executor_env)
-        query_with_init_thought = sql_executor_env.attach_init_observation(query)
-        await chat.add_chat_message(
-            ChatMessageContent(role=AuthorRole.USER, content=query_with_init_thought)
-        )
-        response = []
-        async for content in chat.invoke():
-            response.append(
-                {
-                    "role": content.role,
-                    "name": content.name,
-                    "content": content.content,
-                    "finish_reason": content.finish_reason,
-                }
+        logger.info("Query: %s", _get_log_payload(query, is_debug))
+        schema_fingerprint, cached_response = _get_cached_response(query)
+        if cached_response is not None:
+            logger.info("Cached response: %s", _get_log_payload(cached_response, is_debug))
+            return cached_response
+        async with sql_executor_env_pool.lease() as sql_executor_env:
+            chat = get_chat_client(sql_executor_env, sql_executor_env_pool)
+            query_with_init_thought = await sql_executor_env.attach_init_observation_async(query)
+            await chat.add_chat_message(
+                ChatMessageContent(role=AuthorRole.USER, content=query_with_init_thought)
             )
-            logger.info(
-                f"# {content.role} - {content.name or '*'}: '{content.content}'"
-            )
-        final_response = (
-            response[-1]
-            if len(response) > 0
-            else {"is_error": "true", "content": Constants.default_response}
-        )
-        final_response["is_error"] = "false"
-        if (
-            not final_response.get("finish_reason")
-            or final_response.get("finish_reason") != "stop"
-        ):
-            final_response["is_error"] = "true"
-            final_response["content"] = Constants.default_response
-            return final_response
-        final_response["content"] = (
-            final_response["content"]
-            .replace(Constants.observation_identifier, "")
-            .strip()
-        )
-        logger.info(f"Final response: {final_response}")
+            response = []
+            async for content in chat.invoke():
+                response.append(_get_message_response(content))
+                _log_step(content, is_debug)
+        final_response = _get_final_response(response[-1] if len(response) > 0 else None)
+        _set_cached_response(schema_fingerprint, query, final_response)
+        logger.info("Final response: %s", _get_log_payload(final_response, is_debug))
         return final_response
     except Exception as e:
-        logger.error(f"Error in chat: {str(e)}", e)
-        logger.exception(e)
+        logger.exception("Error in chat: %s", e)
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"message": "Internal Server Error, check the logs for more details"},
         )
 
 
+async def _stream_chat_events(query: str, tokens: bool = False, is_debug: bool = False) -> AsyncIterator[str]:
+    """Yields one server-sent event per agent step, optionally the tokens of each step, and a final event with the answer"""
+    try:
+        logger.info("Query: %s", _get_log_payload(query, is_debug))
+        schema_fingerprint, cached_response = _get_cached_response(query)
+        if cached_response is not None:
+            logger.info("Cached response: %s", _get_log_payload(cached_response, is_debug))
+            yield _format_server_sent_event("final", cached_response)
+            return
+        async with sql_executor_env_pool.lease() as sql_executor_env:
+            chat = get_chat_client(sql_executor_env, sql_executor_env_pool)
+            query_with_init_thought = await sql_executor_env.attach_init_observation_async(query)
+            await chat.add_chat_message(
+                ChatMessageContent(role=AuthorRole.USER, content=query_with_init_thought)
+            )
+            last_response = None
+            if tokens:
+                # A step is complete once it is in the history, which happens before the next agent streams
+                step_count = len(chat.history.messages)
+                async for chunk in chat.invoke_stream():
+                    for content in chat.history.messages[step_count:]:
+                        last_response = _get_message_response(content)
+                        _log_step(content, is_debug)
+                        yield _format_server_sent_event("step", last_response)
+                    step_count = len(chat.history.messages)
+                    yield _format_server_sent_event(
+                        "token", {"name": chunk.name, "content": chunk.content}
+                    )
+                for content in chat.history.messages[step_count:]:
+                    last_response = _get_message_response(content)
+                    _log_step(content, is_debug)
+                    yield _format_server_sent_event("step", last_response)
+            else:
+                async for content in chat.invoke():
+                    last_response = _get_message_response(content)
+                    _log_step(content, is_debug)
+                    yield _format_server_sent_event("step", last_response)
+        final_response = _get_final_response(last_response)
+        _set_cached_response(schema_fingerprint, query, final_response)
+        logger.info("Final response: %s", _get_log_payload(final_response, is_debug))
+        yield _format_server_sent_event("final", final_response)
+    except Exception as e:
+        logger.exception("Error in chat stream: %s", e)
+        yield _format_server_sent_event(
+            "error", {"message": "Internal Server Error, check the logs for more details"}
+        )
+
+
+@app.get("/chat/stream")
+async def chat_stream(query: str, tokens: bool = False, x_debug: Annotated[bool, Header()] = False) -> StreamingResponse:
+    """API endpoint to interact with the chatbot, streaming every agent step (and its tokens if requested) as a server-sent event"""
+    return StreamingResponse(
+        _stream_chat_events(query, tokens, _is_debug_request(x_debug)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8085)
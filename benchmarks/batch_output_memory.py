@@ -0,0 +1,196 @@
+"""
+Measures the memory held by the batch experiment records of a run.
+
+The records are rebuilt from decoded JSON lines, as when the outputs of a run are loaded back,
+so every repeated field starts as a separate string. The legacy records keep a per-instance
+__dict__ and separate strings. They either copy the conversation history into every record
+(`legacy`), or share the conversation messages like the compact records (`legacy-reference`).
+So `compact / legacy-reference` only measures what the __slots__ and the interning save.
+
+Usage:
+    python benchmarks/batch_output_memory.py --conversations 2000 --turns 8
+"""
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+from uuid import uuid4
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../experimentation"))
+
+from exp_src.model.batch_output import (  # pylint: disable=wrong-import-position
+    BatchOutput,
+    AgentInvokingData,
+    AgentInvokingTrajectory,
+    ConversationMessages,
+)
+
+
+class LegacyBatchOutput:
+    """The dict-backed record the batch runner used to keep for every agent turn."""
+
+    def __init__(self, role, name, threadId, parentId, input, output, conversation_history, experiment):  # pylint: disable=redefined-builtin
+        self.id = str(uuid4())
+        self.role = role
+        self.name = name
+        self.threadId = threadId
+        self.parentId = parentId
+        self.input = input
+        self.output = output
+        self.conversation_history = conversation_history
+        self.experiment = experiment
+
+
+class LegacyAgentInvokingData:
+    """The dict-backed agent selection with its own copy of the history."""
+
+    def __init__(self, name, conversation_history):
+        self.name = name
+        self.conversation_history = conversation_history
+
+
+class LegacyReferenceBatchOutput(LegacyBatchOutput):
+    """The dict-backed record sharing the conversation messages instead of copying the history."""
+
+    def __init__(self, role, name, threadId, parentId, input, output, experiment, messages, history_offset):  # pylint: disable=redefined-builtin
+        super().__init__(role, name, threadId, parentId, input, output, None, experiment)
+        self.messages = messages
+        self.history_offset = history_offset
+
+
+class LegacyReferenceAgentInvokingData(LegacyAgentInvokingData):
+    """The dict-backed agent selection sharing the conversation messages."""
+
+    def __init__(self, name, messages, history_offset):
+        super().__init__(name, None)
+        self.messages = messages
+        self.history_offset = history_offset
+
+
+class LegacyAgentInvokingTrajectory:
+    """The dict-backed trajectory of a conversation."""
+
+    def __init__(self, experiment, threadId, input, final_output, agent_selections):  # pylint: disable=redefined-builtin
+        self.agent_selections = agent_selections
+        self.experiment = experiment
+        self.threadId = threadId
+        self.input = input
+        self.final_output = final_output
+        self.id = str(uuid4())
+
+
+def get_turns(conversation: int, turns: int) -> list[str]:
+    """Builds the encoded turns of a conversation, decoded one record at a time like loaded outputs."""
+    return [
+        json.dumps({
+            "experiment": "SQL Copilot Batch Experiment",
+            "threadId": "6f1c1c1e-4b8e-4c2a-9f3e-2d5b3c1a0e7f",
+            "input": f"What is the total order value of customer {conversation}?",
+            "name": ["observe", "executor", "select", "executor", "verify"][turn % 5],
+            "output": f"ASSISTANT - agent: Thought: step {turn}\nAction: execute[SELECT * FROM orders LIMIT {turn}]" * 2,
+        })
+        for turn in range(turns)
+    ]
+
+
+def build_legacy(conversations: int, turns: int) -> list:
+    """Builds the records the way the batch runner used to."""
+    records = []
+    for conversation in range(conversations):
+        parent_id = str(uuid4())
+        conversation_history = "USER - user: question\n"
+        selections = []
+        for line in get_turns(conversation, turns):
+            turn = json.loads(line)
+            records.append(LegacyBatchOutput(
+                turn["name"], turn["name"], turn["threadId"], parent_id, turn["input"],
+                turn["output"], conversation_history, turn["experiment"]
+            ))
+            selections.append(LegacyAgentInvokingData(turn["name"], conversation_history))
+            conversation_history += f"{turn['output']}\n"
+        records.append(LegacyAgentInvokingTrajectory(
+            turn["experiment"], turn["threadId"], turn["input"], turn["output"], selections
+        ))
+    return records
+
+
+def build_legacy_reference(conversations: int, turns: int) -> list:
+    """Builds the dict-backed records sharing the conversation messages, without slots nor interning."""
+    records = []
+    for conversation in range(conversations):
+        parent_id = str(uuid4())
+        messages = ConversationMessages()
+        history_offset = messages.append("USER - user: question")
+        selections = []
+        for line in get_turns(conversation, turns):
+            turn = json.loads(line)
+            records.append(LegacyReferenceBatchOutput(
+                turn["name"], turn["name"], turn["threadId"], parent_id, turn["input"],
+                turn["output"], turn["experiment"], messages, history_offset
+            ))
+            selections.append(LegacyReferenceAgentInvokingData(turn["name"], messages, history_offset))
+            history_offset = messages.append(turn["output"])
+        trajectory = LegacyAgentInvokingTrajectory(
+            turn["experiment"], turn["threadId"], turn["input"], turn["output"], selections
+        )
+        trajectory.messages = messages
+        trajectory.parentId = parent_id
+        records.append(trajectory)
+    return records
+
+
+def build_compact(conversations: int, turns: int) -> list:
+    """Builds the slotted records sharing the conversation messages."""
+    records = []
+    for conversation in range(conversations):
+        parent_id = str(uuid4())
+        messages = ConversationMessages()
+        history_offset = messages.append("USER - user: question")
+        selections = []
+        for line in get_turns(conversation, turns):
+            turn = json.loads(line)
+            records.append(BatchOutput(
+                turn["name"], turn["name"], turn["threadId"], parent_id, turn["input"],
+                turn["output"], None, turn["experiment"], messages=messages, history_offset=history_offset
+            ))
+            selections.append(AgentInvokingData(turn["name"], None, messages=messages, history_offset=history_offset))
+            history_offset = messages.append(turn["output"])
+        records.append(AgentInvokingTrajectory(
+            turn["experiment"], turn["threadId"], turn["input"], turn["output"], selections,
+            messages=messages, parentId=parent_id
+        ))
+    return records
+
+
+def measure(build, conversations: int, turns: int) -> int:
+    """Returns the bytes still allocated once the records are built."""
+    tracemalloc.start()
+    records = build(conversations, turns)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=8)
+    args = parser.parse_args()
+
+    results = {
+        name: measure(build, args.conversations, args.turns)
+        for name, build in (
+            ("legacy", build_legacy), ("legacy-reference", build_legacy_reference), ("compact", build_compact)
+        )
+    }
+    record_count = args.conversations * (args.turns + 1)
+    for name, size in results.items():
+        print(f"{name:16} {size / 2**20:10.1f} MiB {size / record_count:10.0f} bytes/record")
+    print(f"compact / legacy: {results['compact'] / results['legacy']:.2f}")
+    print(f"compact / legacy-reference (slots and interning): {results['compact'] / results['legacy-reference']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
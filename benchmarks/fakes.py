@@ -0,0 +1,152 @@
+"""
+Deterministic stand-ins for the LLM and the MySQL database, so the state flow orchestration can be
+measured without any network call.
+
+`FakeChatCompletion` answers every agent with a scripted thought and action after an optional
+simulated latency, and `SqliteSqlEnv` runs the SQL of the executor on an in-memory SQLite database
+shared by all conversations, translating `SHOW TABLES` and `DESC <table>`.
+"""
+import asyncio
+import sqlite3
+import threading
+from typing import Any
+from openai.types import CompletionUsage
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from semantic_kernel.contents.utils.finish_reason import FinishReason
+from src.mysql.execution_env import SqlEnv
+from src.utils.constants import Constants
+
+QUESTION = "What is the total order amount of every customer?"
+SELECT_SQL = "SELECT c.name, SUM(o.amount) FROM customers c JOIN orders o ON o.customer_id = c.id GROUP BY c.name"
+VERIFY_THOUGHT = "Thought: I should verify the totals of the customers."
+
+SCRIPT = {
+    "observe": "Thought: The orders table holds the amounts.\nAction: execute[DESC orders]",
+    "select": f"Thought: I should sum the amounts by customer.\nAction: execute[{SELECT_SQL}]",
+    "error": f"Thought: I should fix the query.\nAction: execute[{SELECT_SQL}]",
+}
+
+
+class FakeChatCompletion(ChatCompletionClientBase): # pylint: disable=abstract-method
+    """
+    A chat completion service replying with the scripted action of its agent. The verify agent
+    re-runs the query `verify_rounds` times before it submits, which sets the conversation length.
+    """
+    client: Any = None
+    latency: float = 0.0
+    verify_rounds: int = 1
+
+    async def _inner_get_chat_message_contents(
+        self,
+        chat_history: ChatHistory,
+        settings: PromptExecutionSettings,
+    ) -> list[ChatMessageContent]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.service_id == "verify":
+            # The queries are counted by their SQL, which the compacted history keeps in its notes
+            rounds = sum(str(message.content).count(SELECT_SQL) for message in chat_history.messages) - 1
+            action = f"execute[{SELECT_SQL}]" if rounds < self.verify_rounds else Constants.action_submit
+            content = f"{VERIFY_THOUGHT}\nAction: {action}"
+        else:
+            content = SCRIPT[self.service_id]
+        prompt_tokens = sum(len(str(message.content)) for message in chat_history.messages) // 4
+        return [ChatMessageContent(
+            role=AuthorRole.ASSISTANT,
+            content=content,
+            ai_model_id="fake",
+            finish_reason=FinishReason.STOP,
+            metadata={"usage": CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=len(content) // 4,
+                total_tokens=prompt_tokens + len(content) // 4,
+            )},
+        )]
+
+    @classmethod
+    def get_factory(cls, latency: float = 0.0, verify_rounds: int = 1):
+        """Returns a replacement of `_create_chat_completion` building fake services"""
+        def create(service_id: str, async_client: Any = None) -> "FakeChatCompletion":  # pylint: disable=unused-argument
+            return cls(service_id=service_id, ai_model_id="fake", latency=latency, verify_rounds=verify_rounds)
+        return create
+
+
+class SqliteSqlEnv(SqlEnv):
+    """A SqlEnv executing on a shared in-memory SQLite database, seeded once per process."""
+    uri = "file:state_flow_benchmark?mode=memory&cache=shared"
+    _anchor: sqlite3.Connection | None = None
+    _lock = threading.Lock()
+
+    def __init__(self) -> None:
+        super().__init__({"host": "sqlite", "port": None, "user": None, "database": "benchmark", "password": None})
+        SqliteSqlEnv.seed()
+
+    @classmethod
+    def seed(cls, customers: int = 200, orders_per_customer: int = 20) -> None:
+        """Creates the tables once, the anchor connection keeps the in-memory database alive"""
+        with cls._lock:
+            if cls._anchor is not None:
+                return
+            cls._anchor = sqlite3.connect(cls.uri, uri=True, check_same_thread=False)
+            cls._anchor.executescript(
+                "CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT NOT NULL, city TEXT);"
+                "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER NOT NULL, amount REAL NOT NULL,"
+                " ordered_at TEXT, FOREIGN KEY (customer_id) REFERENCES customers(id));"
+            )
+            cls._anchor.executemany(
+                "INSERT INTO customers VALUES (?, ?, ?)",
+                [(index, f"customer {index}", f"city {index % 10}") for index in range(customers)],
+            )
+            cls._anchor.executemany(
+                "INSERT INTO orders (customer_id, amount, ordered_at) VALUES (?, ?, ?)",
+                [
+                    (customer, (customer * 7 + order * 13) % 500 + 0.99, f"2024-01-{order % 28 + 1:02d}")
+                    for customer in range(customers)
+                    for order in range(orders_per_customer)
+                ],
+            )
+            cls._anchor.commit()
+
+    def connect(self) -> None:
+        self.cnx = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self.cursor = self.cnx.cursor()
+
+    @staticmethod
+    def translate(action: str) -> tuple[str, tuple]:
+        """Translates the MySQL statements SQLite does not know"""
+        statement = action.strip().rstrip(";")
+        keyword = statement.split(None, 1)[0].upper() if statement else ""
+        if statement.upper() == Constants.sql_show_tables:
+            return "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name", ()
+        if keyword in ("DESC", "DESCRIBE"):
+            return (
+                "SELECT name, type, CASE \"notnull\" WHEN 1 THEN 'NO' ELSE 'YES' END,"
+                " CASE pk WHEN 0 THEN '' ELSE 'PRI' END, dflt_value, '' FROM pragma_table_info(?)",
+                (statement.split(None, 1)[1].strip("` "),),
+            )
+        return statement, ()
+
+    def execute_action(self, action) -> None:
+        if self.cnx is None:
+            self.connect()
+        try:
+            self.cursor.execute(*self.translate(action))
+            if self.cursor.description is not None:
+                self.observation = self.fetch_observation()
+            self.info["action_executed"] = True
+        except sqlite3.Error as err:
+            self.observation = f"{Constants.sql_error_message}: {err}"
+            self.info["error"] = err
+
+    def kill_query(self) -> None:
+        if self.cnx is not None:
+            self.cnx.interrupt()
+
+    def close(self) -> None:
+        if self.cnx is not None:
+            self.cnx.close()
+            self.cnx = None
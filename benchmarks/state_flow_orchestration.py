@@ -0,0 +1,201 @@
+"""
+Measures the overhead of the state flow orchestration, with a deterministic fake LLM and an
+in-memory SQLite database in place of Azure OpenAI and MySQL (see fakes.py).
+
+The conversations go through `get_chat_client` and `AgentGroupChat.invoke` like in the API:
+- turn: the time between two agent messages with no LLM latency, by agent
+- strategies: the cost of one selection and one termination decision on a finished conversation
+- memory: the memory held by a finished conversation (its group chat and history)
+- throughput: conversations per second at each concurrency, with the simulated LLM latency
+
+The results are saved as JSON, and compared with a previous result file given with --baseline.
+
+Usage:
+    python benchmarks/state_flow_orchestration.py --conversations 200 --concurrency 1 8 32 --output results.json
+    python benchmarks/state_flow_orchestration.py --baseline results.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import platform
+import argparse
+import statistics
+import tracemalloc
+from collections import defaultdict
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from semantic_kernel.contents.chat_message_content import ChatMessageContent  # pylint: disable=wrong-import-position
+from semantic_kernel.contents.utils.author_role import AuthorRole  # pylint: disable=wrong-import-position
+from src.groupchat import state_flow_chat  # pylint: disable=wrong-import-position
+from src.groupchat.state_flow_selection_strategy import StateFlowSelectionStrategy  # pylint: disable=wrong-import-position
+from src.groupchat.state_flow_termination_strategy import StateFlowTerminationStrategy  # pylint: disable=wrong-import-position
+from fakes import QUESTION, FakeChatCompletion, SqliteSqlEnv  # pylint: disable=wrong-import-position
+
+
+async def run_conversation(turns: dict[str, list[float]] | None = None) -> tuple:
+    """Runs one conversation, recording the time of every agent turn by agent, returns the chat and its env"""
+    env = SqliteSqlEnv()
+    chat = state_flow_chat.get_chat_client(env)
+    await chat.add_chat_message(
+        ChatMessageContent(role=AuthorRole.USER, content=env.attach_init_observation(QUESTION))
+    )
+    started_at = time.perf_counter()
+    async for content in chat.invoke():
+        now = time.perf_counter()
+        if turns is not None:
+            turns[content.name].append((now - started_at) * 1000)
+        started_at = now
+    env.close()
+    return chat, env
+
+
+def get_summary(values: list[float]) -> dict:
+    """Summarizes timings in milliseconds"""
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values),
+        "p50_ms": values[len(values) // 2],
+        "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+    }
+
+
+async def measure_turns(conversations: int) -> dict:
+    """Per-turn overhead by agent, the LLM answers instantly"""
+    turns = defaultdict(list)
+    for _ in range(conversations):
+        await run_conversation(turns)
+    return {
+        "all": get_summary([value for values in turns.values() for value in values]),
+        **{name: get_summary(values) for name, values in sorted(turns.items())},
+    }
+
+
+async def measure_strategies(iterations: int) -> dict:
+    """Cost of the selection and termination decisions on the history of a finished conversation"""
+    chat, _ = await run_conversation()
+    agents = chat.agents
+    history = chat.history.messages
+    selection_strategy = StateFlowSelectionStrategy()
+    termination_strategy = StateFlowTerminationStrategy()
+    results = {}
+    # Every prefix of the conversation is decided, like during the conversation
+    prefixes = [history[:length] for length in range(1, len(history))]
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        for prefix in prefixes:
+            await selection_strategy.next(agents, prefix)
+    results["selection_us"] = (time.perf_counter() - started_at) * 1e6 / (iterations * len(prefixes))
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        for prefix in prefixes:
+            await termination_strategy.should_terminate(agents[-1], prefix)
+    results["termination_us"] = (time.perf_counter() - started_at) * 1e6 / (iterations * len(prefixes))
+    results["messages"] = len(history)
+    return results
+
+
+async def measure_memory(conversations: int) -> dict:
+    """Memory held by the finished conversations, once the shared agents and kernel are built"""
+    await run_conversation()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    chats = [await run_conversation() for _ in range(conversations)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del chats
+    return {
+        "bytes_per_conversation": (current - baseline) / conversations,
+        "peak_bytes": peak - baseline,
+    }
+
+
+async def measure_throughput(conversations: int, concurrency: int) -> dict:
+    """Conversations per second with at most `concurrency` conversations running at once"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run() -> None:
+        async with semaphore:
+            await run_conversation()
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(run() for _ in range(conversations)))
+    elapsed = time.perf_counter() - started_at
+    return {"conversations_per_second": conversations / elapsed, "elapsed_s": elapsed}
+
+
+async def run_benchmarks(args: argparse.Namespace) -> dict:
+    """Runs every measurement, the LLM is faked with the given latency and conversation length"""
+    results = {}
+    with patch.object(state_flow_chat, "_create_chat_completion", FakeChatCompletion.get_factory(0.0, args.verify_rounds)):
+        state_flow_chat.get_shared_kernel.cache_clear()
+        state_flow_chat.get_state_flow_agents.cache_clear()
+        await run_conversation()  # warm up
+        results["turn"] = await measure_turns(args.conversations)
+        results["strategies"] = await measure_strategies(args.iterations)
+        results["memory"] = await measure_memory(args.memory_conversations)
+    factory = FakeChatCompletion.get_factory(args.llm_latency_ms / 1000, args.verify_rounds)
+    with patch.object(state_flow_chat, "_create_chat_completion", factory):
+        state_flow_chat.get_shared_kernel.cache_clear()
+        state_flow_chat.get_state_flow_agents.cache_clear()
+        results["throughput"] = {
+            str(concurrency): await measure_throughput(args.conversations, concurrency)
+            for concurrency in args.concurrency
+        }
+    state_flow_chat.get_shared_kernel.cache_clear()
+    state_flow_chat.get_state_flow_agents.cache_clear()
+    return results
+
+
+def get_comparison(results: dict, baseline: dict, path: str = "") -> dict:
+    """Ratio of every numeric result to the baseline, above 1 is slower or larger except for the throughput"""
+    comparison = {}
+    for key, value in results.items():
+        if key not in baseline:
+            continue
+        if isinstance(value, dict):
+            comparison.update(get_comparison(value, baseline[key], f"{path}{key}."))
+        elif isinstance(value, (int, float)) and baseline[key]:
+            comparison[f"{path}{key}"] = value / baseline[key]
+    return comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=100, help="Conversations per turn and throughput measurement")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="Simulated LLM latency of the throughput measurement")
+    parser.add_argument("--verify-rounds", type=int, default=1, help="Queries re-run by the verify agent before it submits")
+    parser.add_argument("--iterations", type=int, default=200, help="Repetitions of the strategy decisions")
+    parser.add_argument("--memory-conversations", type=int, default=50)
+    parser.add_argument("--output", default="state_flow_orchestration.json")
+    parser.add_argument("--baseline", default=None, help="A previous result file to compare with")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = {
+        "benchmark": "state_flow_orchestration",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": asyncio.run(run_benchmarks(args)),
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(json.dumps(results["results"], indent=2))
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        for key, ratio in get_comparison(results["results"], baseline["results"]).items():
+            print(f"{key:60} {ratio:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Measures the per-turn overhead of the selection and termination decisions, with the compiled
+state graph and with the legacy if/elif chain it replaced.
+
+The decisions are taken on every prefix of a conversation run with the fake LLM of fakes.py, like
+during the conversation. The legacy strategies scan the list of agents for every lookup and parse
+the action of the last LLM message once for the selection and once again for the termination.
+Both implementations must select the same agent and take the same termination decision on every
+prefix, a difference is reported as a mismatch.
+
+The implementations are timed alternately for several repetitions and the medians are reported, a
+single run is too noisy to compare. Most of the selection cost is the span opened at every call,
+which both implementations share, so the gain of the transition table is small per turn. The
+decisions are repeated on the same prefixes, so the actions parsed by the compiled graph are served
+from its cache after the first iteration, which makes the termination gain an upper bound.
+
+Usage:
+    python benchmarks/state_flow_selection.py --iterations 2000 --repetitions 7 --verify-rounds 4 --output selection.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import platform
+import argparse
+import statistics
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from semantic_kernel.agents import Agent  # pylint: disable=wrong-import-position
+from semantic_kernel.contents.chat_message_content import ChatMessageContent  # pylint: disable=wrong-import-position
+from semantic_kernel.contents.utils.author_role import AuthorRole  # pylint: disable=wrong-import-position
+from semantic_kernel.contents.utils.finish_reason import FinishReason  # pylint: disable=wrong-import-position
+from src.agents.observe import AgentObserve  # pylint: disable=wrong-import-position
+from src.agents.select import AgentSelect  # pylint: disable=wrong-import-position
+from src.agents.verify import AgentVerify  # pylint: disable=wrong-import-position
+from src.agents.error import AgentError  # pylint: disable=wrong-import-position
+from src.agents.execute import AgentExecute  # pylint: disable=wrong-import-position
+from src.groupchat import state_flow_chat  # pylint: disable=wrong-import-position
+from src.groupchat.state_graph import parse_action  # pylint: disable=wrong-import-position
+from src.groupchat.state_flow_selection_strategy import StateFlowSelectionStrategy  # pylint: disable=wrong-import-position
+from src.groupchat.state_flow_termination_strategy import StateFlowTerminationStrategy  # pylint: disable=wrong-import-position
+from src.logging.metrics import state_flow_metrics  # pylint: disable=wrong-import-position
+from src.utils.constants import Constants  # pylint: disable=wrong-import-position
+from fakes import FakeChatCompletion  # pylint: disable=wrong-import-position
+from state_flow_orchestration import run_conversation  # pylint: disable=wrong-import-position
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class LegacyStateFlowSelectionStrategy(StateFlowSelectionStrategy):
+    """The if/elif chain the selection strategy used before the compiled state graph."""
+
+    def _select_next(self, agents: list[Agent], history: list[ChatMessageContent]) -> Agent:
+        last_message = history[-1].content
+        last_speaker = history[-1].name
+
+        if history[-1].role.value == AuthorRole.USER:
+            return [agent for agent in agents if agent.name == AgentObserve.name][0]
+        if last_speaker != AgentExecute.name:
+            return [agent for agent in agents if agent.name == AgentExecute.name][0]
+        if last_message is None or Constants.sql_error_message in last_message:
+            return [agent for agent in agents if agent.name == AgentError.name][0]
+
+        last_action = history[-2].content.split(Constants.action_identifier)[-1].strip()
+        last_action = last_action.replace("\n", "")
+        last_state = history[-2].name
+
+        if last_state == AgentObserve.name: # pylint: disable=no-else-return
+            return [agent for agent in agents if agent.name == AgentSelect.name][0]
+        elif last_state in (AgentSelect.name, AgentVerify.name, AgentError.name):
+            if Constants.execute_select in last_action:
+                return [agent for agent in agents if agent.name == AgentVerify.name][0]
+            return [agent for agent in agents if agent.name == AgentSelect.name][0]
+        else:
+            raise ValueError(f"Unknown state in state flow: {last_state}")
+
+
+class LegacyStateFlowTerminationStrategy(StateFlowTerminationStrategy): # pylint: disable=abstract-method
+    """The termination strategy before the compiled state graph, re-parsing the last action."""
+
+    async def should_terminate(self, agent: Agent, history: list[ChatMessageContent]) -> bool:
+        logger.info("Evaluating termination criteria for %s", agent.id)
+        if not history:
+            return False
+        if len(history) >= self.maximum_iterations:
+            history[-1].finish_reason = FinishReason.LENGTH
+            state_flow_metrics.record_termination(len(history), "max_iterations")
+            return True
+        if history[-1].content == Constants.terminate_text:
+            history[-1].finish_reason = FinishReason.STOP
+            state_flow_metrics.record_termination(len(history), "terminate")
+            return True
+        if len(history) >= 2:
+            last_action = history[-2].content.split(Constants.action_identifier)[-1].strip()
+            last_action = last_action.replace("\n", "")
+            last_state = history[-2].name
+            if last_state in (AgentSelect.name, AgentVerify.name) and Constants.action_submit in last_action:
+                history[-1].finish_reason = FinishReason.STOP
+                state_flow_metrics.record_termination(len(history), "submit")
+                return True
+        if self.agents and not any(a.id == agent.id for a in self.agents):
+            logger.info("Agent %s is out of scope", agent.id)
+            return False
+        return False
+
+
+async def measure(selection_strategy, termination_strategy, agents, prefixes, iterations: int) -> dict:
+    """Per-turn cost of a selection and of a termination decision, in microseconds"""
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        for prefix in prefixes:
+            await selection_strategy.next(agents, prefix)
+    selection_us = (time.perf_counter() - started_at) * 1e6 / (iterations * len(prefixes))
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        for prefix in prefixes:
+            await termination_strategy.should_terminate(agents[-1], prefix)
+    termination_us = (time.perf_counter() - started_at) * 1e6 / (iterations * len(prefixes))
+    return {"selection_us": selection_us, "termination_us": termination_us, "turn_us": selection_us + termination_us}
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    """Runs a conversation with the fake LLM, then times both implementations on its prefixes"""
+    with patch.object(state_flow_chat, "_create_chat_completion", FakeChatCompletion.get_factory(0.0, args.verify_rounds)):
+        state_flow_chat.get_shared_kernel.cache_clear()
+        state_flow_chat.get_state_flow_agents.cache_clear()
+        chat, _ = await run_conversation()
+    agents = chat.agents
+    history = chat.history.messages
+    prefixes = [history[:length] for length in range(1, len(history) + 1)]
+
+    legacy = (LegacyStateFlowSelectionStrategy(), LegacyStateFlowTerminationStrategy())
+    compiled = (StateFlowSelectionStrategy(), StateFlowTerminationStrategy())
+    mismatches = 0
+    for prefix in prefixes:
+        decisions = []
+        for selection_strategy, termination_strategy in (legacy, compiled):
+            decisions.append((
+                (await selection_strategy.next(agents, prefix)).name,
+                await termination_strategy.should_terminate(agents[-1], prefix),
+            ))
+        mismatches += decisions[0] != decisions[1]
+
+    samples = {"legacy": [], "compiled": []}
+    for _ in range(args.repetitions):
+        samples["legacy"].append(await measure(*legacy, agents, prefixes, args.iterations))
+        parse_action.cache_clear()
+        samples["compiled"].append(await measure(*compiled, agents, prefixes, args.iterations))
+    results = {"messages": len(history), "mismatches": mismatches}
+    for name, measures in samples.items():
+        results[name] = {
+            f"{key}_median": statistics.median(measure[key] for measure in measures) for key in measures[0]
+        }
+        results[name].update({
+            f"{key}_min": min(measure[key] for measure in measures) for key in measures[0]
+        })
+    results["speedup_median"] = {
+        key: statistics.median(
+            legacy_measure[key] / compiled_measure[key]
+            for legacy_measure, compiled_measure in zip(samples["legacy"], samples["compiled"])
+        )
+        for key in samples["legacy"][0]
+    }
+    results["samples"] = samples
+    state_flow_chat.get_shared_kernel.cache_clear()
+    state_flow_chat.get_state_flow_agents.cache_clear()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="Repetitions of the decisions on every prefix")
+    parser.add_argument("--repetitions", type=int, default=7, help="Timings of each implementation, the medians are reported")
+    parser.add_argument("--verify-rounds", type=int, default=4, help="Queries re-run by the verify agent, sets the conversation length")
+    parser.add_argument("--output", default="state_flow_selection.json")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = {
+        "benchmark": "state_flow_selection",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": asyncio.run(run_benchmark(args)),
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(json.dumps({key: value for key, value in results["results"].items() if key != "samples"}, indent=2))
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,115 +1,259 @@
 import os
 import sys
 import json
+import time
+import random
 import asyncio
+import argparse
+import contextlib
 from uuid import uuid4
 from dotenv import load_dotenv
+from openai import RateLimitError
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
 from semantic_kernel.contents.utils.author_role import AuthorRole
-from exp_src.model.batch_output import BatchOutput, AgentInvokingTrajectory, AgentInvokingData
+from exp_src.model.batch_output import BatchOutput, AgentInvokingTrajectory, AgentInvokingData, ConversationMessages
+from exp_src.persistence.batch_output_writer import BatchOutputWriter
+from exp_src.persistence.batch_columnar_writer import BatchColumnarWriter, get_step
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
 load_dotenv(override=True)
 
 # The following imports having dependencies on the environment variables
 from src.mysql.execution_env import SqlEnv
-from src.groupchat.state_flow_chat import get_chat_client
+from src.mysql.execution_env_pool import SqlEnvPool
+from src.groupchat.state_flow_chat import get_chat_client, get_shared_kernel
+from src.agents.thought_action import ThoughtActionParser
+from src.cache.completion_cache import COMPLETION_CACHE_MODES, CachedChatCompletion, CompletionCache
 
-sql_executor_env = SqlEnv.get_sql_executor_env_from_environment()
 
-async def main(batch_jsonl_input_file: str, batch_output_path: str, experiment_name: str):
-    thread_id = str(uuid4())
-    input_data = []
+class RateLimitCoolDown:
+    """Cool-down shared by all workers once Azure OpenAI answers 429 Too Many Requests"""
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 2.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.resume_at = 0.0
+
+    @staticmethod
+    def get_rate_limit_error(err: BaseException) -> RateLimitError | None:
+        # Semantic Kernel wraps the OpenAI error into its own exceptions
+        while err is not None:
+            if isinstance(err, RateLimitError):
+                return err
+            err = err.__cause__ or err.__context__
+        return None
+
+    def trip(self, err: RateLimitError, attempt: int) -> float:
+        retry_after = err.response.headers.get("retry-after") if err.response is not None else None
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay *= 1 + random.random() * 0.25
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+        return delay
+
+    async def wait(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def run_conversation(sql_executor_env: SqlEnv, index: int, input_query: str, experiment_name: str, thread_id: str,
+                           sql_executor_env_pool: SqlEnvPool | None = None):
+    parent_id = str(uuid4())
     output_data = []
-    agent_invoking_trajectory = []
-    all_roles = set()
-    with open(batch_jsonl_input_file, "r") as f:
-        for line in f:
-            input_data.append(json.loads(line))
-    print(f"Loaded {len(input_data)} input data from {batch_jsonl_input_file}")
-    try:
-        index = 0
-        for data in input_data:
-            parent_id = str(uuid4())
-            agent_selections = []
-            chat = get_chat_client(sql_executor_env)
-            input_query = data["input"]
-            final_output = ""
-            print(f"{index} - Query # {AuthorRole.USER}: '{input_query}'", end=" .... ")
-
-            query_with_init_thought = sql_executor_env.attach_init_observation(
-                input_query
-            )
-            await chat.add_chat_message(
-                ChatMessageContent(
-                    role=AuthorRole.USER, content=query_with_init_thought
-                )
+    agent_selections = []
+    steps = []
+    chat = get_chat_client(sql_executor_env, sql_executor_env_pool)
+    final_output = ""
+
+    query_with_init_thought = await sql_executor_env.attach_init_observation_async(
+        input_query
+    )
+    await chat.add_chat_message(
+        ChatMessageContent(
+            role=AuthorRole.USER, content=query_with_init_thought
+        )
+    )
+    # The records keep an offset into the shared messages instead of a copy of the history
+    messages = ConversationMessages()
+    history_offset = messages.append(f"{AuthorRole.USER.upper()} - user: {query_with_init_thought}")
+
+    step_started_at = time.perf_counter()
+    async for content in chat.invoke():
+        steps.append({
+            "experiment": experiment_name,
+            "thread_id": thread_id,
+            "parent_id": parent_id,
+            "input_index": index,
+            "input": input_query,
+            **get_step(content, len(steps), (time.perf_counter() - step_started_at) * 1000),
+        })
+        step_started_at = time.perf_counter()
+        output = f"{content.role.upper()} - {content.name or '*'}: {content.content}"
+        output_data.append(
+            BatchOutput(
+                experiment=experiment_name,
+                role = content.name,
+                name = content.name,
+                threadId = thread_id,
+                parentId = parent_id,
+                input = input_query,
+                output = output,
+                conversation_history = None,
+                messages = messages,
+                history_offset = history_offset
             )
-            conversation_history = f"{AuthorRole.USER.upper()} - user: {query_with_init_thought}\n"
-
-            async for content in chat.invoke():
-                output = f"{content.role.upper()} - {content.name or '*'}: {content.content}"
-                output_data.append(
-                    BatchOutput(
-                        experiment=experiment_name,
-                        role = content.name,
-                        name = content.name,
-                        threadId = thread_id,
-                        parentId = parent_id,
-                        input = input_query,
-                        output = output,
-                        conversation_history = conversation_history
-                    )
-                )
-                all_roles.add(content.name)
-                agent_selections.append(
-                    AgentInvokingData(
-                        name=content.name,
-                        conversation_history=conversation_history
-                    )
-                )
-                conversation_history += f"{output}\n"
-                final_output = str(content.content)
-            agent_invoking_trajectory.append(
-                AgentInvokingTrajectory(
-                    experiment=experiment_name,
-                    threadId=thread_id,
-                    input=input_query,
-                    final_output=final_output,
-                    agent_selections=agent_selections
-                )
+        )
+        agent_selections.append(
+            AgentInvokingData(
+                name=content.name,
+                conversation_history=None,
+                messages=messages,
+                history_offset=history_offset
             )
-            print("done.")
-            index += 1
-    finally:
-        for role in all_roles:
-            output_file = os.path.join(batch_output_path, f"{role.lower()}.jsonl")
-            with open(output_file, "w") as f:
-                for output in output_data:
-                    if output.role == role:
-                        f.write(json.dumps(output.to_dict_without_role()) + "\n")
-            print(f"Output data for {role} saved to {output_file}")
-        if len(agent_invoking_trajectory) > 0:
-            output_file = os.path.join(batch_output_path, "all_agents.jsonl")
-            with open(output_file, "w") as f:
-                for trajectory in agent_invoking_trajectory:
-                    f.write(json.dumps(trajectory.to_dict()) + "\n")
-                    # If we want to flatten the agent selections into multiple lines
-                    # for item in trajectory.to_flattened_dict():
-                    #     f.write(json.dumps(item) + "\n")
-            print(f"Agent invoking trajectory saved to {output_file}")
+        )
+        history_offset = messages.append(output)
+        final_output = str(content.content)
+    trajectory = AgentInvokingTrajectory(
+        experiment=experiment_name,
+        threadId=thread_id,
+        input=input_query,
+        final_output=final_output,
+        agent_selections=agent_selections,
+        messages=messages,
+        parentId=parent_id
+    )
+    return output_data, trajectory, steps
+
+
+async def run_query(index: int, input_query: str, sql_executor_env_pool: SqlEnvPool,
+                    cool_down: RateLimitCoolDown, experiment_name: str, thread_id: str):
+    for attempt in range(cool_down.max_retries + 1):
+        await cool_down.wait()
+        try:
+            async with sql_executor_env_pool.lease() as sql_executor_env:
+                return await run_conversation(sql_executor_env, index, input_query, experiment_name, thread_id,
+                                              sql_executor_env_pool)
+        except Exception as err:
+            rate_limit_error = cool_down.get_rate_limit_error(err)
+            if rate_limit_error is None or attempt == cool_down.max_retries:
+                raise
+            delay = cool_down.trip(rate_limit_error, attempt)
+            print(f"{index} - Rate limited, retrying in {delay:.1f} seconds")
+
+
+async def main(batch_jsonl_input_file: str, batch_output_path: str, experiment_name: str,
+               concurrency: int = 1, resume: bool = False, history_format: str = "value", columnar: bool = False):
+    thread_id = str(uuid4())
+    with open(batch_jsonl_input_file, "r") as f:
+        input_count = sum(1 for _ in f)
+    print(f"Loaded {input_count} input data from {batch_jsonl_input_file}")
+
+    # Each worker leases its own SqlEnv, finished conversations wait in `completed` until
+    # all previous ones are written so the output files keep the input order
+    # (the position counts only the questions that are run, not the ones skipped on resume)
+    # With candidate SQL commands the pool also holds a session per candidate, so they run concurrently
+    sql_candidates = ThoughtActionParser.get_sql_candidates_from_environment()
+    sql_executor_env_pool = SqlEnvPool.get_sql_executor_env_pool_from_environment(
+        max_size=concurrency * (1 + sql_candidates) if sql_candidates > 1 else concurrency
+    )
+    cool_down = RateLimitCoolDown()
+    completed = {}
+    next_position = 0
+    pending = asyncio.Queue(maxsize=concurrency)
+
+    # The columnar parts are completed at the checkpoints of the output writer, which closes first
+    with (BatchColumnarWriter(batch_output_path) if columnar else contextlib.nullcontext()) as columnar_writer, \
+            BatchOutputWriter(batch_output_path, resume=resume, history_format=history_format,
+                              columnar_writer=columnar_writer) as writer:
+        async def read_input():
+            occurrences = {}
+            position = 0
+            input_count = 0
+            with open(batch_jsonl_input_file, "r") as f:
+                for index, line in enumerate(f):
+                    input_count += 1
+                    occurrence = occurrences.get(line.strip(), 0)
+                    occurrences[line.strip()] = occurrence + 1
+                    key = writer.get_input_key(line, occurrence)
+                    if writer.is_completed(key):
+                        continue
+                    await pending.put((position, index, key, json.loads(line)["input"]))
+                    position += 1
+            if resume:
+                print(f"Resuming with {position} of {input_count} questions left")
+            for _ in range(concurrency):
+                await pending.put(None)
+
+        async def worker():
+            nonlocal next_position
+            while (item := await pending.get()) is not None:
+                position, index, key, input_query = item
+                completed[position] = (*await run_query(
+                    index, input_query, sql_executor_env_pool, cool_down, experiment_name, thread_id
+                ), key)
+                print(f"{index} - Query # {AuthorRole.USER}: '{input_query}' .... done.")
+                while next_position in completed:
+                    output_data, trajectory, steps, key = completed.pop(next_position)
+                    writer.write_conversation(output_data, trajectory, key, steps)
+                    next_position += 1
+
+        tasks = [asyncio.ensure_future(read_input())]
+        tasks += [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            sql_executor_env_pool.close()
+    print_completion_cache_stats()
+
+
+def positive_int(value: str) -> int:
+    """Argument type of the counts that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not at least 1")
+    return number
+
+
+def print_completion_cache_stats():
+    """Prints the hits and misses of the completion cache, if the LLM completions were recorded or replayed"""
+    for service in get_shared_kernel().services.values():
+        if isinstance(service, CachedChatCompletion):
+            cache = service.cache
+            print(f"Completion cache ({cache.mode}, {cache.path}): "
+                  f"{cache.recorded} recorded, {cache.hits} replayed, {cache.misses} missing")
+            return
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        raise ValueError(
-            "Please provide a JSONL file with the input data and output path, usage: python app_experiment_batch.py <input_data_file> <output_path> <experiment_name>"
-        )
-    batch_jsonl_input_file = sys.argv[1]
-    batch_output_path = sys.argv[2]
-    experiment_name = sys.argv[3]
-    if not os.path.exists(batch_jsonl_input_file):
-        raise FileNotFoundError(f"Input data file {batch_jsonl_input_file} not found")
-    if not os.path.exists(batch_output_path):
-        os.makedirs(batch_output_path)
-    asyncio.run(main(batch_jsonl_input_file, batch_output_path, experiment_name))
+    parser = argparse.ArgumentParser(
+        description="Runs the state flow agents on a JSONL file of questions and saves the outputs per agent."
+    )
+    parser.add_argument("input_data_file", help="JSONL file with one {\"input\": <question>} per line")
+    parser.add_argument("output_path", help="Directory of the output JSONL files")
+    parser.add_argument("experiment_name", help="Name of the experiment recorded in the outputs")
+    parser.add_argument("--concurrency", type=positive_int, default=1, help="Number of conversations run at once")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the questions completed by a previous run and append to its outputs")
+    parser.add_argument("--history-format", choices=["value", "reference"], default="value",
+                        help="Store the conversation history in every record (value) or once per conversation (reference)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Also write one row per agent step to a Parquet file (requires pyarrow)")
+    parser.add_argument("--completion-cache", choices=COMPLETION_CACHE_MODES, default=None,
+                        help="Record the LLM completions to COMPLETION_CACHE_PATH, or replay them without calling the LLM "
+                             "(defaults to COMPLETION_CACHE_MODE)")
+    args = parser.parse_args()
+    if args.completion_cache is not None:
+        CompletionCache.CACHE_CONFIG["mode"] = args.completion_cache
+    if not os.path.exists(args.input_data_file):
+        raise FileNotFoundError(f"Input data file {args.input_data_file} not found")
+    if not os.path.exists(args.output_path):
+        os.makedirs(args.output_path)
+    asyncio.run(main(args.input_data_file, args.output_path, args.experiment_name, args.concurrency,
+                     args.resume, args.history_format, args.columnar))
@@ -1,21 +1,57 @@
+import sys
 from uuid import uuid4
 
 
+def _intern(value: str | None) -> str | None:
+    # The experiment, thread, question and agent names repeat in every record of a run
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class ConversationMessages:
+    """
+    The messages of one conversation, shared by all of its records. A record keeps the number of
+    messages that preceded it and its conversation history is only materialized when needed.
+    """
+    __slots__ = ("messages",)
+
+    def __init__(self, messages: list[str] | None = None):
+        self.messages = messages if messages is not None else []
+
+    def append(self, message: str) -> int:
+        self.messages.append(message)
+        return len(self.messages)
+
+    def get_history(self, offset: int) -> str:
+        return "".join(f"{message}\n" for message in self.messages[:offset])
+
+
 class BatchOutput:
+    __slots__ = ("id", "role", "name", "threadId", "parentId", "input", "output",
+                 "_conversation_history", "messages", "history_offset", "experiment")
+
     def __init__(self, role: str, name: str, threadId: str, parentId: str,
-                 input: str, output: str, conversation_history: str, experiment: str):
+                 input: str, output: str, conversation_history: str | None, experiment: str,
+                 messages: ConversationMessages | None = None, history_offset: int = 0):
         self.id = str(uuid4())
-        self.role = role
-        self.name = name
-        self.threadId = threadId
+        self.role = _intern(role)
+        self.name = _intern(name)
+        self.threadId = _intern(threadId)
         self.parentId = parentId
-        self.input = input
+        self.input = _intern(input)
         self.output = output
-        self.conversation_history = conversation_history
-        self.experiment = experiment
+        self._conversation_history = conversation_history
+        self.messages = messages
+        self.history_offset = history_offset
+        self.experiment = _intern(experiment)
 
-    def to_dict_without_role(self):
-        return {
+    @property
+    def conversation_history(self) -> str:
+        if self._conversation_history is None:
+            return self.messages.get_history(self.history_offset)
+        return self._conversation_history
+
+    def to_dict_without_role(self, history_format: str = "value"):
+        data = {
             "experiment": self.experiment,
             "id": self.id,
             "name": self.name,
@@ -23,40 +59,97 @@ class BatchOutput:
             "parentId": self.parentId,
             "input": self.input,
             "output": self.output,
-            "conversation_history": self.conversation_history
         }
+        if history_format == "reference":
+            # The messages are stored once in the trajectory with the same parentId
+            data["conversation_history_offset"] = self.history_offset
+        else:
+            data["conversation_history"] = self.conversation_history
+        return data
 
 class AgentInvokingData:
-    def __init__(self, name: str, conversation_history: str):
-        self.name = name
-        self.conversation_history = conversation_history
-    
-    def to_dict(self):
+    __slots__ = ("name", "_conversation_history", "messages", "history_offset")
+
+    def __init__(self, name: str, conversation_history: str | None,
+                 messages: ConversationMessages | None = None, history_offset: int = 0):
+        self.name = _intern(name)
+        self._conversation_history = conversation_history
+        self.messages = messages
+        self.history_offset = history_offset
+
+    @property
+    def conversation_history(self) -> str:
+        if self._conversation_history is None:
+            return self.messages.get_history(self.history_offset)
+        return self._conversation_history
+
+    def to_dict(self, history_format: str = "value"):
+        if history_format == "reference":
+            return {
+                "name": self.name,
+                "conversation_history_offset": self.history_offset
+            }
         return {
             "name": self.name,
             "conversation_history": self.conversation_history
         }
 
 class AgentInvokingTrajectory:
+    __slots__ = ("id", "agent_selections", "experiment", "threadId", "input", "final_output",
+                 "messages", "parentId")
+
     def __init__(self, experiment: str, threadId: str, input: str, final_output: str,
-                 agent_selections: list[AgentInvokingData]):
+                 agent_selections: list[AgentInvokingData],
+                 messages: ConversationMessages | None = None, parentId: str | None = None):
+        self.id = str(uuid4())
         self.agent_selections = agent_selections
-        self.experiment = experiment
-        self.threadId = threadId
-        self.input = input
+        self.experiment = _intern(experiment)
+        self.threadId = _intern(threadId)
+        self.input = _intern(input)
         self.final_output = final_output
-        self.id = str(uuid4())
+        self.messages = messages
+        self.parentId = parentId
 
-    def to_dict(self):
-        return {
+    def to_dict(self, history_format: str = "value"):
+        data = {
             "experiment": self.experiment,
             "id": self.id,
             "threadId": self.threadId,
             "input": self.input,
             "final_output": self.final_output,
-            "agent_selections": [agent.to_dict() for agent in self.agent_selections]
         }
-    
+        if history_format == "reference":
+            data["parentId"] = self.parentId
+            data["messages"] = self.messages.messages
+        data["agent_selections"] = [agent.to_dict(history_format) for agent in self.agent_selections]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AgentInvokingTrajectory":
+        """
+        Load a trajectory saved in either history format.
+        """
+        messages = ConversationMessages(data["messages"]) if "messages" in data else None
+        trajectory = cls(
+            experiment=data["experiment"],
+            threadId=data["threadId"],
+            input=data["input"],
+            final_output=data["final_output"],
+            agent_selections=[
+                AgentInvokingData(
+                    name=agent["name"],
+                    conversation_history=agent.get("conversation_history"),
+                    messages=messages,
+                    history_offset=agent.get("conversation_history_offset", 0)
+                )
+                for agent in data["agent_selections"]
+            ],
+            messages=messages,
+            parentId=data.get("parentId")
+        )
+        trajectory.id = data["id"]
+        return trajectory
+
     def to_flattened_dict(self) -> list[dict]:
         """
         Flatten the agent selection data to a list of dictionaries. Which can be used for easy evaluation in Azure AI Foundry.
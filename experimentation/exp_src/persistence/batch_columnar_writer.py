@@ -0,0 +1,158 @@
+import os
+import re
+
+STEP_COLUMNS = {
+    "experiment": "string",
+    "thread_id": "string",
+    "parent_id": "string",
+    "input_index": "int64",
+    "input": "string",
+    "step_index": "int32",
+    "role": "string",
+    "author_role": "string",
+    "latency_ms": "float64",
+    "prompt_tokens": "int64",
+    "completion_tokens": "int64",
+    "sql": "string",
+    "observation": "string",
+    "finish_reason": "string",
+    "output": "string",
+}
+
+
+def get_step(content, step_index: int, latency_ms: float) -> dict:
+    """The columns of one agent step, parsed from the message the agent produced"""
+    text = str(content.content)
+    usage = content.metadata.get("usage") if content.metadata else None
+    sql = re.search(r"execute\[(.*)\]", text, re.DOTALL)
+    finish_reason = getattr(content, "finish_reason", None)
+    return {
+        "step_index": step_index,
+        "role": content.name,
+        "author_role": str(content.role.value if hasattr(content.role, "value") else content.role),
+        "latency_ms": latency_ms,
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "sql": sql.group(1) if sql else None,
+        "observation": text.split("Observation: ", 1)[1] if text.startswith("Observation: ") else None,
+        "finish_reason": str(getattr(finish_reason, "value", finish_reason)) if finish_reason else None,
+        "output": text,
+    }
+
+
+class BatchColumnarWriter:
+    """
+    Writes one row per agent step to Parquet files so the analysis can load only the columns
+    and row groups it filters on. The rows are buffered and written one row group at a time.
+    A part is written under a temporary name and renamed to `steps.part-<n>.parquet` at every
+    checkpoint of the BatchOutputWriter, which records the part in its manifest. The parts and
+    temporary files not in the manifest hold questions that are run again, and are dropped when
+    the writer is reset by a new or resumed run. When the run ends, the parts are compacted into
+    a single part with full row groups, so the size of the files does not follow the checkpoints.
+    """
+    file_prefix = "steps.part-"
+
+    def __init__(self, batch_output_path: str, row_group_size: int = 10_000) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as err:
+            raise ImportError("The columnar output requires pyarrow, install it with `pip install pyarrow`") from err
+        self.pa = pa
+        self.pq = pq
+        self.batch_output_path = batch_output_path
+        self.schema = pa.schema([(name, getattr(pa, dtype)()) for name, dtype in STEP_COLUMNS.items()])
+        self.row_group_size = row_group_size
+        self.columns: dict[str, list] = {name: [] for name in STEP_COLUMNS}
+        self.path: str | None = None
+        self.writer = None
+
+    @classmethod
+    def drop_uncommitted_parts(cls, batch_output_path: str, committed_parts: list[str]) -> list[str]:
+        """Removes the parts missing from the manifest and the temporary files, returns the removed names"""
+        dropped = []
+        for file_name in sorted(os.listdir(batch_output_path)):
+            if file_name.startswith(cls.file_prefix) and (file_name.endswith(".tmp") or file_name not in committed_parts):
+                os.remove(os.path.join(batch_output_path, file_name))
+                dropped.append(file_name)
+        return dropped
+
+    def reset(self, committed_parts: list[str]) -> None:
+        dropped = self.drop_uncommitted_parts(self.batch_output_path, committed_parts)
+        if dropped:
+            print(f"Dropped the columnar parts written after the last checkpoint: {', '.join(dropped)}")
+
+    def write_steps(self, steps: list[dict]) -> None:
+        for step in steps:
+            for name, values in self.columns.items():
+                values.append(step.get(name))
+        if len(self.columns["step_index"]) >= self.row_group_size:
+            self.flush()
+
+    def _get_part_path(self) -> str:
+        part = 0
+        while os.path.exists(os.path.join(self.batch_output_path, f"{self.file_prefix}{part}.parquet")):
+            part += 1
+        return os.path.join(self.batch_output_path, f"{self.file_prefix}{part}.parquet")
+
+    def flush(self) -> None:
+        if self.columns["step_index"]:
+            if self.writer is None:
+                self.path = self._get_part_path()
+                self.writer = self.pq.ParquetWriter(f"{self.path}.tmp", self.schema, compression="zstd")
+            self.writer.write_table(self.pa.Table.from_pydict(self.columns, schema=self.schema))
+            self.columns = {name: [] for name in STEP_COLUMNS}
+
+    def checkpoint(self) -> list[str]:
+        """Completes the current part, returns its file name to record in the manifest"""
+        self.flush()
+        if self.writer is None:
+            return []
+        self.writer.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        self.writer = None
+        return [os.path.basename(self.path)]
+
+    def compact(self, parts: list[str]) -> list[str]:
+        """
+        Rewrites the completed parts into a new part of full row groups, returns the parts to record
+        in the manifest in their place. The replaced parts are removed once the manifest no longer
+        lists them, with `remove_parts`.
+        """
+        if len(parts) <= 1:
+            return parts
+        path = self._get_part_path()
+        pending = []
+        pending_rows = 0
+        with self.pq.ParquetWriter(f"{path}.tmp", self.schema, compression="zstd") as writer:
+            for part in parts:
+                table = self.pq.read_table(os.path.join(self.batch_output_path, part), schema=self.schema)
+                pending.append(table)
+                pending_rows += table.num_rows
+                if pending_rows >= self.row_group_size:
+                    table = self.pa.concat_tables(pending)
+                    full_rows = pending_rows - pending_rows % self.row_group_size
+                    writer.write_table(table.slice(0, full_rows), row_group_size=self.row_group_size)
+                    pending = [table.slice(full_rows)]
+                    pending_rows -= full_rows
+            if pending_rows:
+                writer.write_table(self.pa.concat_tables(pending), row_group_size=self.row_group_size)
+        os.replace(f"{path}.tmp", path)
+        return [os.path.basename(path)]
+
+    def remove_parts(self, parts: list[str]) -> None:
+        for part in parts:
+            os.remove(os.path.join(self.batch_output_path, part))
+
+    def close(self) -> None:
+        # The parts were completed by the checkpoints, rows written since the last one are dropped on resume
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        print(f"Columnar output saved to {os.path.join(self.batch_output_path, self.file_prefix)}*.parquet")
+
+    def __enter__(self) -> "BatchColumnarWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+from typing import TextIO
+from exp_src.model.batch_output import BatchOutput, AgentInvokingTrajectory
+from exp_src.persistence.batch_columnar_writer import BatchColumnarWriter
+
+
+class BatchOutputWriter:
+    """
+    Appends the batch outputs to the per-role files and all_agents.jsonl as they are produced.
+    At every checkpoint the files are synced to disk and the checkpoint manifest records the
+    finished questions together with the size of every file and the columnar parts completed
+    since the previous checkpoint, so a resumed run skips them and drops whatever was written
+    after the last checkpoint. When the run ends, the columnar parts are compacted and a last line
+    replaces them with the compacted part.
+    """
+    trajectory_file_name = "all_agents.jsonl"
+    manifest_file_name = "checkpoint_manifest.jsonl"
+
+    def __init__(self, batch_output_path: str, checkpoint_interval: int = 10,
+                 buffer_size: int = 64 * 1024, resume: bool = False, history_format: str = "value",
+                 columnar_writer: BatchColumnarWriter | None = None) -> None:
+        self.batch_output_path = batch_output_path
+        self.checkpoint_interval = checkpoint_interval
+        self.buffer_size = buffer_size
+        self.resume = resume
+        self.history_format = history_format
+        self.columnar_writer = columnar_writer
+        self.files: dict[str, TextIO] = {}
+        self.conversation_count = 0
+        self.completed_keys: set[str] = set()
+        self.checkpointed_sizes: dict[str, int] = {}
+        self.pending_keys: list[str] = []
+        self.committed_parts: list[str] = []
+        manifest_path = os.path.join(batch_output_path, self.manifest_file_name)
+        if resume and os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                for line in f:
+                    try:
+                        checkpoint = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line is incomplete if the run died while writing it
+                        break
+                    self.completed_keys.update(checkpoint["completed"])
+                    self.checkpointed_sizes = checkpoint["sizes"]
+                    replaced_parts = checkpoint.get("replaced_parts", [])
+                    self.committed_parts = [part for part in self.committed_parts if part not in replaced_parts]
+                    self.committed_parts.extend(checkpoint.get("parts", []))
+        self.manifest = open(manifest_path, "a" if resume else "w")
+        for file_name in self.checkpointed_sizes:
+            self._get_file(file_name)
+        if columnar_writer is not None:
+            columnar_writer.reset(self.committed_parts)
+
+    @staticmethod
+    def get_input_key(line: str, occurrence: int = 0) -> str:
+        # Repeated questions get their own keys by counting the previous occurrences
+        return f"{hashlib.sha256(line.strip().encode('utf-8')).hexdigest()}-{occurrence}"
+
+    def is_completed(self, key: str) -> bool:
+        return key in self.completed_keys
+
+    def _get_file(self, file_name: str) -> TextIO:
+        if file_name not in self.files:
+            path = os.path.join(self.batch_output_path, file_name)
+            if self.resume:
+                # Drop the records written after the last checkpoint, their questions are run again
+                if os.path.exists(path):
+                    os.truncate(path, self.checkpointed_sizes.get(file_name, 0))
+                self.files[file_name] = open(path, "a", buffering=self.buffer_size)
+            else:
+                self.files[file_name] = open(path, "w", buffering=self.buffer_size)
+        return self.files[file_name]
+
+    def write_output(self, output: BatchOutput) -> None:
+        self._get_file(f"{output.role.lower()}.jsonl").write(json.dumps(output.to_dict_without_role(self.history_format)) + "\n")
+
+    def write_trajectory(self, trajectory: AgentInvokingTrajectory) -> None:
+        self._get_file(self.trajectory_file_name).write(json.dumps(trajectory.to_dict(self.history_format)) + "\n")
+        # If we want to flatten the agent selections into multiple lines
+        # for item in trajectory.to_flattened_dict():
+        #     f.write(json.dumps(item) + "\n")
+
+    def write_conversation(self, output_data: list[BatchOutput], trajectory: AgentInvokingTrajectory,
+                           key: str | None = None, steps: list[dict] | None = None) -> None:
+        for output in output_data:
+            self.write_output(output)
+        self.write_trajectory(trajectory)
+        if self.columnar_writer is not None and steps is not None:
+            self.columnar_writer.write_steps(steps)
+        if key is not None:
+            self.pending_keys.append(key)
+        self.conversation_count += 1
+        if self.conversation_count % self.checkpoint_interval == 0:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        # The outputs are on disk before the manifest marks their questions as completed
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self.checkpointed_sizes = {**self.checkpointed_sizes, **{name: f.tell() for name, f in self.files.items()}}
+        parts = self.columnar_writer.checkpoint() if self.columnar_writer is not None else []
+        self._write_manifest({"completed": self.pending_keys, "sizes": self.checkpointed_sizes, "parts": parts})
+        self.committed_parts = self.committed_parts + parts
+        self.completed_keys.update(self.pending_keys)
+        self.pending_keys = []
+
+    def _write_manifest(self, checkpoint: dict) -> None:
+        self.manifest.write(json.dumps(checkpoint) + "\n")
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+
+    def compact_columnar_parts(self) -> None:
+        # The replaced parts are removed only once the manifest points to the compacted one,
+        # a run killed in between drops either the compacted part or the replaced ones on resume
+        parts = self.columnar_writer.compact(self.committed_parts)
+        if parts == self.committed_parts:
+            return
+        self._write_manifest({"completed": [], "sizes": self.checkpointed_sizes, "parts": parts,
+                              "replaced_parts": self.committed_parts})
+        self.columnar_writer.remove_parts(self.committed_parts)
+        self.committed_parts = parts
+
+    def close(self) -> None:
+        self.checkpoint()
+        if self.columnar_writer is not None:
+            self.compact_columnar_parts()
+        self.manifest.close()
+        for file_name, f in self.files.items():
+            f.close()
+            print(f"Output data saved to {os.path.join(self.batch_output_path, file_name)}")
+        self.files = {}
+
+    def __enter__(self) -> "BatchOutputWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
@@ -11,27 +11,12 @@ load_dotenv(override=True)
 sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
 
 from src.utils.constants import Constants
-from src.agents.select import AgentSelect
-from src.agents.observe import AgentObserve
-from src.agents.error import AgentError
-from src.agents.verify import AgentVerify
-from src.groupchat.state_flow_chat import _create_kernel_with_chat_completion
+from src.groupchat.state_flow_chat import get_state_flow_agents
 
 input_scanners = [BanTopics(Constants.sql_data_manipulation_commands, threshold=0.3)]
 query_file = "data/vulnerable_quires.jsonl"
 
-agent_observe = AgentObserve(
-    kernel=_create_kernel_with_chat_completion("observe")
-).get_agent()
-agent_error = AgentError(
-    kernel=_create_kernel_with_chat_completion("error")
-).get_agent()
-agent_verify = AgentVerify(
-    kernel=_create_kernel_with_chat_completion("verify")
-).get_agent()
-agent_select = AgentSelect(
-    kernel=_create_kernel_with_chat_completion("select")
-).get_agent()
+agent_observe, agent_error, agent_verify, agent_select = get_state_flow_agents()
 all_scores = {
     agent_observe.name: [],
     agent_error.name: [],
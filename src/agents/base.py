@@ -1,5 +1,7 @@
 """Base agent for chat completion within a state flow context."""
+import time
 import logging
+from typing import Any, Optional
 from collections.abc import AsyncIterable
 from semantic_kernel.kernel import Kernel
 from semantic_kernel.agents import ChatCompletionAgent
@@ -11,11 +13,103 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import (
 )
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import (
+    StreamingChatMessageContent,
+)
+from semantic_kernel.contents.utils.author_role import AuthorRole
 from semantic_kernel.exceptions import KernelServiceNotFoundError
+from opentelemetry import trace
+from opentelemetry.trace import Span, Status, StatusCode
+from src.utils.constants import Constants
+from src.agents.history_compaction import HistoryCompactor
+from src.agents.thought_action import ThoughtActionParser
+from src.logging.metrics import state_flow_metrics
+from src.logging.tracing import tracer, STATE_ATTRIBUTE, ITERATION_ATTRIBUTE
 
 logger: logging.Logger = logging.getLogger(__name__)
 
 
+class ActionBlockDetector:
+    """
+    Incrementally detects the end of the `Action: execute[...]` block in a streamed completion,
+    so the SQL can be handed to the executor as soon as the closing bracket arrives. A completion
+    with several candidate actions ends after the block of its last candidate.
+    """
+    marker = f"{Constants.action_identifier} execute["
+
+    def __init__(self, max_blocks: int = 1):
+        """
+        Initializes the detector with an empty text.
+
+        Args:
+            max_blocks (int): The number of action blocks the completion ends after.
+        """
+        self.text = ""
+        self.end: int | None = None
+        self._remaining_blocks = max_blocks
+        self._search_from = 0
+        self._position: int | None = None
+        self._depth = 1
+        self._quote: str | None = None
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Appends a streamed chunk and scans only the new characters.
+
+        Args:
+            chunk (str): The streamed text chunk.
+
+        Returns:
+            bool: True once the last action block is complete.
+        """
+        self.text += chunk
+        if self.end is not None:
+            return True
+        while True:
+            if self._position is None:
+                index = self.text.find(self.marker, self._search_from)
+                if index < 0:
+                    self._search_from = max(self._search_from, len(self.text) - len(self.marker) + 1)
+                    return False
+                self._position = index + len(self.marker)
+            if not self._scan_block():
+                return False
+            self._remaining_blocks -= 1
+            if self._remaining_blocks <= 0:
+                self.end = self._position
+                return True
+            self._search_from = self._position
+            self._position = None
+            self._depth = 1
+
+    def _scan_block(self) -> bool:
+        """Scans the new characters of the current block, returns True at its closing bracket"""
+        while self._position < len(self.text):
+            char = self.text[self._position]
+            self._position += 1
+            if self._quote is not None:
+                if char == self._quote:
+                    self._quote = None
+            elif char in "'\"`":
+                self._quote = char
+            elif char == "[":
+                self._depth += 1
+            elif char == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    return True
+        return False
+
+    def get_completed_text(self) -> str:
+        """
+        Returns the streamed text up to the end of the action block, or all of it if no block completed.
+
+        Returns:
+            str: The completed text.
+        """
+        return self.text if self.end is None else self.text[: self.end]
+
+
 class StateFlowBaseAgent(ChatCompletionAgent):
     """
     StateFlowBaseAgent is a specialized agent for handling chat completions
@@ -23,6 +117,10 @@ class StateFlowBaseAgent(ChatCompletionAgent):
     provides additional functionality for invoking chat completion services 
     and managing chat history.
     """
+    history_compactor: Optional[HistoryCompactor] = None
+    structured_output: bool = False
+    action_candidates: int = 1
+
     def __init__(
         self,
         service_id: str | None = None,
@@ -32,6 +130,9 @@ class StateFlowBaseAgent(ChatCompletionAgent):
         description: str | None = None,
         instructions: str | None = None,
         execution_settings: PromptExecutionSettings | None = None,
+        history_compactor: HistoryCompactor | None = None,
+        structured_output: bool = False,
+        action_candidates: int = 1,
     ):
         """
         Initializes the StateFlowBaseAgent with the given parameters.
@@ -44,7 +145,24 @@ class StateFlowBaseAgent(ChatCompletionAgent):
             description (str | None): A description of the agent.
             instructions (str | None): Instructions for the agent.
             execution_settings (PromptExecutionSettings | None): Settings for prompt execution.
+            history_compactor (HistoryCompactor | None): Keeps the prompt within a token budget, the whole history is sent if None.
+            structured_output (bool): Asks for a JSON object with the thought and the action instead of the text template.
+            action_candidates (int): Asks for up to this number of candidate actions in one completion.
         """
+        if action_candidates > 1:
+            instructions = f"{instructions or ''}{ThoughtActionParser.candidates_instructions.format(count=action_candidates)}"
+        if structured_output:
+            if action_candidates > 1:
+                instructions += ThoughtActionParser.structured_candidates_instructions
+                response_format = ThoughtActionParser.candidates_response_format
+            else:
+                instructions = f"{instructions or ''}{ThoughtActionParser.structured_output_instructions}"
+                response_format = ThoughtActionParser.response_format
+            if execution_settings is not None:
+                execution_settings = execution_settings.model_copy(update={"extension_data": {
+                    **execution_settings.extension_data,
+                    "response_format": response_format,
+                }})
         super().__init__(
             service_id=service_id,
             kernel=kernel,
@@ -54,21 +172,37 @@ class StateFlowBaseAgent(ChatCompletionAgent):
             instructions=instructions,
             execution_settings=execution_settings,
         )
+        self.history_compactor = history_compactor
+        self.structured_output = structured_output
+        self.action_candidates = action_candidates
 
-    async def invoke(self, history: ChatHistory) -> AsyncIterable[ChatMessageContent]:
+    def _setup_agent_chat_history(self, history: ChatHistory) -> ChatHistory:
         """
-        Asynchronously invokes the chat completion service with the provided chat history.
-        
+        Sets up the chat history sent to the model, compacted to the token budget of the agent.
+
         Args:
-            history (ChatHistory): The chat history to use for the invocation.
-            
+            history (ChatHistory): The group chat history.
+
+        Returns:
+            ChatHistory: The instructions and the (compacted) history.
+        """
+        chat = super()._setup_agent_chat_history(history)
+        if self.history_compactor is None:
+            return chat
+        return self.history_compactor.compact(chat)
+
+    def _get_chat_completion_service_and_settings(
+        self,
+    ) -> tuple[ChatCompletionClientBase, PromptExecutionSettings]:
+        """
+        Gets the chat completion service of the agent and the settings to invoke it with.
+
         Raises:
             KernelServiceNotFoundError: If the chat completion service is not found.
-            
-        Yields:
-            AsyncIterable[ChatMessageContent]: The chat message contents as they are generated.
+
+        Returns:
+            tuple[ChatCompletionClientBase, PromptExecutionSettings]: The service and the settings.
         """
-        # Get the chat completion service
         chat_completion_service = self.kernel.get_service(
             service_id=self.service_id, type=ChatCompletionClientBase
         )
@@ -90,57 +224,231 @@ class StateFlowBaseAgent(ChatCompletionAgent):
                 extension_data={"ai_model_id": chat_completion_service.ai_model_id},
             )
         )
+        return chat_completion_service, settings
 
-        chat = self._setup_agent_chat_history(history)
+    def _get_thought_action(self, reply: str) -> str:
+        """
+        Reads the thought and the action of the model reply, and counts the replies that were not
+        in the format asked for. A reply without action gets an empty one instead of a second call,
+        and the candidate actions each get their own Action line.
 
-        message_count = len(chat)
+        Args:
+            reply (str): The model reply.
 
-        logger.debug(
-            "[%s] Invoking %s.",
-            type(self).__name__,
-            type(chat_completion_service).__name__,
-        )
+        Returns:
+            str: The thought and the action in the `Thought: ... Action: ...` format of the history.
+        """
+        if self.action_candidates > 1:
+            thought, actions, output_format = ThoughtActionParser.parse_candidates(reply, self.action_candidates)
+        else:
+            thought, action, output_format = ThoughtActionParser.parse(reply)
+            actions = [action]
+        if output_format != ("json" if self.structured_output else "text"):
+            logger.info("[%s] Read a reply in %s format.", type(self).__name__, output_format)
+            state_flow_metrics.record_output_fallback(self.name, output_format)
+        return thought + "".join(f"\n{Constants.action_identifier} {action}" for action in actions)
 
-        messages = await chat_completion_service.get_chat_message_contents(
-            chat_history=chat,
-            settings=settings,
-            kernel=self.kernel,
-        )
+    async def _get_chat_message_contents(
+        self,
+        chat_completion_service: ChatCompletionClientBase,
+        chat: ChatHistory,
+        settings: PromptExecutionSettings,
+        iteration: int,
+    ) -> list[ChatMessageContent]:
+        """
+        Calls the chat completion service in its own span and records its latency and token usage.
 
-        logger.info(
-            "[%s] Invoked %s with message count: %d.",
-            type(self).__name__,
-            type(chat_completion_service).__name__,
-            message_count
-        )
+        Args:
+            chat_completion_service (ChatCompletionClientBase): The chat completion service.
+            chat (ChatHistory): The chat history of the agent.
+            settings (PromptExecutionSettings): The settings to invoke the service with.
+            iteration (int): The length of the group chat history, the iteration of the turn.
 
-        # Verify if thought and action are generated
-        result = messages[-1]
-        thought_action = result.content.strip()
-        try:
-            a = thought_action.strip().split("Action: ")
-            thought, action = a[0], a[1]
-        except IndexError:
-            # Fail to split, assume last step is thought, call model again to get action assume last step is thought
-            thought = thought_action.strip()
-            if not "Thought:" in thought:
-                thought = f"Thought: {thought}"
-            chat[-1].content += f"\n{thought}\nAction: "
+        Returns:
+            list[ChatMessageContent]: The chat message contents returned by the service.
+        """
+        with tracer.start_as_current_span(
+            "state_flow.llm_call", attributes={STATE_ATTRIBUTE: self.name, ITERATION_ATTRIBUTE: iteration}
+        ) as span:
+            started_at = time.perf_counter()
             messages = await chat_completion_service.get_chat_message_contents(
                 chat_history=chat,
                 settings=settings,
                 kernel=self.kernel,
             )
-            action = result.content.strip()
-        thought_action = f"{thought.strip()}\nAction: {action.strip()}"
+            usage = messages[-1].metadata.get("usage")
+            state_flow_metrics.record_llm_call(self.name, (time.perf_counter() - started_at) * 1000, usage)
+            self._set_usage_attributes(span, usage)
+            return messages
 
-        # Capture mutated messages related function calling / tools
-        for message_index in range(message_count, len(chat)):
-            message = chat[message_index]
-            message.name = self.name
-            history.add_message(message)
+    @staticmethod
+    def _set_usage_attributes(span: Span, usage: Any) -> None:
+        """
+        Records the token usage of an LLM call on its span.
+
+        Args:
+            span (Span): The span of the LLM call.
+            usage (Any): The token usage reported by the service, None if not reported.
+        """
+        if usage is not None:
+            span.set_attribute("gen_ai.usage.input_tokens", usage.prompt_tokens)
+            span.set_attribute("gen_ai.usage.output_tokens", usage.completion_tokens)
+
+    async def invoke(self, history: ChatHistory) -> AsyncIterable[ChatMessageContent]:
+        """
+        Asynchronously invokes the chat completion service with the provided chat history.
+        
+        Args:
+            history (ChatHistory): The chat history to use for the invocation.
+            
+        Raises:
+            KernelServiceNotFoundError: If the chat completion service is not found.
+            
+        Yields:
+            AsyncIterable[ChatMessageContent]: The chat message contents as they are generated.
+        """
+        # The span ends before the messages are yielded, a span must not stay open across a yield
+        with tracer.start_as_current_span(
+            f"state_flow.{self.name}",
+            attributes={STATE_ATTRIBUTE: self.name, ITERATION_ATTRIBUTE: len(history)},
+        ):
+            chat_completion_service, settings = self._get_chat_completion_service_and_settings()
+
+            chat = self._setup_agent_chat_history(history)
+
+            message_count = len(chat)
+
+            logger.debug(
+                "[%s] Invoking %s.",
+                type(self).__name__,
+                type(chat_completion_service).__name__,
+            )
+
+            messages = await self._get_chat_message_contents(
+                chat_completion_service, chat, settings, len(history)
+            )
+
+            logger.info(
+                "[%s] Invoked %s with message count: %d.",
+                type(self).__name__,
+                type(chat_completion_service).__name__,
+                message_count
+            )
+
+            thought_action = self._get_thought_action(messages[-1].content)
+
+            # Capture mutated messages related function calling / tools
+            for message_index in range(message_count, len(chat)):
+                message = chat[message_index]
+                message.name = self.name
+                history.add_message(message)
 
         for message in messages:
             message.name = self.name
             message.content = thought_action
             yield message
+
+    async def invoke_stream( # pylint: disable=too-many-locals
+        self, history: ChatHistory
+    ) -> AsyncIterable[StreamingChatMessageContent]:
+        """
+        Asynchronously invokes the chat completion service in streaming mode with the provided chat history.
+        The stream is closed as soon as the `Action: execute[...]` block is complete, instead of waiting
+        for the end of the completion, and the thought and action are added to the history. An agent
+        asking for candidate actions reads the blocks of all of its candidates. A JSON reply
+        of the structured output mode is read once the completion ends.
+
+        Args:
+            history (ChatHistory): The chat history to use for the invocation.
+
+        Raises:
+            KernelServiceNotFoundError: If the chat completion service is not found.
+
+        Yields:
+            AsyncIterable[StreamingChatMessageContent]: The chat message chunks as they are generated,
+            up to the end of the action block.
+        """
+        # The spans of invoke are not made current here, a span must not stay current across a yield
+        attributes = {STATE_ATTRIBUTE: self.name, ITERATION_ATTRIBUTE: len(history)}
+        state_span = tracer.start_span(f"state_flow.{self.name}", attributes=attributes)
+        try:
+            chat_completion_service, settings = self._get_chat_completion_service_and_settings()
+
+            chat = self._setup_agent_chat_history(history)
+
+            message_count = len(chat)
+
+            logger.debug(
+                "[%s] Invoking %s in streaming mode.",
+                type(self).__name__,
+                type(chat_completion_service).__name__,
+            )
+
+            detector = ActionBlockDetector(self.action_candidates)
+            role = None
+            usage = None
+            span = tracer.start_span(
+                "state_flow.llm_call", context=trace.set_span_in_context(state_span), attributes=attributes
+            )
+            started_at = time.perf_counter()
+            stream = chat_completion_service.get_streaming_chat_message_contents(
+                chat_history=chat,
+                settings=settings,
+                kernel=self.kernel,
+            )
+            try:
+                async for message_list in stream:
+                    for message in message_list:
+                        # The usage is reported on the last chunk, if the service reports it when streaming
+                        usage = message.metadata.get("usage") or usage
+                        if message.choice_index != 0:
+                            continue
+                        role = message.role
+                        message.name = self.name
+                        streamed_length = len(detector.text)
+                        if detector.feed(message.content or ""):
+                            # The text after the action block is not part of the message added to the history
+                            message.content = detector.text[streamed_length:detector.end]
+                        yield message
+                        if detector.end is not None:
+                            break
+                    if detector.end is not None:
+                        logger.debug(
+                            "[%s] Action block completed, closing the stream early.",
+                            type(self).__name__,
+                        )
+                        break
+            except Exception as err:
+                span.record_exception(err)
+                span.set_status(Status(StatusCode.ERROR, str(err)))
+                raise
+            finally:
+                await stream.aclose()
+                state_flow_metrics.record_llm_call(self.name, (time.perf_counter() - started_at) * 1000, usage)
+                self._set_usage_attributes(span, usage)
+                span.end()
+
+            logger.info(
+                "[%s] Invoked %s in streaming mode with message count: %d.",
+                type(self).__name__,
+                type(chat_completion_service).__name__,
+                message_count
+            )
+
+            thought_action = self._get_thought_action(detector.get_completed_text())
+
+            # Capture mutated messages related function calling / tools
+            for message_index in range(message_count, len(chat)):
+                message = chat[message_index]
+                message.name = self.name
+                history.add_message(message)
+
+            history.add_message(
+                ChatMessageContent(
+                    role=role if role else AuthorRole.ASSISTANT,
+                    content=thought_action,
+                    name=self.name,
+                )
+            )
+        finally:
+            state_span.end()
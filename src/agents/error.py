@@ -5,6 +5,8 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import (
 )
 
 from .base import StateFlowBaseAgent
+from .history_compaction import HistoryCompactor
+from .thought_action import ThoughtActionParser
 
 
 class AgentError:
@@ -54,6 +56,8 @@ Action: execute[<your command>] | submit
             instructions=self.error_agent_prompt,
             description="An Error Agent that helps to debug the SQL query and suggest the next steps.",
             execution_settings=prompt_execution_settings,
+            history_compactor=HistoryCompactor.get_history_compactor_from_environment(self.name),
+            structured_output=ThoughtActionParser.get_structured_output_from_environment(),
         )
 
     def get_agent(self) -> StateFlowBaseAgent:
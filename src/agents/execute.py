@@ -1,5 +1,7 @@
 """This module contains the AgentExecute class that is responsible for executing the SQL code and returning the output."""
 import re
+import time
+import asyncio
 import logging
 from typing import Optional
 from collections.abc import AsyncIterable
@@ -10,20 +12,42 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import (
 )
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import (
+    StreamingChatMessageContent,
+)
 from semantic_kernel.contents.utils.author_role import AuthorRole
 from semantic_kernel.contents.text_content import TextContent
 
 from src.mysql.execution_env import SqlEnv
+from src.mysql.execution_env_pool import SqlEnvPool
 from src.utils.constants import Constants
+from src.logging.metrics import state_flow_metrics
+from src.logging.tracing import (
+    tracer,
+    get_sql_hash,
+    STATE_ATTRIBUTE,
+    ITERATION_ATTRIBUTE,
+    SQL_HASH_ATTRIBUTE,
+    ROW_COUNT_ATTRIBUTE,
+)
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+# The losing candidates still running, referenced until their query is killed and their session is released
+_abandoned_candidates: set[asyncio.Task] = set()
+
 
 class SQLExecuteAgent(ChatCompletionAgent):
     """
     Agent base implementation for executing SQL code and returning the output.
+
+    When the message holds several candidate actions, they are executed concurrently on sessions
+    leased from the pool, the first candidate returning rows wins and the others are killed.
+    The candidates without a free pooled session are executed one by one on the conversation
+    session until one returns rows.
     """
     env: Optional[SqlEnv] = None
+    env_pool: Optional[SqlEnvPool] = None
 
     def __init__(
         self,
@@ -78,7 +102,7 @@ class SQLExecuteAgent(ChatCompletionAgent):
             return action, True
         return action, False
 
-    async def invoke(self, history: ChatHistory) -> AsyncIterable[ChatMessageContent]:
+    async def invoke(self, history: ChatHistory) -> AsyncIterable[ChatMessageContent]: # pylint: disable=too-many-locals
         """
         Execute the SQL code and return the output.
         
@@ -90,6 +114,8 @@ class SQLExecuteAgent(ChatCompletionAgent):
         """
         chat = self._setup_agent_chat_history(history)
         message = chat[-1].content
+        # The SQL metrics are recorded for the state that issued the action, like the LLM metrics
+        state = chat[-1].name or self.name
 
         logger.info(
             "[%s] Invoked %s with message count: %d.",
@@ -98,31 +124,40 @@ class SQLExecuteAgent(ChatCompletionAgent):
             len(chat),
         )
 
-        a = message.strip().split(f"{Constants.action_identifier} ")
-        try:
-            _, action = a[0], a[1]
-            action_parsed, is_code = self.sql_parser_react(action)
-        except IndexError:
-            action_parsed, is_code = None, False
-        if not is_code:
-            observation = f"{Constants.sql_error_message}: Your last `execute` action did not contain SQL code"
-            if Constants.sql_show_database in action_parsed:
-                observation = f"{Constants.sql_error_message}: SHOW DATABASES is not allowed in this environment."
-        else:
-            # Security Guardrail 02: Check for SQL Data Manipulation related keywords
-            if any(
-                keyword.lower() + " " in action_parsed.lower()
-                for keyword in Constants.sql_data_manipulation_commands
-            ):
-                observation = f"{Constants.sql_error_message}: SQL Data Manipulation Language (DML) is not allowed in this environment."
+        # The span ends before the output is yielded, a span must not stay open across a yield
+        with tracer.start_as_current_span(
+            f"state_flow.{self.name}",
+            attributes={STATE_ATTRIBUTE: self.name, ITERATION_ATTRIBUTE: len(history)},
+        ):
+            with tracer.start_as_current_span("state_flow.parse") as span:
+                thought, *actions = message.strip().split(f"{Constants.action_identifier} ")
+                candidates = [self.sql_parser_react(action.strip()) for action in actions]
+                span.set_attribute("state_flow.is_code", bool(candidates) and candidates[0][1])
+                span.set_attribute("state_flow.candidates", len(candidates))
+            winner = 0 if len(candidates) > 1 else None
+            if winner is not None and candidates[0] != (Constants.action_submit, True):
+                # The conversation only ends on a submit of the most likely candidate, the others are dropped
+                actions = [action for action, candidate in zip(actions, candidates) if candidate[0] != Constants.action_submit]
+                candidates = [candidate for candidate in candidates if candidate[0] != Constants.action_submit]
+                observation, winner = await self._execute_candidates(candidates, state)
+                self._record_winner(candidates[winner][0], observation)
             else:
-                observation, _, _, _ = self.env.step(action_parsed)
+                action_parsed, is_code = candidates[0] if candidates else (None, False)
+                observation = await self._get_observation(action_parsed, is_code, self.env, state)
+            if winner is not None:
+                # The next states read the last action of the message, only the chosen candidate is kept
+                history.messages[-1].content = f"{thought.strip()}\n{Constants.action_identifier} {actions[winner].strip()}"
 
-        # Limit observation size due to context window thresholds for API call
-        if isinstance(observation, str) and len(observation) > 350:
-            observation = observation[:350]
-        elif isinstance(observation, list) and len(observation) > 25:
-            observation = observation[:25]
+            # Limit observation size due to context window thresholds for API call
+            with tracer.start_as_current_span("state_flow.truncate") as span:
+                if isinstance(observation, str) and len(observation) > Constants.observation_max_chars:
+                    observation = observation[: Constants.observation_max_chars]
+                    state_flow_metrics.record_observation_truncation(self.name, "chars")
+                    span.set_attribute("state_flow.truncated", "chars")
+                elif isinstance(observation, list) and len(observation) > Constants.observation_max_rows:
+                    observation = observation[: Constants.observation_max_rows]
+                    state_flow_metrics.record_observation_truncation(self.name, "rows")
+                    span.set_attribute("state_flow.truncated", "rows")
 
         code_output = f"{Constants.observation_identifier}{observation}"
 
@@ -136,6 +171,169 @@ class SQLExecuteAgent(ChatCompletionAgent):
         for message in messages:
             yield message
 
+    async def _get_observation(self, action_parsed: str | None, is_code: bool, env: SqlEnv, state: str) -> object:
+        """
+        Checks the action against the guardrail and executes it.
+
+        Args:
+            action_parsed (str | None): The parsed action.
+            is_code (bool): Whether the action contains SQL code.
+            env (SqlEnv): The SQL execution environment running the action.
+            state (str): The state that issued the action, the SQL metrics are recorded for it.
+
+        Returns:
+            object: The fetched rows, or the error message.
+        """
+        if not is_code:
+            if action_parsed and Constants.sql_show_database in action_parsed:
+                return f"{Constants.sql_error_message}: SHOW DATABASES is not allowed in this environment."
+            return f"{Constants.sql_error_message}: Your last `execute` action did not contain SQL code"
+        # Security Guardrail 02: Check for SQL Data Manipulation related keywords
+        with tracer.start_as_current_span("state_flow.guardrail") as span:
+            is_blocked = any(
+                keyword.lower() + " " in action_parsed.lower()
+                for keyword in Constants.sql_data_manipulation_commands
+            )
+            span.set_attribute("state_flow.blocked", is_blocked)
+        if is_blocked:
+            return f"{Constants.sql_error_message}: SQL Data Manipulation Language (DML) is not allowed in this environment."
+        with tracer.start_as_current_span(
+            "state_flow.sql_execute", attributes={SQL_HASH_ATTRIBUTE: get_sql_hash(action_parsed)}
+        ) as span:
+            started_at = time.perf_counter()
+            observation, _, _, _ = await env.step_async(action_parsed)
+            state_flow_metrics.record_sql_execution(
+                state, (time.perf_counter() - started_at) * 1000, observation
+            )
+            if isinstance(observation, list):
+                span.set_attribute(ROW_COUNT_ATTRIBUTE, len(observation))
+        return observation
+
+    @staticmethod
+    def _has_rows(observation: object) -> bool:
+        """Whether a candidate returned rows, which makes it the winner"""
+        return isinstance(observation, list) and len(observation) > 0
+
+    async def _lease_candidate_envs(self, count: int) -> list[SqlEnv]:
+        """
+        Leases up to `count` sessions from the pool without waiting for a busy one.
+
+        Args:
+            count (int): The number of sessions wanted.
+
+        Returns:
+            list[SqlEnv]: The leased sessions, fewer than wanted if the pool is full.
+        """
+        envs = []
+        if self.env_pool is None:
+            return envs
+        for _ in range(count):
+            try:
+                envs.append(await self.env_pool.acquire_async(0))
+            except Exception as err: # pylint: disable=broad-except
+                logger.debug("[%s] No pooled session for a candidate: %s", type(self).__name__, err)
+                break
+        return envs
+
+    async def _abandon_candidate(self, execution: asyncio.Task, env: SqlEnv) -> None:
+        """
+        Kills the query of a losing candidate, and releases its session once the query stopped.
+
+        Args:
+            execution (asyncio.Task): The pending execution of the candidate.
+            env (SqlEnv): The leased session running the candidate.
+        """
+        try:
+            await asyncio.to_thread(env.kill_query)
+        except Exception as err: # pylint: disable=broad-except
+            logger.debug("[%s] Failed to kill a losing candidate: %s", type(self).__name__, err)
+        await asyncio.wait([execution])
+        self.env_pool.release(env)
+
+    async def _execute_candidates(self, candidates: list[tuple[str, bool]], state: str) -> tuple[object, int]:
+        """
+        Executes the candidate actions, concurrently as far as the pool has free sessions.
+
+        Args:
+            candidates (list[tuple[str, bool]]): The parsed actions, and whether they contain SQL code.
+            state (str): The state that issued the actions.
+
+        Returns:
+            tuple[object, int]: The observation of the winning candidate and its index. Without rows,
+            the first candidate that did not fail wins, and the first candidate if all failed.
+        """
+        observations: list[object] = [None] * len(candidates)
+        envs = await self._lease_candidate_envs(len(candidates))
+        executions = {
+            asyncio.ensure_future(self._get_observation(*candidate, env, state)): index
+            for index, (candidate, env) in enumerate(zip(candidates, envs))
+        }
+        winner = None
+        pending = set(executions)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for execution in done:
+                    observations[executions[execution]] = execution.result()
+                winner = min(
+                    (executions[execution] for execution in done if self._has_rows(execution.result())),
+                    default=None,
+                )
+        finally:
+            for execution, index in executions.items():
+                if execution in pending:
+                    task = asyncio.ensure_future(self._abandon_candidate(execution, envs[index]))
+                    _abandoned_candidates.add(task)
+                    task.add_done_callback(_abandoned_candidates.discard)
+                else:
+                    self.env_pool.release(envs[index])
+        for index in range(len(envs), len(candidates)):
+            if winner is not None:
+                break
+            observations[index] = await self._get_observation(*candidates[index], self.env, state)
+            if self._has_rows(observations[index]):
+                winner = index
+        if winner is None:
+            winner = next((
+                index for index, observation in enumerate(observations)
+                if not (isinstance(observation, str) and observation.startswith(Constants.sql_error_message))
+            ), 0)
+        logger.info("[%s] Candidate %d of %d won.", type(self).__name__, winner + 1, len(candidates))
+        return observations[winner], winner
+
+    def _record_winner(self, action_parsed: str, observation: object) -> None:
+        """
+        Records the winning candidate on the conversation session, a later submit returns its observation.
+
+        Args:
+            action_parsed (str): The parsed action of the winning candidate.
+            observation (object): The observation of the winning candidate.
+        """
+        self.env.observation = observation
+        # A candidate executed on the conversation session is already in its trajectory
+        if not self.env.trajectory or self.env.trajectory[-1] != (action_parsed, observation):
+            self.env.trajectory.append((action_parsed, observation))
+
+    async def invoke_stream(
+        self, history: ChatHistory
+    ) -> AsyncIterable[StreamingChatMessageContent]:
+        """
+        Execute the SQL code and return the output as a single streamed chunk.
+
+        Args:
+            history (ChatHistory): The chat history.
+
+        Yields:
+            AsyncIterable[StreamingChatMessageContent]: The output chunk.
+        """
+        async for message in self.invoke(history):
+            yield StreamingChatMessageContent(
+                role=message.role,
+                choice_index=0,
+                content=message.content,
+                name=self.name,
+            )
+
 
 class AgentExecute:
     """
@@ -143,13 +341,19 @@ class AgentExecute:
     """
     name = "executor"
 
-    def __init__(self, sql_executor_env: SqlEnv, kernel: Kernel | None = None):
+    def __init__(
+        self,
+        sql_executor_env: SqlEnv,
+        kernel: Kernel | None = None,
+        sql_executor_env_pool: SqlEnvPool | None = None,
+    ):
         """
         Initialize the AgentExecute.
         
         Args:
             sql_executor_env (SqlEnv): The SQL execution environment.
             kernel (Kernel | None): The kernel instance.
+            sql_executor_env_pool (SqlEnvPool | None): The pool the candidate actions are executed on concurrently.
         """
         self.agent = SQLExecuteAgent(
             name=self.name,
@@ -158,6 +362,7 @@ class AgentExecute:
             description="A Code Executor Agent that executes the SQL query and returns the output.",
         )
         self.agent.env = sql_executor_env
+        self.agent.env_pool = sql_executor_env_pool
 
     def get_agent(self) -> SQLExecuteAgent:
         """
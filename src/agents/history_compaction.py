@@ -0,0 +1,223 @@
+"""This module contains the HistoryCompactor class which keeps the prompt of an agent within a token budget."""
+import os
+import re
+from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from src.utils.constants import Constants
+
+# No tokenizer is shipped, a token is estimated at 4 characters of English text or SQL
+CHARS_PER_TOKEN = 4
+
+
+class HistoryCompactor:
+    """
+    This class compacts the chat history sent to an LLM agent. The instructions, the current
+    question and the latest turns are kept verbatim, and the older turns are summarized in one
+    message: the DESC observations become a schema summary and the failed attempts one-line
+    notes. When the prompt is still over the token budget, the older successful queries and
+    then the oldest of the latest turns are collapsed to notes too, and the oldest steps of the
+    earlier questions are dropped, so the prompt size stays roughly constant however long the
+    conversation gets.
+    """
+    COMPACTION_CONFIG = {
+        "enabled": os.getenv("HISTORY_COMPACTION", "true").lower() == "true",
+        "token_budget": int(os.getenv("HISTORY_TOKEN_BUDGET", "3000")),
+        "keep_turns": int(os.getenv("HISTORY_KEEP_TURNS", "2")),
+        "note_max_chars": int(os.getenv("HISTORY_NOTE_MAX_CHARS", "160")),
+    }
+    desc_pattern = re.compile(r"^\s*(?:DESC|DESCRIBE)\s+`?(\w+)`?\s*$", re.IGNORECASE)
+    column_pattern = re.compile(r"\('([^']+)', b?'([^']+)'")
+    execute_pattern = re.compile(r"execute\[(.*)\]", re.DOTALL)
+
+    def __init__(self, token_budget: int = 3000, keep_turns: int = 2, note_max_chars: int = 160):
+        """
+        Initializes the compactor.
+
+        Args:
+            token_budget (int): The estimated number of tokens the prompt is compacted to.
+            keep_turns (int): The number of latest turns (an action and its observation) kept verbatim.
+            note_max_chars (int): The maximum length of a note summarizing an older step.
+        """
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.note_max_chars = note_max_chars
+
+    @staticmethod
+    def get_token_count(messages: list[ChatMessageContent]) -> int:
+        """
+        Estimates the number of tokens of the messages.
+
+        Args:
+            messages (list[ChatMessageContent]): The messages.
+
+        Returns:
+            int: The estimated number of tokens.
+        """
+        return sum(len(message.content or "") // CHARS_PER_TOKEN + 1 for message in messages)
+
+    @staticmethod
+    def _is_observation(message: ChatMessageContent) -> bool:
+        """Whether the message is the output of the executor."""
+        return (message.content or "").startswith(Constants.observation_identifier)
+
+    def _get_turns(self, messages: list[ChatMessageContent]) -> list[list[ChatMessageContent]]:
+        """
+        Groups the messages in turns, an action and the observation that follows it.
+
+        Args:
+            messages (list[ChatMessageContent]): The messages.
+
+        Returns:
+            list[list[ChatMessageContent]]: The turns.
+        """
+        turns = []
+        for message in messages:
+            if turns and self._is_observation(message) and not self._is_observation(turns[-1][-1]):
+                turns[-1].append(message)
+            else:
+                turns.append([message])
+        return turns
+
+    def _cut(self, text: str) -> str:
+        """Cuts a text to the note length on a single line."""
+        text = " ".join(text.split())
+        return text if len(text) <= self.note_max_chars else f"{text[: self.note_max_chars]}..."
+
+    def _get_action(self, message: ChatMessageContent) -> str:
+        """Returns the action of an agent message."""
+        return (message.content or "").split(Constants.action_identifier)[-1].strip()
+
+    def _get_note(self, turn: list[ChatMessageContent], schema: dict[str, str]) -> str | None:
+        """
+        Summarizes a turn, the DESC observations are added to the schema summary instead.
+
+        Args:
+            turn (list[ChatMessageContent]): The action and its observation.
+            schema (dict[str, str]): The columns by table of the DESC observations, updated in place.
+
+        Returns:
+            str | None: The note of the turn, None if it is only kept in the schema summary.
+        """
+        message = turn[0]
+        content = message.content or ""
+        if message.role == AuthorRole.USER:
+            question = content.split("\n", 1)[0].removeprefix("Question: ")
+            return f"Earlier question: {self._cut(question)}"
+        if len(turn) == 1:
+            if self._is_observation(message):
+                return None
+            return f"Earlier answer: {self._cut(content)}"
+        action = self._get_action(message)
+        observation = (turn[1].content or "").removeprefix(Constants.observation_identifier)
+        if Constants.sql_error_message in observation:
+            return f"Failed: {self._cut(action)} -> {self._cut(observation)}"
+        sql = self.execute_pattern.search(action)
+        desc = self.desc_pattern.match(sql.group(1)) if sql else None
+        if desc:
+            columns = ", ".join(f"{name} {type_}" for name, type_ in self.column_pattern.findall(observation))
+            references = observation.split(" References: ", 1)
+            schema[desc.group(1)] = columns + (f"; references {references[1]}" if len(references) > 1 else "")
+            return None
+        return f"Done: {self._cut(action)} -> {self._cut(observation)}"
+
+    def _is_successful_query(self, turn: list[ChatMessageContent]) -> bool:
+        """Whether the turn is a query other than DESC that did not fail, it is only compacted over budget."""
+        if len(turn) != 2 or Constants.sql_error_message in (turn[1].content or ""):
+            return False
+        sql = self.execute_pattern.search(self._get_action(turn[0]))
+        return sql is not None and not self.desc_pattern.match(sql.group(1))
+
+    def _get_summary(self, turns: list[list[ChatMessageContent]], omitted: int = 0) -> list[ChatMessageContent]:
+        """
+        Builds the message summarizing the compacted turns.
+
+        Args:
+            turns (list[list[ChatMessageContent]]): The compacted turns.
+            omitted (int): The number of older turns dropped from the summary.
+
+        Returns:
+            list[ChatMessageContent]: The summary message, none if there is nothing to summarize.
+        """
+        schema: dict[str, str] = {}
+        notes = [note for note in (self._get_note(turn, schema) for turn in turns) if note is not None]
+        lines = [f"Schema: {table}({columns})" for table, columns in schema.items()] + notes
+        if omitted:
+            lines.insert(0, f"Omitted: {omitted} earlier steps")
+        if not lines:
+            return []
+        return [ChatMessageContent(
+            role=AuthorRole.ASSISTANT,
+            content="\n".join([Constants.history_summary_thought, *lines]),
+        )]
+
+    def compact(self, chat: ChatHistory) -> ChatHistory:
+        """
+        Compacts the chat history of an agent.
+
+        Args:
+            chat (ChatHistory): The instructions and the group chat history.
+
+        Returns:
+            ChatHistory: The compacted chat history, the kept messages are the same objects.
+        """
+        messages = list(chat.messages)
+        system = [message for message in messages[:1] if message.role == AuthorRole.SYSTEM]
+        messages = messages[len(system):]
+        user_indexes = [index for index, message in enumerate(messages) if message.role == AuthorRole.USER]
+        if not user_indexes:
+            return chat
+        # The earlier questions of a multi-turn conversation are always summarized
+        earlier = self._get_turns(messages[: user_indexes[-1]])
+        question = messages[user_indexes[-1]]
+        turns = self._get_turns(messages[user_indexes[-1] + 1:])
+        kept = turns[-self.keep_turns:] if self.keep_turns > 0 else []
+        older = turns[: len(turns) - len(kept)]
+        is_compacted = [not self._is_successful_query(turn) for turn in older]
+        omitted = 0
+
+        def build() -> list[ChatMessageContent]:
+            return [
+                *system,
+                *self._get_summary(earlier, omitted),
+                question,
+                *self._get_summary([turn for turn, compacted in zip(older, is_compacted) if compacted]),
+                *(message for turn, compacted in zip(older, is_compacted) if not compacted for message in turn),
+                *(message for turn in kept for message in turn),
+            ]
+
+        result = build()
+        while self.get_token_count(result) > self.token_budget:
+            if False in is_compacted:
+                is_compacted[is_compacted.index(False)] = True
+            elif len(kept) > 1:
+                older.append(kept.pop(0))
+                is_compacted.append(True)
+            elif earlier:
+                # Nothing is left to collapse, the oldest steps of the earlier questions are dropped
+                earlier.pop(0)
+                omitted += 1
+            else:
+                break
+            result = build()
+        return ChatHistory(messages=result)
+
+    @staticmethod
+    def get_history_compactor_from_environment(agent_name: str | None = None) -> "HistoryCompactor | None":
+        """
+        Returns the compactor configured by the environment, the token budget of an agent can be
+        set with `HISTORY_TOKEN_BUDGET_<AGENT NAME>`.
+
+        Args:
+            agent_name (str | None): The name of the agent.
+
+        Returns:
+            HistoryCompactor | None: The compactor, None if the compaction is disabled.
+        """
+        config = HistoryCompactor.COMPACTION_CONFIG
+        if not config["enabled"]:
+            return None
+        token_budget = config["token_budget"]
+        if agent_name:
+            token_budget = int(os.getenv(f"HISTORY_TOKEN_BUDGET_{agent_name.upper()}", str(token_budget)))
+        return HistoryCompactor(token_budget, config["keep_turns"], config["note_max_chars"])
@@ -5,6 +5,8 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import (
 )
 
 from .base import StateFlowBaseAgent
+from .history_compaction import HistoryCompactor
+from .thought_action import ThoughtActionParser
 
 
 class AgentObserve:
@@ -52,6 +54,8 @@ Action: execute[<your command>]
             instructions=self.observe_agent_prompt,
             description="A Observational Agent that creates a SQL query to observe the database.",
             execution_settings=prompt_execution_settings,
+            history_compactor=HistoryCompactor.get_history_compactor_from_environment(self.name),
+            structured_output=ThoughtActionParser.get_structured_output_from_environment(),
         )
 
     def get_agent(self) -> StateFlowBaseAgent:
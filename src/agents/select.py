@@ -5,6 +5,8 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import (
 )
 
 from .base import StateFlowBaseAgent
+from .history_compaction import HistoryCompactor
+from .thought_action import ThoughtActionParser
 
 
 class AgentSelect:
@@ -59,6 +61,9 @@ Action: execute[<your command>] | submit
             instructions=self.select_agent_prompt,
             description="A Select Agent that create the SQL Select query to answer the question.",
             execution_settings=prompt_execution_settings,
+            history_compactor=HistoryCompactor.get_history_compactor_from_environment(self.name),
+            structured_output=ThoughtActionParser.get_structured_output_from_environment(),
+            action_candidates=ThoughtActionParser.get_sql_candidates_from_environment(),
         )
 
     def get_agent(self) -> StateFlowBaseAgent:
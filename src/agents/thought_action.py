@@ -0,0 +1,184 @@
+"""This module contains the ThoughtActionParser class which reads the thought and the action of an LLM agent reply."""
+import os
+import re
+import json
+from src.utils.constants import Constants
+
+
+class ThoughtActionParser:
+    """
+    This class reads the thought and the action of a reply, either a JSON object of the structured
+    output mode or the `Thought: ... Action: ...` template of the instructions. Replies that do not
+    follow the expected format are read leniently (a JSON reply in text mode, a misspelled action
+    label, a bare `execute[...]`), and a reply without any action gets an empty action, so every
+    agent turn is a single LLM call.
+
+    The formats are named `json`, `text`, `lenient` and `missing`, a reply in another format than
+    the one the agent asked for is a fallback. An agent asking for several candidate actions gets
+    all the actions of the reply, in their order.
+    """
+    OUTPUT_CONFIG = {
+        "structured": os.getenv("LLM_STRUCTURED_OUTPUT", "false").lower() == "true",
+        "sql_candidates": int(os.getenv("LLM_SQL_CANDIDATES", "1")),
+    }
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "thought_action",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "thought": {"type": "string"},
+                    "action": {"type": "string"},
+                },
+                "required": ["thought", "action"],
+                "additionalProperties": False,
+            },
+        },
+    }
+    candidates_response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "thought_actions",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "thought": {"type": "string"},
+                    "actions": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["thought", "actions"],
+                "additionalProperties": False,
+            },
+        },
+    }
+    structured_output_instructions = """
+## JSON OUTPUT
+Reply with a JSON object instead of the template: put your thought in "thought" and your action (execute[<your command>] or submit) in "action".
+"""
+    candidates_instructions = """
+## CANDIDATES
+Instead of one action, give up to {count} different commands that could answer the question, the most likely first, each on its own Action line:
+Thought: <your thought>
+Action: execute[<your most likely command>]
+Action: execute[<another command>]
+"""
+    structured_candidates_instructions = """
+## JSON OUTPUT
+Reply with a JSON object instead of the template: put your thought in "thought" and your actions (execute[<your command>] or submit) in the "actions" list, the most likely first.
+"""
+    action_label = f"{Constants.action_identifier} "
+    fence_pattern = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+    json_field_pattern = r'"{}"\s*:\s*("(?:[^"\\]|\\.)*")'
+    lenient_action_pattern = re.compile(r"^\W*action\W*:\s*", re.IGNORECASE | re.MULTILINE)
+    bare_action_pattern = re.compile(r"execute\[|\bsubmit\s*$")
+
+    @staticmethod
+    def _get_thought(thought: str) -> str:
+        """Adds the thought label if the reply does not have it"""
+        thought = thought.strip()
+        return thought if thought.startswith("Thought:") else f"Thought: {thought}"
+
+    @classmethod
+    def _parse_json(cls, reply: str) -> tuple[str, str] | None:
+        """
+        Reads a JSON reply, the fields are also looked up in a cut or malformed object.
+
+        Args:
+            reply (str): The reply without its code fence.
+
+        Returns:
+            tuple[str, str] | None: The thought and the action, None if the reply has no action field.
+        """
+        try:
+            value = json.loads(reply)
+            if isinstance(value, dict) and isinstance(value.get("action"), str):
+                return str(value.get("thought", "")), value["action"]
+        except json.JSONDecodeError:
+            action = re.search(cls.json_field_pattern.format("action"), reply)
+            if action is not None:
+                thought = re.search(cls.json_field_pattern.format("thought"), reply)
+                return (json.loads(thought.group(1)) if thought else ""), json.loads(action.group(1))
+        return None
+
+    @classmethod
+    def parse(cls, reply: str) -> tuple[str, str, str]:
+        """
+        Reads the thought and the action of a reply.
+
+        Args:
+            reply (str): The reply of the LLM.
+
+        Returns:
+            tuple[str, str, str]: The thought (with its label), the action and the format of the reply.
+        """
+        text = reply.strip()
+        fence = cls.fence_pattern.match(text)
+        if fence:
+            text = fence.group(1)
+        if text.startswith("{"):
+            thought_action = cls._parse_json(text)
+            if thought_action is not None:
+                return cls._get_thought(thought_action[0]), thought_action[1].strip(), "json"
+        if cls.action_label in text:
+            thought, action = text.split(cls.action_label)[:2]
+            return cls._get_thought(thought), action.strip(), "text"
+        match = cls.lenient_action_pattern.search(text) or cls.bare_action_pattern.search(text)
+        if match:
+            action_start = match.end() if match.re is cls.lenient_action_pattern else match.start()
+            return cls._get_thought(text[: match.start()]), text[action_start:].strip(), "lenient"
+        return cls._get_thought(text), "", "missing"
+
+    @classmethod
+    def parse_candidates(cls, reply: str, max_candidates: int) -> tuple[str, list[str], str]:
+        """
+        Reads the thought and the candidate actions of a reply.
+
+        Args:
+            reply (str): The reply of the LLM.
+            max_candidates (int): The maximum number of actions kept.
+
+        Returns:
+            tuple[str, list[str], str]: The thought (with its label), the actions and the format of the reply.
+        """
+        text = reply.strip()
+        fence = cls.fence_pattern.match(text)
+        if fence:
+            text = fence.group(1)
+        if text.startswith("{"):
+            try:
+                value = json.loads(text)
+            except json.JSONDecodeError:
+                value = None
+            if isinstance(value, dict) and isinstance(value.get("actions"), list):
+                actions = [str(action).strip() for action in value["actions"] if str(action).strip()]
+                if actions:
+                    return cls._get_thought(str(value.get("thought", ""))), actions[:max_candidates], "json"
+        if cls.action_label in text:
+            thought, *actions = text.split(cls.action_label)
+            actions = [action.strip() for action in actions if action.strip()]
+            if actions:
+                return cls._get_thought(thought), actions[:max_candidates], "text"
+        thought, action, output_format = cls.parse(reply)
+        return thought, [action], output_format
+
+    @staticmethod
+    def get_structured_output_from_environment() -> bool:
+        """
+        Returns whether the agents reply with the JSON object of the structured output mode.
+
+        Returns:
+            bool: True if `LLM_STRUCTURED_OUTPUT` is true.
+        """
+        return ThoughtActionParser.OUTPUT_CONFIG["structured"]
+
+    @staticmethod
+    def get_sql_candidates_from_environment() -> int:
+        """
+        Returns the number of candidate SQL commands the select agent asks for in one completion.
+
+        Returns:
+            int: `LLM_SQL_CANDIDATES`, 1 disables the candidates.
+        """
+        return max(1, ThoughtActionParser.OUTPUT_CONFIG["sql_candidates"])
@@ -5,6 +5,8 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import (
 )
 
 from .base import StateFlowBaseAgent
+from .history_compaction import HistoryCompactor
+from .thought_action import ThoughtActionParser
 
 
 class AgentVerify:
@@ -54,6 +56,8 @@ Action: execute[<your new command>] | submit
             instructions=self.verify_agent_prompt,
             description="A Verify Agent that helps to verify the SQL query output if it answers the question or suggests the next steps.",
             execution_settings=prompt_execution_settings,
+            history_compactor=HistoryCompactor.get_history_compactor_from_environment(self.name),
+            structured_output=ThoughtActionParser.get_structured_output_from_environment(),
         )
 
     def get_agent(self) -> StateFlowBaseAgent:
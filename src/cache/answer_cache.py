@@ -0,0 +1,366 @@
+"""This module contains the AnswerCache class which caches final answers keyed on the normalized question and the schema fingerprint."""
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+import mysql.connector
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class AnswerCacheBackend(ABC):
+    """Storage of the answer cache with TTL and LRU eviction."""
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None:
+        """
+        Gets a cached answer.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            dict | None: The cached answer, None if missing or expired.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        """
+        Caches an answer, evicting the least recently used one if the cache is full.
+
+        Args:
+            key (str): The cache key.
+            value (dict): The answer to cache.
+            ttl (float): Seconds the answer stays valid.
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Removes all cached answers."""
+
+
+class InMemoryAnswerCacheBackend(AnswerCacheBackend):
+    """Process-local answer cache backend."""
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        Initializes the in-memory backend.
+
+        Args:
+            max_entries (int): The maximum number of cached answers.
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(value)
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteAnswerCacheBackend(AnswerCacheBackend):
+    """Local file answer cache backend, shared by the processes of a host and kept across restarts."""
+
+    def __init__(self, path: str, max_entries: int = 1024):
+        """
+        Initializes the SQLite backend.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            max_entries (int): The maximum number of cached answers.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                    "key" TEXT PRIMARY KEY,
+                    "value" TEXT NOT NULL,
+                    "expires_at" REAL NOT NULL,
+                    "last_access" REAL NOT NULL
+                )"""
+            )
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT "value", "expires_at" FROM answers WHERE "key" = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._connection.execute('DELETE FROM answers WHERE "key" = ?', (key,))
+                return None
+            self._connection.execute(
+                'UPDATE answers SET "last_access" = ? WHERE "key" = ?', (now, key)
+            )
+            return json.loads(row[0])
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO answers ("key", "value", "expires_at", "last_access") VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now + ttl, now),
+            )
+            self._connection.execute(
+                'DELETE FROM answers WHERE "key" NOT IN (SELECT "key" FROM answers ORDER BY "last_access" DESC LIMIT ?)',
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM answers")
+
+
+class AnswerCache:
+    """
+    This class caches the final answers of the state flow conversation, so repeated questions
+    skip all LLM and SQL calls. Entries are keyed on the normalized question and a fingerprint of
+    the database schema, and the cache is emptied when the schema fingerprint changes.
+    """
+    CACHE_CONFIG = {
+        "backend": os.getenv("ANSWER_CACHE_BACKEND", "none"),
+        "ttl": float(os.getenv("ANSWER_CACHE_TTL", "300")),
+        "max_entries": int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+        "path": os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite.db"),
+        "schema_refresh_interval": float(os.getenv("ANSWER_CACHE_SCHEMA_REFRESH_INTERVAL", "60")),
+    }
+
+    def __init__(self, backend: AnswerCacheBackend, ttl: float = 300.0):
+        """
+        Initializes the answer cache.
+
+        Args:
+            backend (AnswerCacheBackend): The storage of the cache.
+            ttl (float): Seconds an answer stays valid.
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.schema_fingerprint: str | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """
+        Normalizes the question so trivially different spellings share a cache entry.
+
+        Args:
+            question (str): The user question.
+
+        Returns:
+            str: The lower-cased question with collapsed whitespace and without trailing punctuation.
+        """
+        return re.sub(r"\s+", " ", question).strip().rstrip("?!.").strip().lower()
+
+    @staticmethod
+    def get_schema_fingerprint(schema: Any) -> str:
+        """
+        Computes the fingerprint of the database schema.
+
+        Args:
+            schema (Any): The description of the schema, e.g. the rows of information_schema.COLUMNS.
+
+        Returns:
+            str: The fingerprint.
+        """
+        return hashlib.sha256(repr(schema).encode("utf-8")).hexdigest()
+
+    def _get_key(self, question: str, schema_fingerprint: str) -> str:
+        """
+        Gets the cache key of a question.
+
+        Args:
+            question (str): The user question.
+            schema_fingerprint (str): The fingerprint of the database schema.
+
+        Returns:
+            str: The cache key.
+        """
+        normalized_question = self.normalize_question(question)
+        return hashlib.sha256(
+            f"{schema_fingerprint}\n{normalized_question}".encode("utf-8")
+        ).hexdigest()
+
+    def _check_schema_fingerprint(self, schema_fingerprint: str) -> None:
+        """
+        Empties the cache when the schema fingerprint changed.
+
+        Args:
+            schema_fingerprint (str): The current fingerprint of the database schema.
+        """
+        if self.schema_fingerprint != schema_fingerprint:
+            if self.schema_fingerprint is not None:
+                logger.info("[%s] Schema changed, invalidating cached answers.", type(self).__name__)
+                self.backend.clear()
+            self.schema_fingerprint = schema_fingerprint
+
+    def get(self, question: str, schema_fingerprint: str) -> dict | None:
+        """
+        Gets the cached answer of a question.
+
+        Args:
+            question (str): The user question.
+            schema_fingerprint (str): The fingerprint of the database schema.
+
+        Returns:
+            dict | None: The cached answer, None on a cache miss.
+        """
+        self._check_schema_fingerprint(schema_fingerprint)
+        answer = self.backend.get(self._get_key(question, schema_fingerprint))
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def set(self, question: str, schema_fingerprint: str, answer: dict) -> None:
+        """
+        Caches the answer of a question.
+
+        Args:
+            question (str): The user question.
+            schema_fingerprint (str): The fingerprint of the database schema.
+            answer (dict): The answer to cache.
+        """
+        self._check_schema_fingerprint(schema_fingerprint)
+        self.backend.set(self._get_key(question, schema_fingerprint), answer, self.ttl)
+
+    @staticmethod
+    def get_answer_cache_from_environment() -> "AnswerCache | None":
+        """
+        Returns an instance of the AnswerCache class with the configuration details from the environment.
+
+        Raises:
+            ValueError: If the configured backend is unknown.
+
+        Returns:
+            AnswerCache | None: An instance of the AnswerCache class, None if the cache is disabled.
+        """
+        config = AnswerCache.CACHE_CONFIG
+        backend_name = config["backend"].lower()
+        if backend_name == "none":
+            return None
+        if backend_name == "memory":
+            backend = InMemoryAnswerCacheBackend(max_entries=config["max_entries"])
+        elif backend_name == "sqlite":
+            backend = SqliteAnswerCacheBackend(config["path"], max_entries=config["max_entries"])
+        else:
+            raise ValueError(f"Unknown answer cache backend: {config['backend']}")
+        return AnswerCache(backend, ttl=config["ttl"])
+
+
+class SchemaFingerprint:
+    """
+    This class keeps the fingerprint of the database schema the answer cache is keyed on, a hash
+    of the tables and columns in information_schema. It is computed on a connection of its own and
+    recomputed in the background once the refresh interval elapsed, so a cache lookup never waits
+    for a pooled session or a query. Until the first fingerprint is known the cache is not used.
+    """
+    columns_query = (
+        "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_DEFAULT, EXTRA "
+        "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION"
+    )
+
+    def __init__(self, config: dict[str, Any], refresh_interval: float = 60.0):
+        """
+        Initializes the schema fingerprint, it is computed on first use.
+
+        Args:
+            config (dict): A dictionary containing the MySQL connection details.
+            refresh_interval (float): Seconds after which the fingerprint is computed again.
+        """
+        self.config = config
+        self.refresh_interval = refresh_interval
+        self.value: str | None = None
+        self.refreshed_at: float | None = None
+        self._refreshing: asyncio.Future | None = None
+
+    def refresh(self) -> str:
+        """
+        Computes the fingerprint from the columns of the database.
+
+        Returns:
+            str: The fingerprint.
+        """
+        cnx = mysql.connector.connect(
+            host=self.config["host"],
+            port=self.config["port"],
+            user=self.config["user"],
+            database=self.config["database"],
+            password=self.config["password"],
+        )
+        try:
+            cursor = cnx.cursor()
+            cursor.execute(self.columns_query)
+            columns = cursor.fetchall()
+            cursor.close()
+        finally:
+            cnx.close()
+        self.value = AnswerCache.get_schema_fingerprint(columns)
+        self.refreshed_at = time.monotonic()
+        return self.value
+
+    def _on_refreshed(self, refreshing: asyncio.Future) -> None:
+        """Logs a failed background refresh, the previous fingerprint stays in use"""
+        self._refreshing = None
+        if not refreshing.cancelled() and refreshing.exception() is not None:
+            logger.warning("[%s] Schema fingerprint not refreshed: %s", type(self).__name__, refreshing.exception())
+
+    def get(self) -> str | None:
+        """
+        Gets the current fingerprint without waiting, and starts a background refresh when it is stale.
+        Must be called from the event loop.
+
+        Returns:
+            str | None: The fingerprint, None if it was never computed.
+        """
+        is_stale = self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.refresh_interval
+        if is_stale and self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(asyncio.to_thread(self.refresh))
+            self._refreshing.add_done_callback(self._on_refreshed)
+        return self.value
+
+    @staticmethod
+    def get_schema_fingerprint_from_environment(config: dict[str, Any]) -> "SchemaFingerprint":
+        """
+        Returns an instance of the SchemaFingerprint class with the refresh interval from the environment.
+
+        Args:
+            config (dict): A dictionary containing the MySQL connection details.
+
+        Returns:
+            SchemaFingerprint: An instance of the SchemaFingerprint class.
+        """
+        return SchemaFingerprint(config, refresh_interval=AnswerCache.CACHE_CONFIG["schema_refresh_interval"])
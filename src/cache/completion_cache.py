@@ -0,0 +1,295 @@
+"""This module contains the CompletionCache class which records the LLM completions to disk and replays them in experiments and tests."""
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, AsyncGenerator
+from openai.types import CompletionUsage
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from semantic_kernel.contents.utils.finish_reason import FinishReason
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+COMPLETION_CACHE_MODES = ("passthrough", "record", "replay")
+
+
+class CompletionCacheMissError(Exception):
+    """Raised in replay mode when a completion was not recorded."""
+
+
+class CompletionCache:
+    """
+    This class stores the completions of the chat completion services in a local SQLite file.
+    Completions are keyed on the service id, the model deployment, the execution settings and
+    the messages of the prompt, so a completion is replayed only for the exact same request.
+
+    In `record` mode every completion is requested from the service and stored, in `replay`
+    mode the stored completions are returned without any network call and a missing one fails,
+    and in `passthrough` mode (the default) the cache is not used at all.
+    """
+    CACHE_CONFIG = {
+        "mode": os.getenv("COMPLETION_CACHE_MODE", "passthrough"),
+        "path": os.getenv("COMPLETION_CACHE_PATH", "completion_cache.sqlite.db"),
+    }
+
+    def __init__(self, path: str, mode: str = "record"):
+        """
+        Initializes the completion cache.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            mode (str): `record` or `replay`.
+
+        Raises:
+            ValueError: If the mode is unknown.
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown completion cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS completions (
+                    "key" TEXT PRIMARY KEY,
+                    "value" TEXT NOT NULL
+                )"""
+            )
+
+    @staticmethod
+    def get_key(
+        service_id: str | None,
+        ai_model_id: str | None,
+        settings: PromptExecutionSettings,
+        chat_history: ChatHistory,
+        streaming: bool = False,
+    ) -> str:
+        """
+        Computes the cache key of a request.
+
+        Args:
+            service_id (str | None): The ID of the chat completion service.
+            ai_model_id (str | None): The model deployment of the service.
+            settings (PromptExecutionSettings): The execution settings of the request.
+            chat_history (ChatHistory): The prompt.
+            streaming (bool): Whether the completion is streamed. The agents close a stream once the
+                action is complete, so a streamed completion may be cut short and is keyed apart.
+
+        Returns:
+            str: The cache key.
+        """
+        request = {
+            "service_id": service_id,
+            "ai_model_id": ai_model_id,
+            "settings": settings.model_dump(mode="json", exclude_none=True),
+            "messages": [
+                {"role": str(message.role.value), "name": message.name, "content": message.content}
+                for message in chat_history.messages
+            ],
+        }
+        if streaming:
+            request["streaming"] = True
+        return hashlib.sha256(
+            json.dumps(request, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def _to_dict(message: ChatMessageContent) -> dict:
+        """Serializes the parts of a completion read by the agents"""
+        usage = message.metadata.get("usage")
+        return {
+            "role": str(message.role.value),
+            "content": message.content,
+            "name": message.name,
+            "finish_reason": str(message.finish_reason.value) if message.finish_reason else None,
+            "ai_model_id": message.ai_model_id,
+            "usage": usage.model_dump() if isinstance(usage, CompletionUsage) else None,
+        }
+
+    @staticmethod
+    def _from_dict(value: dict) -> ChatMessageContent:
+        """Rebuilds a recorded completion"""
+        return ChatMessageContent(
+            role=AuthorRole(value["role"]),
+            content=value["content"],
+            name=value["name"],
+            finish_reason=FinishReason(value["finish_reason"]) if value["finish_reason"] else None,
+            ai_model_id=value["ai_model_id"],
+            metadata={"usage": CompletionUsage(**value["usage"])} if value["usage"] else {},
+        )
+
+    def get(self, key: str) -> list[ChatMessageContent] | None:
+        """
+        Gets a recorded completion.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            list[ChatMessageContent] | None: The recorded messages, None if missing.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT "value" FROM completions WHERE "key" = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return [self._from_dict(value) for value in json.loads(row[0])]
+
+    def set(self, key: str, messages: list[ChatMessageContent]) -> None:
+        """
+        Records a completion, replacing the previous one of the same request.
+
+        Args:
+            key (str): The cache key.
+            messages (list[ChatMessageContent]): The messages returned by the service.
+        """
+        value = json.dumps([self._to_dict(message) for message in messages])
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO completions ("key", "value") VALUES (?, ?)', (key, value)
+            )
+            self.recorded += 1
+
+    def close(self) -> None:
+        """Closes the SQLite database."""
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def get_completion_cache_from_environment() -> "CompletionCache | None":
+        """
+        Returns an instance of the CompletionCache class with the configuration details from the environment.
+
+        Raises:
+            ValueError: If the configured mode is unknown.
+
+        Returns:
+            CompletionCache | None: An instance of the CompletionCache class, None in passthrough mode.
+        """
+        config = CompletionCache.CACHE_CONFIG
+        mode = config["mode"].lower()
+        if mode == "passthrough":
+            return None
+        logger.info("[%s] Completions are %sed from %s.", CompletionCache.__name__, mode, config["path"])
+        return CompletionCache(config["path"], mode=mode)
+
+
+class CachedChatCompletion(ChatCompletionClientBase): # pylint: disable=abstract-method
+    """
+    A chat completion service recording the completions of the wrapped service in a
+    CompletionCache, or replaying them from it. It keeps the service id and the model of the
+    wrapped service, so the agents find it in the kernel as if it were the wrapped service.
+    """
+    chat_completion: ChatCompletionClientBase
+    cache: CompletionCache
+
+    @classmethod
+    def wrap(cls, chat_completion: ChatCompletionClientBase, cache: CompletionCache) -> "CachedChatCompletion":
+        """
+        Wraps a chat completion service.
+
+        Args:
+            chat_completion (ChatCompletionClientBase): The chat completion service.
+            cache (CompletionCache): The cache recording or replaying its completions.
+
+        Returns:
+            CachedChatCompletion: The wrapped service.
+        """
+        return cls(
+            service_id=chat_completion.service_id,
+            ai_model_id=chat_completion.ai_model_id,
+            chat_completion=chat_completion,
+            cache=cache,
+        )
+
+    def get_prompt_execution_settings_class(self) -> type[PromptExecutionSettings]:
+        return self.chat_completion.get_prompt_execution_settings_class()
+
+    def _get_key(self, chat_history: ChatHistory, settings: PromptExecutionSettings, streaming: bool = False) -> str:
+        """Computes the cache key of a request to the wrapped service"""
+        return CompletionCache.get_key(self.service_id, self.ai_model_id, settings, chat_history, streaming)
+
+    def _get_replayed(self, key: str) -> list[ChatMessageContent]:
+        """
+        Gets a recorded completion in replay mode.
+
+        Raises:
+            CompletionCacheMissError: If the completion was not recorded.
+        """
+        messages = self.cache.get(key)
+        if messages is None:
+            raise CompletionCacheMissError(
+                f"No completion recorded for service {self.service_id} with key {key}, record it first"
+            )
+        return messages
+
+    async def get_chat_message_contents(
+        self,
+        chat_history: ChatHistory,
+        settings: PromptExecutionSettings,
+        **kwargs: Any,
+    ) -> list[ChatMessageContent]:
+        key = self._get_key(chat_history, settings)
+        if self.cache.mode == "replay":
+            return self._get_replayed(key)
+        messages = await self.chat_completion.get_chat_message_contents(chat_history, settings, **kwargs)
+        self.cache.set(key, messages)
+        return messages
+
+    async def get_streaming_chat_message_contents(
+        self,
+        chat_history: ChatHistory,
+        settings: PromptExecutionSettings,
+        **kwargs: Any,
+    ) -> AsyncGenerator[list[StreamingChatMessageContent], Any]:
+        key = self._get_key(chat_history, settings, streaming=True)
+        if self.cache.mode == "replay":
+            for message in self._get_replayed(key):
+                yield [StreamingChatMessageContent(
+                    role=message.role,
+                    content=message.content,
+                    name=message.name,
+                    choice_index=0,
+                    finish_reason=message.finish_reason,
+                    ai_model_id=message.ai_model_id,
+                    metadata=message.metadata,
+                )]
+            return
+        # The agents close the stream once the action is complete, what was received until then is
+        # recorded. A stream failing midway (network error, timeout) is not recorded.
+        content = []
+        role = AuthorRole.ASSISTANT
+        try:
+            async for message_list in self.chat_completion.get_streaming_chat_message_contents(
+                chat_history, settings, **kwargs
+            ):
+                for message in message_list:
+                    if message.choice_index == 0:
+                        role = message.role or role
+                        content.append(message.content or "")
+                yield message_list
+        except GeneratorExit:
+            self._set_streamed(key, role, content)
+            raise
+        self._set_streamed(key, role, content)
+
+    def _set_streamed(self, key: str, role: AuthorRole, content: list[str]) -> None:
+        """Records the chunks received from a stream as a single completion"""
+        if content:
+            self.cache.set(key, [ChatMessageContent(
+                role=role, content="".join(content), ai_model_id=self.ai_model_id
+            )])
@@ -1,9 +1,14 @@
 """This module contains the implementation of the chat client for the group chat state flow."""
 import os
+import functools
+from openai import AsyncAzureOpenAI
 from semantic_kernel.agents import AgentGroupChat
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 from semantic_kernel.kernel import Kernel
+from src.cache.completion_cache import CachedChatCompletion, CompletionCache
+from src.agents.base import StateFlowBaseAgent
 from src.mysql.execution_env import SqlEnv
+from src.mysql.execution_env_pool import SqlEnvPool
 from src.agents.observe import AgentObserve
 from src.agents.error import AgentError
 from src.agents.verify import AgentVerify
@@ -13,6 +18,28 @@ from src.groupchat.state_flow_termination_strategy import StateFlowTerminationSt
 from src.groupchat.state_flow_selection_strategy import StateFlowSelectionStrategy
 
 
+def _create_chat_completion(
+    service_id: str, async_client: AsyncAzureOpenAI | None = None
+) -> AzureChatCompletion:
+    """
+    Creates a chat completion service.
+
+    Args:
+        service_id (str): The ID of the chat completion service.
+        async_client (AsyncAzureOpenAI | None): An existing client to share, a new one is created if None.
+
+    Returns:
+        AzureChatCompletion: The chat completion service.
+    """
+    if "AZURE_OPENAI_CHAT_DEPLOYMENT_NAME" not in os.environ:
+        return AzureChatCompletion(service_id=service_id, async_client=async_client)
+    return AzureChatCompletion(
+        service_id=service_id,
+        deployment_name=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        async_client=async_client,
+    )
+
+
 def _create_kernel_with_chat_completion(service_id: str) -> Kernel:
     """
     Creates a kernel with a chat completion service.
@@ -24,43 +51,68 @@ def _create_kernel_with_chat_completion(service_id: str) -> Kernel:
         Kernel: The kernel with the chat completion service.
     """
     kernel = Kernel()
-    if "AZURE_OPENAI_CHAT_DEPLOYMENT_NAME" not in os.environ:
-        kernel.add_service(AzureChatCompletion(service_id=service_id))
-    else:
-        kernel.add_service(
-            AzureChatCompletion(
-                service_id=service_id,
-                deployment_name=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-            )
-        )
+    kernel.add_service(_create_chat_completion(service_id))
     return kernel
 
 
-def get_chat_client(sql_executor_env: SqlEnv) -> AgentGroupChat:
+@functools.cache
+def get_shared_kernel() -> Kernel:
+    """
+    Gets the process-level kernel with one chat completion service per LLM agent.
+    All services share a single connection-pooled Azure OpenAI client, so it is built once per process.
+    When the completion cache is enabled, the services record or replay their completions.
+
+    Returns:
+        Kernel: The shared kernel.
+    """
+    kernel = Kernel()
+    async_client = None
+    completion_cache = CompletionCache.get_completion_cache_from_environment()
+    for service_id in (AgentObserve.name, AgentError.name, AgentVerify.name, AgentSelect.name):
+        chat_completion = _create_chat_completion(service_id, async_client=async_client)
+        if async_client is None:
+            async_client = chat_completion.client
+        if completion_cache is not None:
+            chat_completion = CachedChatCompletion.wrap(chat_completion, completion_cache)
+        kernel.add_service(chat_completion)
+    return kernel
+
+
+@functools.cache
+def get_state_flow_agents() -> tuple[StateFlowBaseAgent, ...]:
+    """
+    Gets the process-level LLM agents of the state flow.
+    The agents hold no conversation state, hence they are built once and shared by all chat clients.
+
+    Returns:
+        tuple[StateFlowBaseAgent, ...]: The observe, error, verify and select agents.
+    """
+    kernel = get_shared_kernel()
+    return (
+        AgentObserve(kernel=kernel).get_agent(),
+        AgentError(kernel=kernel).get_agent(),
+        AgentVerify(kernel=kernel).get_agent(),
+        AgentSelect(kernel=kernel).get_agent(),
+    )
+
+
+def get_chat_client(sql_executor_env: SqlEnv, sql_executor_env_pool: SqlEnvPool | None = None) -> AgentGroupChat:
     """
     Gets the chat client for the group chat state flow.
+    Only the executor agent and the strategies are created per conversation.
     
     Args:
         sql_executor_env (SqlEnv): The SQL execution environment.
+        sql_executor_env_pool (SqlEnvPool | None): The pool the candidate SQL commands are executed on concurrently.
         
     Returns:
         AgentGroupChat: The chat client for the group chat state flow.
     """
-    agent_observe = AgentObserve(
-        kernel=_create_kernel_with_chat_completion("observe")
-    ).get_agent()
-    agent_error = AgentError(
-        kernel=_create_kernel_with_chat_completion("error")
-    ).get_agent()
-    agent_verify = AgentVerify(
-        kernel=_create_kernel_with_chat_completion("verify")
-    ).get_agent()
-    agent_select = AgentSelect(
-        kernel=_create_kernel_with_chat_completion("select")
-    ).get_agent()
+    agent_observe, agent_error, agent_verify, agent_select = get_state_flow_agents()
     agent_execute = AgentExecute(
         sql_executor_env=sql_executor_env,
-        kernel=_create_kernel_with_chat_completion("execute"),
+        kernel=get_shared_kernel(),
+        sql_executor_env_pool=sql_executor_env_pool,
     ).get_agent()
 
     selection_strategy = StateFlowSelectionStrategy()
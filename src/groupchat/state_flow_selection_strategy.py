@@ -1,24 +1,28 @@
 """This module contains the StateFlowSelectionStrategy class, 
 which is responsible for selecting the next agent based on the current state of the conversation flow."""
 import logging
+from typing import Any
+from pydantic import Field
 from semantic_kernel.agents.strategies.selection.selection_strategy import (
     SelectionStrategy,
 )
 from semantic_kernel.agents import Agent
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
-from semantic_kernel.contents.utils.author_role import AuthorRole
-from src.agents.observe import AgentObserve
-from src.agents.select import AgentSelect
-from src.agents.verify import AgentVerify
-from src.agents.error import AgentError
-from src.agents.execute import AgentExecute
-from src.utils.constants import Constants
+from src.groupchat.state_graph import StateGraph, get_state_flow_graph
+from src.logging.tracing import tracer, STATE_ATTRIBUTE, ITERATION_ATTRIBUTE
 
 logger: logging.Logger = logging.getLogger(__name__)
 
 
 class StateFlowSelectionStrategy(SelectionStrategy):
-    """StateFlowSelectionStrategy is a specialized selection strategy for selecting the next agent based on the current state of the conversation flow."""
+    """
+    StateFlowSelectionStrategy is a specialized selection strategy for selecting the next agent based on the current state of the conversation flow.
+    The transitions are looked up in the compiled state graph, and the agents in an index by name built once per list of agents.
+    """
+    state_graph: StateGraph = Field(default_factory=get_state_flow_graph)
+    # The list of agents, its length and the index by name, a plain field since the private attributes of pydantic are slow to read
+    agent_index: Any = Field(default=None, exclude=True)
+
     async def next(
         self, agents: list[Agent], history: list[ChatMessageContent]
     ) -> Agent:
@@ -35,42 +39,50 @@ class StateFlowSelectionStrategy(SelectionStrategy):
         Returns:
             Agent: The next agent to invoke.
         """
-        last_message = history[-1].content
-        last_speaker = history[-1].name
+        with tracer.start_as_current_span(
+            "state_flow.select_next",
+            attributes={STATE_ATTRIBUTE: history[-1].name or history[-1].role.value, ITERATION_ATTRIBUTE: len(history)},
+        ) as span:
+            agent = self._select_next(agents, history)
+            span.set_attribute("state_flow.next_state", agent.name)
+            return agent
+
+    def _get_agent(self, agents: list[Agent], name: str) -> Agent:
+        """
+        Finds an agent by name, the index is rebuilt when the list of agents changes.
 
-        # From user it will always go to observe
-        if history[-1].role.value == AuthorRole.USER:
-            return [agent for agent in agents if agent.name == AgentObserve.name][0]
-        # It's always M->E aka Model->Execute, means after each LLM Agent it will go to Execute
-        if last_speaker != AgentExecute.name:
-            return [agent for agent in agents if agent.name == AgentExecute.name][0]
-        # If the last message is None or contains the SQL error message, it will go to the Error Agent
-        if last_message is None or Constants.sql_error_message in last_message:
-            return [agent for agent in agents if agent.name == AgentError.name][0]
+        Args:
+            agents (list[Agent]): The list of agents to select from.
+            name (str): The name of the agent.
 
-        # Retrieve the last action and state
-        last_action = history[-2].content.split(Constants.action_identifier)[-1].strip()
-        last_action = last_action.replace("\n", "")
-        last_state = history[-2].name
+        Raises:
+            ValueError: If no agent has the name.
+
+        Returns:
+            Agent: The first agent with the name.
+        """
+        if self.agent_index is None or self.agent_index[0] is not agents or self.agent_index[1] != len(agents):
+            agents_by_name = {}
+            for agent in agents:
+                agents_by_name.setdefault(agent.name, agent)
+            self.agent_index = (agents, len(agents), agents_by_name)
+        agent = self.agent_index[2].get(name)
+        if agent is None:
+            raise ValueError(f"No agent for the state {name} in the group chat")
+        return agent
+
+    def _select_next(self, agents: list[Agent], history: list[ChatMessageContent]) -> Agent:
+        """
+        Applies the state transitions to the last messages of the conversation.
 
-        # State-specific selection criteria
-        # If the last state is Observe, it will go to Select, if no error
-        if last_state == AgentObserve.name: # pylint: disable=no-else-return
-            return [agent for agent in agents if agent.name == AgentSelect.name][0]
-        # If the last state is Select, it will go to Verify if the last SQL Query is SELECT, else it will go back to Select
-        elif last_state == AgentSelect.name:
-            if Constants.execute_select in last_action:
-                return [agent for agent in agents if agent.name == AgentVerify.name][0]
-            return [agent for agent in agents if agent.name == AgentSelect.name][0]
-        # If the last state is Verify, it will go to Verify if the last SQL Query is SELECT, else it will go back to Select
-        elif last_state == AgentVerify.name:
-            if Constants.execute_select in last_action:
-                return [agent for agent in agents if agent.name == AgentVerify.name][0]
-            return [agent for agent in agents if agent.name == AgentSelect.name][0]
-        # If the last state is Error, it will go to Verify if the last SQL Query is SELECT, else it will go back to Select
-        elif last_state == AgentError.name:
-            if Constants.execute_select in last_action:
-                return [agent for agent in agents if agent.name == AgentVerify.name][0]
-            return [agent for agent in agents if agent.name == AgentSelect.name][0]
-        else:
-            raise ValueError(f"Unknown state in state flow: {last_state}")
+        Args:
+            agents (list[Agent]): The list of agents to select from.
+            history (list[ChatMessageContent]): The chat history to use for selection.
+
+        Raises:
+            ValueError: If an unknown state is encountered in the conversation flow.
+
+        Returns:
+            Agent: The next agent to invoke.
+        """
+        return self._get_agent(agents, self.state_graph.get_next_state(history))
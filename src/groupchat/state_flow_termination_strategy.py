@@ -1,6 +1,7 @@
 """This module contains the StateFlowTerminationStrategy class, which is a subclass of TerminationStrategy.
 It is used to determine when to terminate a conversation based on the state of the conversation flow."""
 import logging
+from pydantic import Field
 from semantic_kernel.agents.agent import Agent
 from semantic_kernel.agents.strategies.termination.termination_strategy import (
     TerminationStrategy,
@@ -8,8 +9,8 @@ from semantic_kernel.agents.strategies.termination.termination_strategy import (
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
 from semantic_kernel.contents.utils.finish_reason import FinishReason
 from src.utils.constants import Constants
-from src.agents.verify import AgentVerify
-from src.agents.select import AgentSelect
+from src.groupchat.state_graph import StateGraph, get_state_flow_graph
+from src.logging.metrics import state_flow_metrics
 
 logger: logging.Logger = logging.getLogger(__name__)
 
@@ -17,6 +18,7 @@ logger: logging.Logger = logging.getLogger(__name__)
 class StateFlowTerminationStrategy(TerminationStrategy): # pylint: disable=abstract-method
     """StateFlowTerminationStrategy is a specialized termination strategy for determining when to terminate a conversation based on the state of the conversation flow."""
     maximum_iterations: int = Constants.maximum_iterations
+    state_graph: StateGraph = Field(default_factory=get_state_flow_graph)
 
     async def should_terminate(
         self, agent: "Agent", history: list["ChatMessageContent"]
@@ -40,26 +42,18 @@ class StateFlowTerminationStrategy(TerminationStrategy): # pylint: disable=abstr
         # Standard termination criteria
         if len(history) >= self.maximum_iterations:
             history[-1].finish_reason = FinishReason.LENGTH
+            state_flow_metrics.record_termination(len(history), "max_iterations")
             return True
         if history[-1].content == Constants.terminate_text:
             history[-1].finish_reason = FinishReason.STOP
+            state_flow_metrics.record_termination(len(history), "terminate")
             return True
 
-        # State-specific termination criteria
-        if len(history) >= 2:
-            last_action = (
-                history[-2].content.split(Constants.action_identifier)[-1].strip()
-            )
-            last_action = last_action.replace("\n", "")
-            last_state = history[-2].name
-            if last_state == AgentSelect.name:
-                if Constants.action_submit in last_action:
-                    history[-1].finish_reason = FinishReason.STOP
-                    return True
-            elif last_state == AgentVerify.name:
-                if Constants.action_submit in last_action:
-                    history[-1].finish_reason = FinishReason.STOP
-                    return True
+        # State-specific termination criteria, the action is parsed once for both strategies
+        if self.state_graph.is_final(history):
+            history[-1].finish_reason = FinishReason.STOP
+            state_flow_metrics.record_termination(len(history), "submit")
+            return True
 
         # Default termination criteria
         if self.agents and not any(a.id == agent.id for a in self.agents):
@@ -0,0 +1,147 @@
+"""This module contains the StateGraph class, the state machine of the state flow compiled into a transition table."""
+import functools
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from src.agents.observe import AgentObserve
+from src.agents.select import AgentSelect
+from src.agents.verify import AgentVerify
+from src.agents.error import AgentError
+from src.agents.execute import AgentExecute
+from src.utils.constants import Constants
+
+ANY_ACTION = "*"
+ACTION_TYPES = ("select", "execute", "submit", "other")
+
+# The question of the user goes to the initial state and every LLM state is followed by the tool
+# state, which executes its action. A failed execution goes to the error state, otherwise the next
+# state depends on the LLM state and on the type of its action (`*` matches any type).
+# The conversation ends after the final actions of a state.
+STATE_FLOW_GRAPH = {
+    "initial_state": AgentObserve.name,
+    "tool_state": AgentExecute.name,
+    "error_state": AgentError.name,
+    "transitions": {
+        AgentObserve.name: {ANY_ACTION: AgentSelect.name},
+        AgentSelect.name: {"select": AgentVerify.name, ANY_ACTION: AgentSelect.name},
+        AgentVerify.name: {"select": AgentVerify.name, ANY_ACTION: AgentSelect.name},
+        AgentError.name: {"select": AgentVerify.name, ANY_ACTION: AgentSelect.name},
+    },
+    "final_actions": {
+        AgentSelect.name: ["submit"],
+        AgentVerify.name: ["submit"],
+    },
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_action(content: str | None) -> tuple[str, str]:
+    """
+    Parses the last action of an agent message. The selection and the termination strategies read
+    the same message at every turn, so it is parsed once and cached by content.
+
+    Args:
+        content (str | None): The content of the message.
+
+    Returns:
+        tuple[str, str]: The action and its type, one of ACTION_TYPES.
+    """
+    if not isinstance(content, str):
+        return "", "other"
+    action = content.split(Constants.action_identifier)[-1].strip().replace("\n", "")
+    if Constants.execute_select in action:
+        return action, "select"
+    if action.startswith("execute["):
+        return action, "execute"
+    if Constants.action_submit in action:
+        return action, "submit"
+    return action, "other"
+
+
+class StateGraph:
+    """
+    This class compiles a declarative state graph, like STATE_FLOW_GRAPH, into a transition table
+    indexed by the state and the action type, so the next state is found with one lookup. A new
+    state is added to the flow by adding its transitions to the graph and its agent to the chat.
+    """
+
+    def __init__(self, graph: dict):
+        """
+        Compiles the state graph.
+
+        Args:
+            graph (dict): The initial, tool and error states, the transitions by state and action
+                type, and the final action types by state.
+
+        Raises:
+            ValueError: If a transition uses an unknown action type.
+        """
+        self.initial_state: str = graph["initial_state"]
+        self.tool_state: str = graph["tool_state"]
+        self.error_state: str = graph["error_state"]
+        self.transitions: dict[tuple[str, str], str] = {}
+        for state, guards in graph["transitions"].items():
+            unknown = set(guards) - {ANY_ACTION, *ACTION_TYPES}
+            if unknown:
+                raise ValueError(f"Unknown action types in the transitions of {state}: {sorted(unknown)}")
+            for action_type in ACTION_TYPES:
+                next_state = guards.get(action_type, guards.get(ANY_ACTION))
+                if next_state is not None:
+                    self.transitions[(state, action_type)] = next_state
+        self.final_actions: set[tuple[str, str]] = {
+            (state, action_type)
+            for state, action_types in graph["final_actions"].items()
+            for action_type in action_types
+        }
+
+    def get_next_state(self, history: list[ChatMessageContent]) -> str:
+        """
+        Finds the next state of the conversation.
+
+        Args:
+            history (list[ChatMessageContent]): The chat history.
+
+        Raises:
+            ValueError: If there is no transition from the last state.
+
+        Returns:
+            str: The name of the next state.
+        """
+        last_message = history[-1]
+        if last_message.role == AuthorRole.USER:
+            return self.initial_state
+        if last_message.name != self.tool_state:
+            return self.tool_state
+        if last_message.content is None or Constants.sql_error_message in last_message.content:
+            return self.error_state
+        state = history[-2].name
+        _, action_type = parse_action(history[-2].content)
+        next_state = self.transitions.get((state, action_type))
+        if next_state is None:
+            raise ValueError(f"Unknown state in state flow: {state}")
+        return next_state
+
+    def is_final(self, history: list[ChatMessageContent]) -> bool:
+        """
+        Whether the last LLM state ended the conversation with a final action.
+
+        Args:
+            history (list[ChatMessageContent]): The chat history.
+
+        Returns:
+            bool: True if the message before the last one holds a final action of its state.
+        """
+        if len(history) < 2:
+            return False
+        _, action_type = parse_action(history[-2].content)
+        return (history[-2].name, action_type) in self.final_actions
+
+
+@functools.cache
+def get_state_flow_graph() -> StateGraph:
+    """
+    Gets the compiled state graph of the state flow, it is compiled once per process.
+
+    Returns:
+        StateGraph: The compiled STATE_FLOW_GRAPH.
+    """
+    return StateGraph(STATE_FLOW_GRAPH)
@@ -0,0 +1,121 @@
+"""This module contains the OpenTelemetry metrics instruments of the state flow conversation."""
+from typing import Any
+from opentelemetry import metrics
+from opentelemetry.metrics import Meter
+from src.utils.constants import Constants
+
+METER_NAME = "state_flow"
+
+
+class StateFlowMetrics: # pylint: disable=too-many-instance-attributes
+    """
+    The instruments recording the latency, token usage and SQL execution of every state, and the
+    length and termination reason of every conversation. All instrument names start with
+    `state_flow` so they are kept by the metrics views of the telemetry setup.
+    """
+
+    def __init__(self, meter: Meter):
+        """
+        Creates the instruments.
+
+        Args:
+            meter (Meter): The meter creating the instruments.
+        """
+        self.llm_duration = meter.create_histogram(
+            "state_flow.llm.duration", unit="ms", description="Duration of the LLM call of a state"
+        )
+        self.llm_prompt_tokens = meter.create_histogram(
+            "state_flow.llm.prompt_tokens", unit="{token}", description="Prompt tokens of the LLM call of a state"
+        )
+        self.llm_completion_tokens = meter.create_histogram(
+            "state_flow.llm.completion_tokens", unit="{token}", description="Completion tokens of the LLM call of a state"
+        )
+        self.llm_output_fallbacks = meter.create_counter(
+            "state_flow.llm.output_fallbacks", unit="{reply}",
+            description="LLM replies read in another format than the one asked for, by format",
+        )
+        self.sql_duration = meter.create_histogram(
+            "state_flow.sql.duration", unit="ms", description="Duration of the SQL execution"
+        )
+        self.sql_rows = meter.create_histogram(
+            "state_flow.sql.rows", unit="{row}", description="Rows fetched by the SQL execution"
+        )
+        self.observation_truncations = meter.create_counter(
+            "state_flow.observation.truncations", unit="{observation}",
+            description="Observations cut to fit the context window",
+        )
+        self.conversation_iterations = meter.create_histogram(
+            "state_flow.conversation.iterations", unit="{message}", description="Messages of a terminated conversation"
+        )
+        self.conversation_terminations = meter.create_counter(
+            "state_flow.conversation.terminations", unit="{conversation}",
+            description="Terminated conversations by termination reason",
+        )
+
+    def record_llm_call(self, state: str, duration_ms: float, usage: Any = None) -> None:
+        """
+        Records the LLM call of a state.
+
+        Args:
+            state (str): The name of the agent.
+            duration_ms (float): The duration of the call.
+            usage (Any): The token usage reported by the service, if any.
+        """
+        attributes = {"state": state}
+        self.llm_duration.record(duration_ms, attributes)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if prompt_tokens is not None:
+            self.llm_prompt_tokens.record(prompt_tokens, attributes)
+        if completion_tokens is not None:
+            self.llm_completion_tokens.record(completion_tokens, attributes)
+
+    def record_output_fallback(self, state: str, output_format: str) -> None:
+        """
+        Records an LLM reply that did not follow the format the agent asked for.
+
+        Args:
+            state (str): The name of the agent.
+            output_format (str): The format the reply was read in, e.g. "text", "lenient" or "missing".
+        """
+        self.llm_output_fallbacks.add(1, {"state": state, "format": output_format})
+
+    def record_sql_execution(self, state: str, duration_ms: float, observation: Any) -> None:
+        """
+        Records the SQL execution of a state.
+
+        Args:
+            state (str): The name of the agent that issued the action, e.g. select or verify.
+            duration_ms (float): The duration of the execution.
+            observation (Any): The fetched rows, or the error message.
+        """
+        is_error = isinstance(observation, str) and observation.startswith(Constants.sql_error_message)
+        attributes = {"state": state, "error": is_error}
+        self.sql_duration.record(duration_ms, attributes)
+        if isinstance(observation, list):
+            self.sql_rows.record(len(observation), {"state": state})
+
+    def record_observation_truncation(self, state: str, kind: str) -> None:
+        """
+        Records an observation cut to fit the context window.
+
+        Args:
+            state (str): The name of the agent.
+            kind (str): "rows" or "chars".
+        """
+        self.observation_truncations.add(1, {"state": state, "kind": kind})
+
+    def record_termination(self, iterations: int, reason: str) -> None:
+        """
+        Records the end of a conversation.
+
+        Args:
+            iterations (int): The number of messages of the conversation.
+            reason (str): Why the conversation ended, e.g. "submit", "terminate" or "max_iterations".
+        """
+        self.conversation_iterations.record(iterations, {"reason": reason})
+        self.conversation_terminations.add(1, {"reason": reason})
+
+
+# The API meter is a proxy until the meter provider is set up, the instruments follow it
+state_flow_metrics = StateFlowMetrics(metrics.get_meter(METER_NAME))
@@ -0,0 +1,34 @@
+"""This module contains the lazy formatting of the payloads written to the logs."""
+from typing import Any
+
+
+class LogPayload:
+    """
+    A logging argument formatting its value only when the log record is emitted, and cutting
+    it to the maximum number of characters, so the observations and answers are neither
+    formatted when their level is disabled nor written in full to the logs.
+    """
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: int | None):
+        """
+        Initializes the payload.
+
+        Args:
+            value (Any): The logged value.
+            max_chars (int | None): The maximum number of characters logged, no limit if None or 0.
+        """
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        """
+        Formats the value.
+
+        Returns:
+            str: The value, cut to the maximum number of characters with the length of the full value.
+        """
+        text = str(self.value)
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[: self.max_chars]}... [{len(text)} chars]"
+        return text
@@ -0,0 +1,120 @@
+"""This module contains the tail-based sampling of the traces, which keeps the slow, failed and debugged conversations in full."""
+import threading
+from collections import OrderedDict
+from typing import Optional
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+# Set on a span of a trace to always keep the trace, e.g. by the per-request debug header of the API
+DEBUG_ATTRIBUTE = "state_flow.debug"
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Buffers the spans of every trace until its local root span ends, and only then passes the
+    whole trace to the exporting span processors, if the trace has an error, was slower than the
+    threshold, was flagged for debugging, or falls in the sampled ratio of the other traces.
+
+    The buffer holds at most `max_traces` traces, the oldest incomplete trace is dropped when
+    it is full, and the spans ending after their root follow the decision taken for the trace.
+    """
+
+    def __init__(
+        self,
+        span_processors: list[SpanProcessor],
+        sample_ratio: float,
+        slow_threshold_millis: float,
+        max_traces: int = 1024,
+    ):
+        """
+        Initializes the processor.
+
+        Args:
+            span_processors (list[SpanProcessor]): The processors exporting the kept traces.
+            sample_ratio (float): The share of the other traces that is kept, by trace id.
+            slow_threshold_millis (float): The duration of the root span from which a trace is kept.
+            max_traces (int): The maximum number of traces buffered, and of decisions remembered.
+        """
+        self.span_processors = span_processors
+        self.sample_bound = TraceIdRatioBased.get_bound_for_rate(sample_ratio)
+        self.slow_threshold_nanos = slow_threshold_millis * 1_000_000
+        self.max_traces = max_traces
+        self.traces: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self.decisions: OrderedDict[int, bool] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        """
+        Forwards the start of the span to the exporting processors.
+
+        Args:
+            span (Span): The started span.
+            parent_context (Optional[Context]): The parent context of the span.
+        """
+        for span_processor in self.span_processors:
+            span_processor.on_start(span, parent_context=parent_context)
+
+    def _is_kept(self, spans: list[ReadableSpan], root: ReadableSpan) -> bool:
+        """
+        Decides whether a trace is exported.
+
+        Args:
+            spans (list[ReadableSpan]): The ended spans of the trace.
+            root (ReadableSpan): The local root span of the trace.
+
+        Returns:
+            bool: Whether the trace is kept.
+        """
+        if any(span.status.status_code == StatusCode.ERROR or span.attributes.get(DEBUG_ATTRIBUTE) for span in spans):
+            return True
+        if root.end_time - root.start_time >= self.slow_threshold_nanos:
+            return True
+        return root.context.trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self.sample_bound
+
+    def on_end(self, span: ReadableSpan) -> None:
+        """
+        Buffers the span, and decides on its trace when it is the local root span.
+
+        Args:
+            span (ReadableSpan): The ended span.
+        """
+        trace_id = span.context.trace_id
+        with self.lock:
+            if trace_id in self.decisions:
+                spans, is_kept = [span], self.decisions[trace_id]
+            else:
+                self.traces.setdefault(trace_id, []).append(span)
+                if span.parent is not None and not span.parent.is_remote:
+                    if len(self.traces) > self.max_traces:
+                        self.traces.popitem(last=False)
+                    return
+                spans = self.traces.pop(trace_id)
+                is_kept = self._is_kept(spans, span)
+                self.decisions[trace_id] = is_kept
+                if len(self.decisions) > self.max_traces:
+                    self.decisions.popitem(last=False)
+        if is_kept:
+            for buffered_span in spans:
+                for span_processor in self.span_processors:
+                    span_processor.on_end(buffered_span)
+
+    def shutdown(self) -> None:
+        """Drops the incomplete traces and shuts the exporting processors down."""
+        with self.lock:
+            self.traces.clear()
+        for span_processor in self.span_processors:
+            span_processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """
+        Flushes the exporting processors, the incomplete traces stay buffered.
+
+        Args:
+            timeout_millis (int): The maximum time to wait for each processor.
+
+        Returns:
+            bool: False if a processor timed out, True otherwise.
+        """
+        return all(span_processor.force_flush(timeout_millis) for span_processor in self.span_processors)
@@ -1,5 +1,9 @@
 """This module contains the OpenTelemetry telemetry setup for logging, tracing, and metrics."""
+import os
 import logging
+import importlib
+import threading
+from typing import Any
 from azure.monitor.opentelemetry.exporter import (
     AzureMonitorLogExporter,
     AzureMonitorMetricExporter,
@@ -8,77 +12,387 @@ from azure.monitor.opentelemetry.exporter import (
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.metrics import set_meter_provider
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
+from opentelemetry.sdk._logs.export import BatchLogRecordProcessor, ConsoleLogExporter
 from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
 from opentelemetry.sdk.metrics.view import DropAggregation, View
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, Sampler, TraceIdRatioBased
 from opentelemetry.semconv.resource import ResourceAttributes
 from opentelemetry.trace import set_tracer_provider
+from src.logging.metrics import METER_NAME
+from src.logging.sampling import TailSamplingSpanProcessor
+
+TELEMETRY_EXPORTERS = ("azure", "console", "otlp", "file")
+
+
+def get_telemetry_config_from_environment() -> dict:
+    """
+    Reads the telemetry configuration from the environment variables. The exporters default to
+    Azure Monitor when an Application Insights connection string is set, and to none otherwise.
+
+    Raises:
+        ValueError: If an unknown exporter is configured, the Azure Monitor one without connection string,
+            or a trace sample ratio below 1 with tail sampling.
+
+    Returns:
+        dict: The telemetry configuration.
+    """
+    connection_string = os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING", None)
+    exporters = os.getenv("TELEMETRY_EXPORTER", "azure" if connection_string else "none")
+    exporters = [exporter.strip() for exporter in exporters.lower().split(",") if exporter.strip() not in ("", "none")]
+    for exporter in exporters:
+        if exporter not in TELEMETRY_EXPORTERS:
+            raise ValueError(f"Unknown telemetry exporter: {exporter}, expected one of {TELEMETRY_EXPORTERS}")
+    if "azure" in exporters and not connection_string:
+        raise ValueError("The azure telemetry exporter requires APPLICATIONINSIGHTS_CONNECTION_STRING")
+    config = {
+        "exporters": exporters,
+        "connection_string": connection_string,
+        "file_path": os.getenv("TELEMETRY_FILE_PATH", "telemetry"),
+        "file_max_bytes": int(os.getenv("TELEMETRY_FILE_MAX_BYTES", str(10 * 1024 * 1024))),
+        "file_backup_count": int(os.getenv("TELEMETRY_FILE_BACKUP_COUNT", "5")),
+        "max_queue_size": int(os.getenv("TELEMETRY_MAX_QUEUE_SIZE", "2048")),
+        "max_export_batch_size": int(os.getenv("TELEMETRY_MAX_EXPORT_BATCH_SIZE", "512")),
+        "schedule_delay_millis": float(os.getenv("TELEMETRY_SCHEDULE_DELAY_MILLIS", "5000")),
+        "metric_export_interval_millis": float(os.getenv("TELEMETRY_METRIC_EXPORT_INTERVAL_MILLIS", "5000")),
+        "trace_sample_ratio": float(os.getenv("TELEMETRY_TRACE_SAMPLE_RATIO", "1.0")),
+        "tail_sampling": os.getenv("TELEMETRY_TAIL_SAMPLING", "false").lower() == "true",
+        "tail_sample_ratio": float(os.getenv("TELEMETRY_TAIL_SAMPLE_RATIO", "0.1")),
+        "tail_slow_threshold_millis": float(os.getenv("TELEMETRY_TAIL_SLOW_THRESHOLD_MILLIS", "10000")),
+        "tail_max_traces": int(os.getenv("TELEMETRY_TAIL_MAX_TRACES", "1024")),
+        "log_level": os.getenv("LOG_LEVEL", "INFO").upper(),
+        "log_max_payload_chars": int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "500")),
+        "log_debug_header": os.getenv("LOG_DEBUG_HEADER", "false").lower() == "true",
+    }
+    if config["tail_sampling"] and config["trace_sample_ratio"] < 1:
+        # The traces dropped at their start never reach the tail sampling, slow or failed ones included
+        raise ValueError("TELEMETRY_TAIL_SAMPLING requires TELEMETRY_TRACE_SAMPLE_RATIO=1.0")
+    return config
+
+
+class RotatingJsonLinesFile:
+    """
+    A text stream writing one JSON document per line to a file, which is rotated once it reaches
+    its maximum size, the rotated files are suffixed with `.1` (the newest) to `.<backup_count>`.
+    It is the output of the console exporters, so the telemetry can be kept offline.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        """
+        Opens the file in append mode.
+
+        Args:
+            path (str): The path of the file.
+            max_bytes (int): The size the file is rotated at.
+            backup_count (int): The number of rotated files kept.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8") # pylint: disable=consider-using-with
+
+    def _rotate(self) -> None:
+        """Shifts the rotated files and starts a new file."""
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8") # pylint: disable=consider-using-with
+
+    def write(self, text: str) -> int:
+        """
+        Writes the text, after rotating the file if the text does not fit in it.
+
+        Args:
+            text (str): The JSON lines to write.
+
+        Returns:
+            int: The number of characters written.
+        """
+        with self.lock:
+            size = self.file.tell()
+            if size > 0 and 0 < self.max_bytes < size + len(text):
+                self._rotate()
+            return self.file.write(text)
+
+    def flush(self) -> None:
+        """Flushes the file."""
+        with self.lock:
+            self.file.flush()
+
+    def close(self) -> None:
+        """Closes the file."""
+        with self.lock:
+            self.file.close()
+
+
+def _get_json_line(item: Any) -> str:
+    """
+    Formats a span, log record or metrics batch as a single JSON line.
+
+    Args:
+        item (Any): The telemetry item, it has a `to_json` method.
+
+    Returns:
+        str: The JSON line.
+    """
+    return item.to_json(indent=None) + os.linesep
+
+
+def _get_file(config: dict, signal: str) -> RotatingJsonLinesFile:
+    """
+    Opens the rotating file of a signal.
+
+    Args:
+        config (dict): The telemetry configuration.
+        signal (str): "traces", "metrics" or "logs".
+
+    Returns:
+        RotatingJsonLinesFile: The file the signal is written to.
+    """
+    return RotatingJsonLinesFile(
+        os.path.join(config["file_path"], f"{signal}.jsonl"),
+        config["file_max_bytes"],
+        config["file_backup_count"],
+    )
+
+
+def _import_otlp_exporter(module_name: str, class_name: str) -> Any:
+    """
+    Imports an OTLP exporter, the OTLP package is only required when this exporter is selected.
+    The endpoint and headers are read by the exporter from the standard `OTEL_EXPORTER_OTLP_*` variables.
+
+    Args:
+        module_name (str): The exporter module of the signal, "trace_exporter", "metric_exporter" or "_log_exporter".
+        class_name (str): The name of the exporter class.
+
+    Raises:
+        ImportError: If the OTLP exporter package is not installed.
+
+    Returns:
+        Any: The exporter class.
+    """
+    try:
+        module = importlib.import_module(f"opentelemetry.exporter.otlp.proto.http.{module_name}")
+    except ImportError as err:
+        raise ImportError(
+            "The otlp telemetry exporter requires opentelemetry-exporter-otlp-proto-http, "
+            "install it with `pip install opentelemetry-exporter-otlp-proto-http`"
+        ) from err
+    return getattr(module, class_name)
+
+
+def _get_span_exporters(config: dict) -> list:
+    """
+    Get the span exporters of the configured exporters.
+
+    Args:
+        config (dict): The telemetry configuration.
+
+    Returns:
+        list: The span exporters.
+    """
+    exporters = []
+    for exporter in config["exporters"]:
+        if exporter == "azure":
+            exporters.append(AzureMonitorTraceExporter(connection_string=config["connection_string"]))
+        elif exporter == "console":
+            exporters.append(ConsoleSpanExporter())
+        elif exporter == "otlp":
+            exporters.append(_import_otlp_exporter("trace_exporter", "OTLPSpanExporter")())
+        elif exporter == "file":
+            exporters.append(ConsoleSpanExporter(out=_get_file(config, "traces"), formatter=_get_json_line))
+    return exporters
+
+
+def _get_log_exporters(config: dict) -> list:
+    """
+    Get the log exporters of the configured exporters.
+
+    Args:
+        config (dict): The telemetry configuration.
+
+    Returns:
+        list: The log exporters.
+    """
+    exporters = []
+    for exporter in config["exporters"]:
+        if exporter == "azure":
+            exporters.append(AzureMonitorLogExporter(connection_string=config["connection_string"]))
+        elif exporter == "console":
+            exporters.append(ConsoleLogExporter())
+        elif exporter == "otlp":
+            exporters.append(_import_otlp_exporter("_log_exporter", "OTLPLogExporter")())
+        elif exporter == "file":
+            exporters.append(ConsoleLogExporter(out=_get_file(config, "logs"), formatter=_get_json_line))
+    return exporters
+
+
+def _get_metric_exporters(config: dict) -> list:
+    """
+    Get the metric exporters of the configured exporters.
+
+    Args:
+        config (dict): The telemetry configuration.
+
+    Returns:
+        list: The metric exporters.
+    """
+    exporters = []
+    for exporter in config["exporters"]:
+        if exporter == "azure":
+            exporters.append(AzureMonitorMetricExporter(connection_string=config["connection_string"]))
+        elif exporter == "console":
+            exporters.append(ConsoleMetricExporter())
+        elif exporter == "otlp":
+            exporters.append(_import_otlp_exporter("metric_exporter", "OTLPMetricExporter")())
+        elif exporter == "file":
+            exporters.append(ConsoleMetricExporter(out=_get_file(config, "metrics"), formatter=_get_json_line))
+    return exporters
 
 
 def _get_resource() -> Resource:
     """
     Get the resource to use for logging, tracing, and metrics.
-    
+
     Returns:
         Resource: The resource to use.
     """
     return Resource.create({ResourceAttributes.SERVICE_NAME: "contoso.mysql_copilot"})
 
 
-def set_up_logging(connection_string: str, resource: Resource = _get_resource()):
+def set_up_logging(config: dict, resource: Resource = _get_resource()):
     """
-    Set up logging with Azure Monitor.
-    
+    Set up logging with the configured exporters.
+
     Args:
-        connection_string (str): The Azure Monitor connection string.
+        config (dict): The telemetry configuration.
         resource (Resource): The resource to use for logging.
     """
-    exporter = AzureMonitorLogExporter(connection_string=connection_string)
     logger_provider = LoggerProvider(resource=resource)
-    logger_provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
+    for exporter in _get_log_exporters(config):
+        logger_provider.add_log_record_processor(BatchLogRecordProcessor(
+            exporter,
+            schedule_delay_millis=config["schedule_delay_millis"],
+            max_export_batch_size=config["max_export_batch_size"],
+            max_queue_size=config["max_queue_size"],
+        ))
     set_logger_provider(logger_provider)
     handler = LoggingHandler()
     handler.addFilter(logging.Filter("semantic_kernel"))
     logger = logging.getLogger()
     logger.addHandler(handler)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(config["log_level"])
 
 
-def set_up_tracing(connection_string: str, resource: Resource = _get_resource()):
+def _get_sampler(config: dict) -> Sampler:
     """
-    Set up tracing with Azure Monitor.
-    
+    Get the head sampler of the traces.
+
     Args:
-        connection_string (str): The Azure Monitor connection string.
+        config (dict): The telemetry configuration.
+
+    Returns:
+        Sampler: Samples the traces by trace id with the configured ratio, and the child spans follow the
+        decision of their parent. With tail sampling every trace is recorded, whatever the caller decided,
+        so the tail sampling sees all the slow, failed and debugged ones.
+    """
+    if config["tail_sampling"]:
+        return ALWAYS_ON
+    return ParentBased(TraceIdRatioBased(config["trace_sample_ratio"]))
+
+
+def set_up_tracing(config: dict, resource: Resource = _get_resource()):
+    """
+    Set up tracing with the configured exporters. The traces are sampled by trace id with the
+    configured ratio, and the child spans follow the decision of their parent. With tail sampling,
+    every trace is recorded and only exported once complete if it failed, was slow or debugged,
+    or falls in the tail sample ratio.
+
+    Args:
+        config (dict): The telemetry configuration.
         resource (Resource): The resource to use for tracing.
     """
-    exporter = AzureMonitorTraceExporter(connection_string=connection_string)
-    tracer_provider = TracerProvider(resource=resource)
-    tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    tracer_provider = TracerProvider(
+        resource=resource,
+        sampler=_get_sampler(config),
+    )
+    span_processors = [
+        BatchSpanProcessor(
+            exporter,
+            schedule_delay_millis=config["schedule_delay_millis"],
+            max_export_batch_size=config["max_export_batch_size"],
+            max_queue_size=config["max_queue_size"],
+        )
+        for exporter in _get_span_exporters(config)
+    ]
+    if config["tail_sampling"]:
+        span_processors = [TailSamplingSpanProcessor(
+            span_processors,
+            config["tail_sample_ratio"],
+            config["tail_slow_threshold_millis"],
+            config["tail_max_traces"],
+        )]
+    for span_processor in span_processors:
+        tracer_provider.add_span_processor(span_processor)
     set_tracer_provider(tracer_provider)
 
 
-def set_up_metrics(connection_string: str, resource: Resource = _get_resource()):
+def _get_metric_views() -> list[View]:
+    """
+    Get the views selecting the exported instruments.
+
+    Returns:
+        list[View]: Drops every instrument but the semantic kernel and state flow ones.
+    """
+    return [
+        View(instrument_name="*", aggregation=DropAggregation()),
+        View(instrument_name="semantic_kernel*"),
+        View(instrument_name=f"{METER_NAME}*"),
+    ]
+
+
+def set_up_metrics(config: dict, resource: Resource = _get_resource()):
     """
-    Set up metrics with Azure Monitor.
-    
+    Set up metrics with the configured exporters.
+
     Args:
-        connection_string (str): The Azure Monitor connection string.
+        config (dict): The telemetry configuration.
         resource (Resource): The resource to use for metrics.
     """
-    exporter = AzureMonitorMetricExporter(connection_string=connection_string)
     meter_provider = MeterProvider(
         metric_readers=[
-            PeriodicExportingMetricReader(exporter, export_interval_millis=5000)
+            PeriodicExportingMetricReader(exporter, export_interval_millis=config["metric_export_interval_millis"])
+            for exporter in _get_metric_exporters(config)
         ],
         resource=resource,
-        views=[
-            View(instrument_name="*", aggregation=DropAggregation()),
-            View(instrument_name="semantic_kernel*"),
-        ],
+        views=_get_metric_views(),
     )
     set_meter_provider(meter_provider)
+
+
+def set_up_telemetry(config: dict) -> bool:
+    """
+    Set up logging, tracing and metrics when at least one exporter is configured.
+
+    Args:
+        config (dict): The telemetry configuration.
+
+    Returns:
+        bool: Whether the telemetry is set up.
+    """
+    if not config["exporters"]:
+        return False
+    set_up_logging(config)
+    set_up_tracing(config)
+    set_up_metrics(config)
+    return True
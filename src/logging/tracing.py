@@ -0,0 +1,25 @@
+"""This module contains the OpenTelemetry tracer and span attributes of the state flow conversation."""
+import hashlib
+from opentelemetry import trace
+
+TRACER_NAME = "state_flow"
+STATE_ATTRIBUTE = "state_flow.state"
+ITERATION_ATTRIBUTE = "state_flow.iteration"
+SQL_HASH_ATTRIBUTE = "db.statement.hash"
+ROW_COUNT_ATTRIBUTE = "db.response.returned_rows"
+
+# The API tracer is a proxy until the tracer provider is set up, the spans follow it
+tracer = trace.get_tracer(TRACER_NAME)
+
+
+def get_sql_hash(sql: str) -> str:
+    """
+    Hashes a SQL statement so spans can group executions of the same query without recording its text.
+
+    Args:
+        sql (str): The SQL statement.
+
+    Returns:
+        str: The first 16 hex digits of the SHA-256 of the statement with collapsed whitespace.
+    """
+    return hashlib.sha256(" ".join(sql.split()).encode("utf-8")).hexdigest()[:16]
@@ -1,11 +1,20 @@
 """This module contains the class SqlEnv which is used to interact with the MySQL database."""
 from typing import Dict, Tuple, Any
 import os
+import re
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector
+from src.mysql.result_cache import SqlResultCache
+from src.mysql.schema_catalog import SchemaCatalog
 from src.utils.constants import Constants
 
+logger: logging.Logger = logging.getLogger(__name__)
 
-class SqlEnv:
+
+class SqlEnv: # pylint: disable=too-many-instance-attributes
     """This class is used to interact with the MySQL database."""
     SQL_CONFIG = {
         "host": os.getenv("MYSQL_HOST", None),
@@ -14,21 +23,45 @@ class SqlEnv:
         "database": os.getenv("MYSQL_DATABASE", None),
         "password": os.getenv("MYSQL_PASSWORD", None),
     }
+    QUERY_TIMEOUT = float(os.getenv("MYSQL_QUERY_TIMEOUT", "30"))
+    EXECUTOR_WORKERS = int(os.getenv("MYSQL_EXECUTOR_WORKERS", "8"))
+    FETCH_MODE = os.getenv("MYSQL_FETCH_MODE", "buffered").lower()
+    # Unset, the LIMIT is appended in streaming mode so the server stops after the observation budget
+    FETCH_LIMIT = os.getenv("MYSQL_FETCH_LIMIT", "").lower()
+    FETCH_DRAIN_ROWS = int(os.getenv("MYSQL_FETCH_DRAIN_ROWS", "1000"))
+    limit_pattern = re.compile(
+        r"\bLIMIT\s+\d+(\s*(,|OFFSET)\s*\d+)?\s*$|\bFOR\s+(UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b",
+        re.IGNORECASE,
+    )
     initial_observation = None
+    _executor: ThreadPoolExecutor | None = None
+    _interrupt_tasks: set[asyncio.Task] = set()
 
-    def __init__(self, config: dict[str, Any]) -> None:
+    def __init__(
+        self,
+        config: dict[str, Any],
+        result_cache: SqlResultCache | None = None,
+        schema_catalog: SchemaCatalog | None = None,
+    ) -> None:
         """
         Initializes the class with the given configuration.
         
         Args:
             config (dict): A dictionary containing the configuration details.
+            result_cache (SqlResultCache | None): The cache of query results, results are not cached if None.
+            schema_catalog (SchemaCatalog | None): The in-memory schema serving DESC / SHOW TABLES, always queried if None.
         """
         self.config = config
+        self.result_cache = result_cache
+        self.schema_catalog = schema_catalog
         self.cnx = None
         self.cursor = None
         self.observation = None
         self.info = {}
         self.trajectory = []
+        self.interrupted = False
+        self.fetch_mode = SqlEnv.FETCH_MODE
+        self.fetch_limit = SqlEnv.FETCH_LIMIT == "true" if SqlEnv.FETCH_LIMIT else self.fetch_mode == "streaming"
 
     def connect(self) -> None:
         """Connects to the MySQL database."""
@@ -39,7 +72,59 @@ class SqlEnv:
             database=self.config["database"],
             password=self.config["password"],
         )
-        self.cursor = self.cnx.cursor(buffered=True)
+        # A streaming (unbuffered) cursor reads the rows from the server as they are fetched
+        self.cursor = self.cnx.cursor(buffered=self.fetch_mode != "streaming")
+
+    def limit_action(self, action: str) -> str:
+        """
+        Appends a LIMIT to a SELECT statement so the server produces no more rows than the observation shows.
+
+        Args:
+            action (str): The SQL statement.
+
+        Returns:
+            str: The statement with a LIMIT of one row over the observation budget, unchanged if not a SELECT
+                or if it already ends with a LIMIT or locking clause.
+        """
+        statement = action.strip().rstrip(";").rstrip()
+        keyword = statement.split(None, 1)[0].upper() if statement else ""
+        if keyword not in ("SELECT", "WITH") or self.limit_pattern.search(statement):
+            return action
+        return f"{statement} LIMIT {Constants.observation_max_rows + 1}"
+
+    def fetch_observation(self) -> list[tuple]:
+        """
+        Fetches the rows of the executed query. In streaming mode only the rows the observation
+        can show are read, plus one so the observation is known to be truncated.
+
+        Returns:
+            list[tuple]: The fetched rows.
+        """
+        if self.fetch_mode != "streaming":
+            return self.cursor.fetchall()
+        rows = self.cursor.fetchmany(Constants.observation_max_rows + 1)
+        if len(rows) > Constants.observation_max_rows:
+            self._discard_unread_result()
+        return rows
+
+    def _discard_unread_result(self) -> None:
+        """
+        Reads the rest of a small result so the connection stays usable, a larger result is
+        cancelled on the server instead of transferred.
+        """
+        if len(self.cursor.fetchmany(self.FETCH_DRAIN_ROWS + 1)) > self.FETCH_DRAIN_ROWS:
+            self._cancel_unread_result()
+
+    def _cancel_unread_result(self) -> None:
+        """Stops the server from sending the rest of the result and drops the connection, the next action reconnects."""
+        try:
+            self.kill_query()
+        except Exception as err: # pylint: disable=broad-except
+            logger.warning("[%s] Failed to kill the running query: %s", type(self).__name__, err)
+        try:
+            self.cnx.close()
+        except Exception as err: # pylint: disable=broad-except
+            logger.debug("[%s] Failed to close the connection: %s", type(self).__name__, err)
 
     def execute_action(self, action) -> None:
         """
@@ -49,11 +134,20 @@ class SqlEnv:
             action (str): The action to be executed.
         """
         try:
+            if self.result_cache is not None:
+                cache_scope = (self.config["host"], self.config["port"], self.config["database"])
+                observation = self.result_cache.get(cache_scope, action, time.monotonic())
+                if observation is not SqlResultCache.MISS:
+                    self.observation = observation
+                    self.info["action_executed"] = True
+                    return
             if not self.cnx or not self.cnx.is_connected():
                 self.connect()
-            self.cursor.execute(action)
+            self.cursor.execute(self.limit_action(action) if self.fetch_limit else action)
             if self.cursor.description is not None:
-                self.observation = self.cursor.fetchall()
+                self.observation = self.fetch_observation()
+                if self.result_cache is not None:
+                    self.result_cache.set(cache_scope, action, self.observation, time.monotonic())
             self.info["action_executed"] = True
         except Exception as err: # pylint: disable=broad-except
             self.observation = f"{Constants.sql_error_message}: {err.msg}"
@@ -77,10 +171,101 @@ class SqlEnv:
             info["action_executed"] = True
             return self.observation, reward, True, info
 
-        self.execute_action(action)
+        observation = self.get_catalog_observation(action)
+        if observation is not None:
+            self.observation = observation
+            self.info["action_executed"] = True
+        else:
+            self.execute_action(action)
         self.trajectory.append((action, self.observation))
         return self.observation, 0, False, self.info
 
+    def get_catalog_observation(self, action: str) -> list[tuple] | None:
+        """
+        Answers a metadata statement from the schema catalog.
+
+        Args:
+            action (str): The SQL statement.
+
+        Returns:
+            list[tuple] | None: The rows of the statement, None if it must run on the database
+                or if the catalog could not be loaded.
+        """
+        if self.schema_catalog is None:
+            return None
+        try:
+            return self.schema_catalog.get_observation(action)
+        except Exception as err: # pylint: disable=broad-except
+            logger.warning("[%s] Failed to load the schema catalog: %s", type(self).__name__, err)
+            return None
+
+    async def step_async(self, action: str, timeout: float | None = None) -> Tuple[str, int, bool, Dict]:
+        """
+        Takes a step in the environment without blocking the event loop.
+        The blocking MySQL call runs on a bounded thread pool, a query that exceeds the timeout
+        or whose caller is cancelled is killed on the server.
+
+        Args:
+            action (str): The action to be executed.
+            timeout (float | None): Seconds before the query is killed, defaults to QUERY_TIMEOUT.
+
+        Returns:
+            Tuple[str, int, bool, Dict]: A tuple containing the observation, reward, done, and info.
+        """
+        timeout = self.QUERY_TIMEOUT if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        execution = loop.run_in_executor(SqlEnv.get_executor(), self.step, action)
+        try:
+            return await asyncio.wait_for(asyncio.shield(execution), timeout)
+        except asyncio.TimeoutError:
+            await self._interrupt(execution)
+            self.observation = f"{Constants.sql_error_message}: Query exceeded the time limit of {timeout} seconds"
+            self.info["error"] = TimeoutError(self.observation)
+            return self.observation, 0, False, self.info
+        except asyncio.CancelledError:
+            # The caller is gone but the query must still be killed, keep a reference until it is done
+            task = asyncio.ensure_future(self._interrupt(execution))
+            SqlEnv._interrupt_tasks.add(task)
+            task.add_done_callback(SqlEnv._interrupt_tasks.discard)
+            raise
+
+    async def _interrupt(self, execution: asyncio.Future, grace_period: float = 5.0) -> None:
+        """
+        Kills the running query and waits for the worker thread to hand the connection back.
+
+        Args:
+            execution (asyncio.Future): The pending execution of the query.
+            grace_period (float): Seconds to wait for the worker thread after the kill.
+        """
+        if execution.done():
+            return
+        self.interrupted = True
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.kill_query)
+        except Exception as err: # pylint: disable=broad-except
+            logger.warning("[%s] Failed to kill the running query: %s", type(self).__name__, err)
+        await asyncio.wait([execution], timeout=grace_period)
+
+    def kill_query(self) -> None:
+        """Kills the query running on this environment's connection from a separate connection."""
+        if not self.cnx:
+            return
+        connection_id = self.cnx.connection_id
+        killer = mysql.connector.connect(
+            host=self.config["host"],
+            port=self.config["port"],
+            user=self.config["user"],
+            database=self.config["database"],
+            password=self.config["password"],
+        )
+        try:
+            cursor = killer.cursor()
+            cursor.execute(f"KILL QUERY {int(connection_id)}")
+            cursor.close()
+        finally:
+            killer.close()
+
     def reset(self):
         """Resets the environment."""
         self.info = {}
@@ -99,6 +284,10 @@ class SqlEnv:
         Returns:
             str: The initial observation.
         """
+        # The catalog refreshes itself, so the observation follows schema changes
+        observation = self.get_catalog_observation(Constants.sql_show_tables)
+        if observation is not None:
+            return observation
         if self.initial_observation is None:
             self.initial_observation, _, _, _ = self.step(Constants.sql_show_tables)
         return self.initial_observation
@@ -113,7 +302,41 @@ class SqlEnv:
         Returns:
             str: The query with the initial observation attached.
         """
-        return f"Question: {query}\n{Constants.init_thought}\nAction: execute[{Constants.sql_show_tables}]\nObservation: {self.get_init_observation()}"
+        init_observation = f"Question: {query}\n{Constants.init_thought}\nAction: execute[{Constants.sql_show_tables}]\nObservation: {self.get_init_observation()}"
+        if self.schema_catalog is not None:
+            try:
+                init_observation += self.schema_catalog.attach_table_definitions(query)
+            except Exception as err: # pylint: disable=broad-except
+                logger.warning("[%s] Failed to load the schema catalog: %s", type(self).__name__, err)
+        return init_observation
+
+    async def attach_init_observation_async(self, query: str) -> str:
+        """
+        Attaches the initial observation to the given query without blocking the event loop,
+        the schema catalog refresh or the SHOW TABLES runs on the bounded thread pool.
+
+        Args:
+            query (str): The query to which the initial observation is to be attached.
+
+        Returns:
+            str: The query with the initial observation attached.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(SqlEnv.get_executor(), self.attach_init_observation, query)
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """
+        Returns the bounded thread pool shared by all environments for blocking MySQL calls.
+
+        Returns:
+            ThreadPoolExecutor: The shared thread pool.
+        """
+        if SqlEnv._executor is None:
+            SqlEnv._executor = ThreadPoolExecutor(
+                max_workers=cls.EXECUTOR_WORKERS, thread_name_prefix="sql_env"
+            )
+        return SqlEnv._executor
 
     @staticmethod
     def get_sql_executor_env_from_environment() -> "SqlEnv":
@@ -123,4 +346,8 @@ class SqlEnv:
         Returns:
             SqlEnv: An instance of the SqlEnv class.
         """
-        return SqlEnv(SqlEnv.SQL_CONFIG)
+        return SqlEnv(
+            SqlEnv.SQL_CONFIG,
+            result_cache=SqlResultCache.get_result_cache_from_environment(),
+            schema_catalog=SchemaCatalog.get_schema_catalog_from_environment(SqlEnv.SQL_CONFIG),
+        )
@@ -0,0 +1,321 @@
+"""This module contains the class SqlEnvPool which leases isolated SqlEnv sessions from a bounded pool of MySQL connections."""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Any
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import AsyncIterator
+from src.mysql.execution_env import SqlEnv
+from src.mysql.result_cache import SqlResultCache
+from src.mysql.schema_catalog import SchemaCatalog
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class _PooledSession:
+    """Book-keeping of a SqlEnv session owned by the pool."""
+
+    def __init__(self, env: SqlEnv) -> None:
+        """
+        Initializes the pooled session.
+
+        Args:
+            env (SqlEnv): The connected SQL execution environment.
+        """
+        self.env = env
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class SqlEnvPool: # pylint: disable=too-many-instance-attributes
+    """
+    This class keeps a bounded pool of MySQL connections and leases an isolated SqlEnv session
+    (own connection, cursor, observation, info and trajectory) per conversation.
+    """
+    POOL_CONFIG = {
+        "max_size": int(os.getenv("MYSQL_POOL_SIZE", "5")),
+        "acquire_timeout": float(os.getenv("MYSQL_POOL_ACQUIRE_TIMEOUT", "30")),
+        "idle_timeout": float(os.getenv("MYSQL_POOL_IDLE_TIMEOUT", "300")),
+        "max_lifetime": float(os.getenv("MYSQL_POOL_MAX_LIFETIME", "1800")),
+    }
+
+    def __init__(
+        self,
+        config: dict[str, Any],
+        max_size: int = 5,
+        acquire_timeout: float = 30.0,
+        idle_timeout: float = 300.0,
+        max_lifetime: float = 1800.0,
+        result_cache: SqlResultCache | None = None,
+        schema_catalog: SchemaCatalog | None = None,
+    ) -> None:
+        """
+        Initializes the pool with the given configuration.
+
+        Args:
+            config (dict): A dictionary containing the MySQL connection details.
+            max_size (int): The maximum number of sessions (connections) in the pool.
+            acquire_timeout (float): Seconds to wait for a free session before giving up.
+            idle_timeout (float): Seconds after which an unused session is closed.
+            max_lifetime (float): Seconds after which a session is closed regardless of usage.
+            result_cache (SqlResultCache | None): The cache of query results shared by the sessions.
+            schema_catalog (SchemaCatalog | None): The in-memory schema shared by the sessions.
+        """
+        if max_size < 1:
+            raise ValueError("The pool size must be at least 1")
+        self.config = config
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.result_cache = result_cache
+        self.schema_catalog = schema_catalog
+        self.initial_observation = None
+        self._idle: list[_PooledSession] = []
+        self._leased: dict[int, _PooledSession] = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        # The waits for a free session run apart from the default executor, which kills the queries
+        self._acquire_executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix="sql_env_pool")
+
+    @property
+    def size(self) -> int:
+        """The number of sessions currently owned by the pool (idle and leased)."""
+        return self._size
+
+    @property
+    def idle_count(self) -> int:
+        """The number of idle sessions ready to be leased."""
+        return len(self._idle)
+
+    def acquire(self, timeout: float | None = None) -> SqlEnv:
+        """
+        Leases a session from the pool, creating a new connection if the pool is not full.
+
+        Args:
+            timeout (float | None): Seconds to wait for a free session, defaults to the pool acquire timeout.
+
+        Raises:
+            RuntimeError: If the pool has been closed.
+            TimeoutError: If no session becomes available within the timeout.
+
+        Returns:
+            SqlEnv: An isolated SQL execution environment.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        session = None
+        expired: list[_PooledSession] = []
+        try:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("The SqlEnv pool is closed")
+                    expired.extend(self._pop_expired_idle_sessions())
+                    if self._idle:
+                        session = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"No MySQL session available in the pool after {timeout} seconds"
+                        )
+                    self._condition.wait(remaining)
+        finally:
+            self._close_sessions(expired)
+
+        try:
+            if session is not None and not self._is_healthy(session):
+                logger.info("[%s] Replacing unhealthy MySQL session.", type(self).__name__)
+                self._close_sessions([session])
+                session = None
+            if session is None:
+                session = self._create_session()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        session.last_used_at = time.monotonic()
+        if session.env.initial_observation is None:
+            session.env.initial_observation = self.initial_observation
+        with self._condition:
+            self._leased[id(session.env)] = session
+        return session.env
+
+    async def acquire_async(self, timeout: float | None = None) -> SqlEnv:
+        """
+        Leases a session from the pool without blocking the event loop. The wait runs on the
+        pool's own threads, so waiting conversations do not hold the threads of the default executor.
+
+        Args:
+            timeout (float | None): Seconds to wait for a free session, defaults to the pool acquire timeout.
+
+        Raises:
+            RuntimeError: If the pool has been closed.
+            TimeoutError: If no session becomes available within the timeout.
+
+        Returns:
+            SqlEnv: An isolated SQL execution environment.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        # The timeout also counts the time spent waiting for a thread of the pool
+        deadline = time.monotonic() + timeout
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._acquire_executor, lambda: self.acquire(max(0.0, deadline - time.monotonic()))
+        )
+
+    def release(self, env: SqlEnv, discard: bool = False) -> None:
+        """
+        Returns a leased session to the pool.
+
+        Args:
+            env (SqlEnv): The session previously returned by acquire.
+            discard (bool): Close the session instead of reusing it, e.g. after a broken connection.
+        """
+        with self._condition:
+            session = self._leased.pop(id(env), None)
+            if session is None:
+                raise ValueError("The SqlEnv session is not leased from this pool")
+            if env.initial_observation is not None and self.initial_observation is None:
+                self.initial_observation = env.initial_observation
+            now = time.monotonic()
+            keep = (
+                not discard
+                and not env.interrupted
+                and not self._closed
+                and now - session.created_at < self.max_lifetime
+            )
+            if keep:
+                env.reset()
+                session.last_used_at = now
+                self._idle.append(session)
+            else:
+                self._size -= 1
+            self._condition.notify()
+        if not keep:
+            self._close_sessions([session])
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[SqlEnv]:
+        """
+        Leases a session for the duration of a conversation without blocking the event loop.
+
+        Yields:
+            SqlEnv: An isolated SQL execution environment.
+        """
+        acquiring = asyncio.ensure_future(self.acquire_async())
+        try:
+            env = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The caller went away while waiting, hand the session back once the worker thread gets it
+            acquiring.add_done_callback(
+                lambda task: None if task.cancelled() or task.exception() else self.release(task.result())
+            )
+            raise
+        discard = False
+        try:
+            yield env
+        except BaseException:
+            discard = env.interrupted or env.cnx is None or not env.cnx.is_connected()
+            raise
+        finally:
+            self.release(env, discard=discard)
+
+    def close(self) -> None:
+        """Closes all idle sessions; leased sessions are closed when they are released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        self._close_sessions(idle)
+        self._acquire_executor.shutdown(wait=False)
+
+    def _create_session(self) -> _PooledSession:
+        """
+        Creates a new connected session.
+
+        Returns:
+            _PooledSession: The new session.
+        """
+        env = SqlEnv(self.config, result_cache=self.result_cache, schema_catalog=self.schema_catalog)
+        env.connect()
+        return _PooledSession(env)
+
+    def _is_healthy(self, session: _PooledSession) -> bool:
+        """
+        Checks whether the session connection is still usable.
+
+        Args:
+            session (_PooledSession): The session to check.
+
+        Returns:
+            bool: True if the connection is alive.
+        """
+        try:
+            return session.env.cnx is not None and session.env.cnx.is_connected()
+        except Exception: # pylint: disable=broad-except
+            return False
+
+    def _pop_expired_idle_sessions(self) -> list[_PooledSession]:
+        """
+        Removes idle sessions that exceeded the idle timeout or max lifetime, must hold the lock.
+
+        Returns:
+            list[_PooledSession]: The sessions to close.
+        """
+        now = time.monotonic()
+        expired = [
+            session
+            for session in self._idle
+            if now - session.last_used_at >= self.idle_timeout
+            or now - session.created_at >= self.max_lifetime
+        ]
+        if expired:
+            self._idle = [session for session in self._idle if session not in expired]
+            self._size -= len(expired)
+        return expired
+
+    def _close_sessions(self, sessions: list[_PooledSession]) -> None:
+        """
+        Closes the connections of the given sessions.
+
+        Args:
+            sessions (list[_PooledSession]): The sessions to close.
+        """
+        for session in sessions:
+            try:
+                session.env.close()
+            except Exception as err: # pylint: disable=broad-except
+                logger.debug("[%s] Failed to close MySQL session: %s", type(self).__name__, err)
+
+    @staticmethod
+    def get_sql_executor_env_pool_from_environment(max_size: int | None = None) -> "SqlEnvPool":
+        """
+        Returns an instance of the SqlEnvPool class with the configuration details from the environment.
+
+        Args:
+            max_size (int | None): Overrides the MYSQL_POOL_SIZE of the environment.
+
+        Returns:
+            SqlEnvPool: An instance of the SqlEnvPool class.
+        """
+        pool_config = dict(SqlEnvPool.POOL_CONFIG)
+        if max_size is not None:
+            pool_config["max_size"] = max_size
+        return SqlEnvPool(
+            SqlEnv.SQL_CONFIG,
+            result_cache=SqlResultCache.get_result_cache_from_environment(),
+            schema_catalog=SchemaCatalog.get_schema_catalog_from_environment(SqlEnv.SQL_CONFIG),
+            **pool_config,
+        )
@@ -0,0 +1,180 @@
+"""This module contains the class SqlResultCache which caches SQL query results keyed by the normalized query text."""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any
+
+
+class SqlResultCache:
+    """
+    This class caches the results of read-only SQL statements shared by all SqlEnv sessions.
+    Schema statements (DESC, SHOW TABLES / COLUMNS / CREATE TABLE) live longer than SELECT results
+    and EXPLAIN plans, the other SHOW statements report server state and are not cached. The cache
+    is bounded by the approximate size of the cached results in bytes.
+    """
+    CACHE_CONFIG = {
+        "max_bytes": int(os.getenv("MYSQL_RESULT_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+        "metadata_ttl": float(os.getenv("MYSQL_RESULT_CACHE_METADATA_TTL", "3600")),
+        "select_ttl": float(os.getenv("MYSQL_RESULT_CACHE_SELECT_TTL", "30")),
+    }
+    MISS = object()
+    metadata_pattern = re.compile(
+        r"^(DESC|DESCRIBE)\s|^SHOW\s+(FULL\s+)?(TABLES|COLUMNS|FIELDS)\b|^SHOW\s+CREATE\s+TABLE\s",
+        re.IGNORECASE,
+    )
+    select_statements = ("SELECT", "WITH", "EXPLAIN")
+    non_deterministic_pattern = re.compile(
+        r"\b(NOW|RAND|UUID|SYSDATE|CURDATE|CURTIME|CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP|UNIX_TIMESTAMP)\b",
+        re.IGNORECASE,
+    )
+    _shared: "SqlResultCache | None" = None
+
+    def __init__(self, max_bytes: int, metadata_ttl: float = 3600.0, select_ttl: float = 30.0):
+        """
+        Initializes the cache.
+
+        Args:
+            max_bytes (int): The maximum approximate size of the cached results.
+            metadata_ttl (float): Seconds a DESC / SHOW TABLES / SHOW COLUMNS / SHOW CREATE TABLE result stays valid.
+            select_ttl (float): Seconds a SELECT result or an EXPLAIN plan stays valid.
+        """
+        self.max_bytes = max_bytes
+        self.ttls = {"metadata": metadata_ttl, "select": select_ttl}
+        self.size_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries: OrderedDict[tuple, tuple[float, int, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(action: str) -> str:
+        """
+        Normalizes the SQL text: collapses whitespace outside of quoted literals and drops trailing semicolons.
+
+        Args:
+            action (str): The SQL statement.
+
+        Returns:
+            str: The normalized statement.
+        """
+        parts = re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)""", action.strip())
+        normalized = "".join(
+            part if index % 2 else re.sub(r"\s+", " ", part)
+            for index, part in enumerate(parts)
+        )
+        return normalized.strip().rstrip(";").strip()
+
+    def get_statement_class(self, normalized_action: str) -> str | None:
+        """
+        Classifies the statement to pick its TTL.
+
+        Args:
+            normalized_action (str): The normalized SQL statement.
+
+        Returns:
+            str | None: "metadata", "select" or None if the statement must not be cached.
+        """
+        if self.metadata_pattern.match(normalized_action):
+            return "metadata"
+        keyword = normalized_action.split(" ", 1)[0].upper()
+        if keyword in self.select_statements and not self.non_deterministic_pattern.search(normalized_action):
+            return "select"
+        return None
+
+    def get(self, scope: tuple, action: str, now: float) -> Any:
+        """
+        Gets the cached result of a statement.
+
+        Args:
+            scope (tuple): The database the statement runs against.
+            action (str): The SQL statement.
+            now (float): The current monotonic time.
+
+        Returns:
+            Any: The cached result, or SqlResultCache.MISS.
+        """
+        normalized_action = self.normalize(action)
+        if self.get_statement_class(normalized_action) is None:
+            return self.MISS
+        key = (scope, normalized_action)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._remove(key)
+                self.counters["misses"] += 1
+                return self.MISS
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[2]
+
+    def set(self, scope: tuple, action: str, result: Any, now: float) -> None:
+        """
+        Caches the result of a statement, evicting the least recently used results over the size bound.
+
+        Args:
+            scope (tuple): The database the statement runs against.
+            action (str): The SQL statement.
+            result (Any): The fetched rows.
+            now (float): The current monotonic time.
+        """
+        normalized_action = self.normalize(action)
+        statement_class = self.get_statement_class(normalized_action)
+        if statement_class is None:
+            return
+        size = len(normalized_action) + len(repr(result))
+        if size > self.max_bytes:
+            return
+        key = (scope, normalized_action)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now + self.ttls[statement_class], size, result)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def _remove(self, key: tuple) -> None:
+        """
+        Removes an entry, must hold the lock.
+
+        Args:
+            key (tuple): The key of the entry.
+        """
+        _, size, _ = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def clear(self) -> None:
+        """Removes all cached results."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Returns the hit / miss metrics of the cache.
+
+        Returns:
+            dict[str, int]: The number of hits, misses, evictions, entries and cached bytes.
+        """
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+            }
+
+    @staticmethod
+    def get_result_cache_from_environment() -> "SqlResultCache | None":
+        """
+        Returns the process-level SqlResultCache configured from the environment.
+
+        Returns:
+            SqlResultCache | None: The shared cache, None if MYSQL_RESULT_CACHE_MAX_BYTES is 0.
+        """
+        if SqlResultCache.CACHE_CONFIG["max_bytes"] <= 0:
+            return None
+        if SqlResultCache._shared is None:
+            SqlResultCache._shared = SqlResultCache(**SqlResultCache.CACHE_CONFIG)
+        return SqlResultCache._shared
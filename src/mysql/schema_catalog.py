@@ -0,0 +1,222 @@
+"""This module contains the class SchemaCatalog which keeps an in-memory model of the database schema to answer DESC and SHOW TABLES without a round trip."""
+import os
+import re
+import time
+import logging
+import threading
+from typing import Any
+import mysql.connector
+from src.utils.constants import Constants
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class TableSchema:
+    """The columns and foreign keys of a table."""
+
+    def __init__(self, name: str):
+        """
+        Initializes the table schema.
+
+        Args:
+            name (str): The name of the table.
+        """
+        self.name = name
+        self.columns: list[tuple] = []
+        self.foreign_keys: list[tuple[str, str, str]] = []
+
+    def get_observation(self) -> str:
+        """
+        Returns the DESC rows of the table followed by its foreign keys, which DESC does not show.
+
+        Returns:
+            str: The observation, e.g. `[('orderNumber', 'int', 'NO', 'PRI', None, '')] References: customerNumber -> customers.customerNumber`.
+        """
+        observation = str(self.columns)
+        if self.foreign_keys:
+            references = ", ".join(f"{column} -> {table}.{referenced}" for column, table, referenced in self.foreign_keys)
+            observation += f" References: {references}"
+        return observation
+
+
+class SchemaCatalog:
+    """
+    This class introspects information_schema once (and again after the refresh interval) and serves
+    DESC / DESCRIBE / SHOW TABLES statements from memory with the same rows MySQL would return.
+    """
+    CATALOG_CONFIG = {
+        "enabled": os.getenv("MYSQL_SCHEMA_CATALOG", "true").lower() == "true",
+        "refresh_interval": float(os.getenv("MYSQL_SCHEMA_CATALOG_REFRESH_INTERVAL", "600")),
+        "inject_tables": int(os.getenv("MYSQL_SCHEMA_CATALOG_INJECT_TABLES", "0")),
+    }
+    desc_pattern = re.compile(r"^\s*(?:DESC|DESCRIBE)\s+`?(\w+)`?\s*;?\s*$", re.IGNORECASE)
+    show_tables_pattern = re.compile(r"^\s*SHOW\s+TABLES\s*;?\s*$", re.IGNORECASE)
+    _shared: "SchemaCatalog | None" = None
+
+    def __init__(self, config: dict[str, Any], refresh_interval: float = 600.0, inject_tables: int = 0):
+        """
+        Initializes the catalog, the schema is loaded on first use.
+
+        Args:
+            config (dict): A dictionary containing the MySQL connection details.
+            refresh_interval (float): Seconds after which the schema is introspected again.
+            inject_tables (int): The number of relevant table definitions to add to the initial observation.
+        """
+        self.config = config
+        self.refresh_interval = refresh_interval
+        self.inject_tables = inject_tables
+        self.tables: dict[str, TableSchema] = {}
+        self.refreshed_at: float | None = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Introspects the tables, columns and foreign keys of the database."""
+        cnx = mysql.connector.connect(
+            host=self.config["host"],
+            port=self.config["port"],
+            user=self.config["user"],
+            database=self.config["database"],
+            password=self.config["password"],
+        )
+        try:
+            cursor = cnx.cursor()
+            cursor.execute(
+                "SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME"
+            )
+            tables = {name: TableSchema(name) for (name,) in cursor.fetchall()}
+            cursor.execute(
+                "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_DEFAULT, EXTRA "
+                "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, ORDINAL_POSITION"
+            )
+            for table_name, *column in cursor.fetchall():
+                if table_name in tables:
+                    tables[table_name].columns.append(tuple(column))
+            cursor.execute(
+                "SELECT TABLE_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME "
+                "FROM information_schema.KEY_COLUMN_USAGE "
+                "WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL"
+            )
+            for table_name, column_name, referenced_table, referenced_column in cursor.fetchall():
+                if table_name in tables:
+                    tables[table_name].foreign_keys.append((column_name, referenced_table, referenced_column))
+            cursor.close()
+        finally:
+            cnx.close()
+        self.tables = tables
+        self.refreshed_at = time.monotonic()
+        logger.info("[%s] Loaded the schema of %d tables.", type(self).__name__, len(tables))
+
+    def refresh_if_stale(self) -> None:
+        """
+        Introspects the database if the schema was never loaded or the refresh interval elapsed.
+        A failed refresh keeps the last loaded schema until the next interval.
+
+        Raises:
+            Exception: If the schema was never loaded and the introspection failed.
+        """
+        if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.refresh_interval:
+                try:
+                    self.refresh()
+                except Exception as err: # pylint: disable=broad-except
+                    if self.refreshed_at is None:
+                        raise
+                    logger.warning("[%s] Failed to refresh the schema, serving the last loaded one: %s", type(self).__name__, err)
+                    self.refreshed_at = time.monotonic()
+
+    def get_table(self, name: str) -> TableSchema | None:
+        """
+        Gets a table by name, case-insensitively.
+
+        Args:
+            name (str): The name of the table.
+
+        Returns:
+            TableSchema | None: The table, None if unknown.
+        """
+        table = self.tables.get(name)
+        if table is None:
+            table = next((t for t in self.tables.values() if t.name.lower() == name.lower()), None)
+        return table
+
+    def get_observation(self, action: str) -> list[tuple] | None:
+        """
+        Answers a DESC / DESCRIBE / SHOW TABLES statement from memory.
+
+        Args:
+            action (str): The SQL statement.
+
+        Returns:
+            list[tuple] | None: The rows MySQL would return, None if the statement must run on the database.
+        """
+        if self.show_tables_pattern.match(action):
+            self.refresh_if_stale()
+            return [(name,) for name in self.tables]
+        match = self.desc_pattern.match(action)
+        if match:
+            self.refresh_if_stale()
+            table = self.get_table(match.group(1))
+            # Unknown tables run on the database to return the genuine error message
+            return list(table.columns) if table is not None else None
+        return None
+
+    def get_relevant_tables(self, question: str) -> list[TableSchema]:
+        """
+        Finds the tables mentioned in the question by their name or its singular form.
+
+        Args:
+            question (str): The user question.
+
+        Returns:
+            list[TableSchema]: The mentioned tables, at most inject_tables of them.
+        """
+        self.refresh_if_stale()
+        text = re.sub(r"[^a-z0-9]", "", question.lower())
+        relevant = []
+        for table in self.tables.values():
+            name = re.sub(r"[^a-z0-9]", "", table.name.lower())
+            singular = name[:-1] if name.endswith("s") and len(name) > 3 else name
+            if name in text or singular in text:
+                relevant.append(table)
+        return relevant[: self.inject_tables]
+
+    def attach_table_definitions(self, question: str) -> str:
+        """
+        Builds the DESC steps of the relevant tables to append to the initial observation.
+
+        Args:
+            question (str): The user question.
+
+        Returns:
+            str: The Thought / Action / Observation lines of the relevant tables, empty if none.
+        """
+        if self.inject_tables <= 0:
+            return ""
+        return "".join(
+            f"\n{Constants.catalog_thought}\nAction: execute[DESC {table.name}]\n"
+            f"{Constants.observation_identifier}{table.get_observation()}"
+            for table in self.get_relevant_tables(question)
+        )
+
+    @staticmethod
+    def get_schema_catalog_from_environment(config: dict[str, Any]) -> "SchemaCatalog | None":
+        """
+        Returns the process-level SchemaCatalog configured from the environment.
+
+        Args:
+            config (dict): A dictionary containing the MySQL connection details.
+
+        Returns:
+            SchemaCatalog | None: The shared catalog, None if MYSQL_SCHEMA_CATALOG is not true.
+        """
+        if not SchemaCatalog.CATALOG_CONFIG["enabled"]:
+            return None
+        if SchemaCatalog._shared is None:
+            SchemaCatalog._shared = SchemaCatalog(
+                config,
+                refresh_interval=SchemaCatalog.CATALOG_CONFIG["refresh_interval"],
+                inject_tables=SchemaCatalog.CATALOG_CONFIG["inject_tables"],
+            )
+        return SchemaCatalog._shared
@@ -12,10 +12,14 @@ class Constants:
     sql_error_message = "Error executing query"
     action_identifier = "Action:"
     observation_identifier = "Observation: "
+    observation_max_rows = 25
+    observation_max_chars = 350
     action_submit = "submit"
     action_skip = "skip"
     action_skip_response = "skipped"
     init_thought = "Thought: I should first find out what tables are available in this MySQL database that can help me answer this question."
+    catalog_thought = "Thought: I should look at the structure of the tables related to this question."
+    history_summary_thought = "Thought: These are the earlier steps of this conversation."
     sqlite_db_file_name = "sql_copilot.sqlite.db"
     default_response = "I'm sorry, I am not able to find any information on that."
     sql_data_manipulation_commands = [
@@ -3,10 +3,12 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from semantic_kernel.kernel import Kernel
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
 from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
 from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
 from semantic_kernel.exceptions import KernelServiceNotFoundError
-from src.agents.base import StateFlowBaseAgent
+from src.agents.base import StateFlowBaseAgent, ActionBlockDetector
+from src.agents.thought_action import ThoughtActionParser
 
 class TestStateFlowBaseAgent(unittest.IsolatedAsyncioTestCase):
 
@@ -55,5 +57,151 @@ class TestStateFlowBaseAgent(unittest.IsolatedAsyncioTestCase):
         self.assertIn("Action: ", result[0].content)
         self.assertEqual(result[0].name, "test_agent")
 
+    @patch('src.agents.base.state_flow_metrics')
+    async def test_invoke_structured_output(self, mock_metrics):
+        agent = StateFlowBaseAgent(
+            service_id="test_service",
+            kernel=self.kernel,
+            name="test_agent",
+            instructions="test_instructions",
+            execution_settings=PromptExecutionSettings(service_id="test_service", extension_data={"temperature": 0}),
+            structured_output=True,
+        )
+        self.assertEqual(agent.execution_settings.extension_data["response_format"], ThoughtActionParser.response_format)
+        self.assertEqual(agent.execution_settings.extension_data["temperature"], 0)
+        self.assertIn("JSON", agent.instructions)
+        self.chat_completion_service.get_chat_message_contents = AsyncMock(
+            return_value=[ChatMessageContent(content='{"thought": "count them", "action": "execute[SELECT COUNT(*) FROM t]"}', role="assistant")]
+        )
+
+        result = [message async for message in agent.invoke(ChatHistory())]
+
+        self.assertEqual(result[0].content, "Thought: count them\nAction: execute[SELECT COUNT(*) FROM t]")
+        mock_metrics.record_output_fallback.assert_not_called()
+
+    @patch('src.agents.base.state_flow_metrics')
+    async def test_invoke_records_fallback(self, mock_metrics):
+        self.chat_completion_service.get_chat_message_contents = AsyncMock(
+            return_value=[ChatMessageContent(content="test_thought", role="assistant")]
+        )
+
+        [message async for message in self.agent.invoke(ChatHistory())]
+
+        self.chat_completion_service.get_chat_message_contents.assert_awaited_once()
+        mock_metrics.record_output_fallback.assert_called_once_with("test_agent", "missing")
+
+    async def test_invoke_action_candidates(self):
+        agent = StateFlowBaseAgent(
+            service_id="test_service",
+            kernel=self.kernel,
+            name="test_agent",
+            instructions="test_instructions",
+            execution_settings=self.execution_settings,
+            action_candidates=2,
+        )
+        self.assertIn("up to 2 different commands", agent.instructions)
+        self.chat_completion_service.get_chat_message_contents = AsyncMock(
+            return_value=[ChatMessageContent(content="Thought: t\nAction: execute[SELECT 1]\nAction: execute[SELECT 2]\nAction: execute[SELECT 3]", role="assistant")]
+        )
+
+        result = [message async for message in agent.invoke(ChatHistory())]
+
+        self.assertEqual(result[0].content, "Thought: t\nAction: execute[SELECT 1]\nAction: execute[SELECT 2]")
+
+    def _set_streaming_chunks(self, chunks):
+        self.consumed_chunks = []
+
+        async def stream(**kwargs):
+            for chunk in chunks:
+                self.consumed_chunks.append(chunk)
+                yield [StreamingChatMessageContent(role="assistant", choice_index=0, content=chunk)]
+
+        self.chat_completion_service.get_streaming_chat_message_contents = MagicMock(side_effect=stream)
+
+    async def test_invoke_stream_closes_stream_after_action(self):
+        self._set_streaming_chunks(["Thought: count them\n", "Action: execute[SELECT COUNT(*) ", "FROM t]", "\nObservation: ", "made up"])
+        history = ChatHistory()
+
+        result = [message async for message in self.agent.invoke_stream(history)]
+
+        self.assertEqual(len(self.consumed_chunks), 3)
+        self.assertEqual("".join(message.content for message in result), "Thought: count them\nAction: execute[SELECT COUNT(*) FROM t]")
+        self.assertEqual(result[0].name, "test_agent")
+        self.assertEqual(history.messages[-1].content, "Thought: count them\nAction: execute[SELECT COUNT(*) FROM t]")
+        self.assertEqual(history.messages[-1].name, "test_agent")
+
+    async def test_invoke_stream_trims_text_after_action(self):
+        self._set_streaming_chunks(["Thought: count them\n", "Action: execute[SELECT 1]\nObservation: made up", "more"])
+        history = ChatHistory()
+
+        result = [message async for message in self.agent.invoke_stream(history)]
+
+        # The streamed tokens end with the action, like the message added to the history
+        self.assertEqual([message.content for message in result], ["Thought: count them\n", "Action: execute[SELECT 1]"])
+        self.assertEqual(history.messages[-1].content, "Thought: count them\nAction: execute[SELECT 1]")
+        self.assertEqual(len(self.consumed_chunks), 2)
+
+    async def test_invoke_stream_submit(self):
+        self._set_streaming_chunks(["Thought: done\n", "Action: submit"])
+        history = ChatHistory()
+
+        result = [message async for message in self.agent.invoke_stream(history)]
+
+        self.assertEqual(len(result), 2)
+        self.assertEqual(history.messages[-1].content, "Thought: done\nAction: submit")
+
+    async def test_invoke_stream_reads_every_candidate(self):
+        self.agent.action_candidates = 2
+        self._set_streaming_chunks([
+            "Thought: count them\n", "Action: execute[SELECT COUNT(*) FROM t]\n",
+            "Action: execute[SELECT COUNT(id) ", "FROM t]", "\nObservation: ", "made up",
+        ])
+        history = ChatHistory()
+
+        [message async for message in self.agent.invoke_stream(history)]
+
+        # The stream is closed after the block of the last candidate, not of the first one
+        self.assertEqual(len(self.consumed_chunks), 4)
+        self.assertEqual(
+            history.messages[-1].content,
+            "Thought: count them\nAction: execute[SELECT COUNT(*) FROM t]\nAction: execute[SELECT COUNT(id) FROM t]",
+        )
+
+    async def test_invoke_stream_thought_only(self):
+        self._set_streaming_chunks(["test_thought"])
+        history = ChatHistory()
+
+        [message async for message in self.agent.invoke_stream(history)]
+
+        self.assertIn("Thought: test_thought", history.messages[-1].content)
+        self.assertIn("Action: ", history.messages[-1].content)
+
+
+class TestActionBlockDetector(unittest.TestCase):
+
+    def test_feed_detects_closing_bracket(self):
+        detector = ActionBlockDetector()
+        self.assertFalse(detector.feed("Thought: t\nAction: exe"))
+        self.assertFalse(detector.feed("cute[SELECT a FROM t WHERE b IN (SELECT c FROM d)"))
+        self.assertTrue(detector.feed("] trailing"))
+        self.assertEqual(detector.get_completed_text(), "Thought: t\nAction: execute[SELECT a FROM t WHERE b IN (SELECT c FROM d)]")
+
+    def test_feed_ignores_brackets_in_quotes(self):
+        detector = ActionBlockDetector()
+        self.assertFalse(detector.feed("Action: execute[SELECT name FROM t WHERE name = 'a]b'"))
+        self.assertTrue(detector.feed("]"))
+
+    def test_feed_detects_last_candidate(self):
+        detector = ActionBlockDetector(max_blocks=2)
+        self.assertFalse(detector.feed("Thought: t\nAction: execute[SELECT 1]\nAction: exe"))
+        self.assertFalse(detector.feed("cute[SELECT ']'"))
+        self.assertTrue(detector.feed("] trailing"))
+        self.assertEqual(detector.get_completed_text(), "Thought: t\nAction: execute[SELECT 1]\nAction: execute[SELECT ']']")
+
+    def test_feed_without_action(self):
+        detector = ActionBlockDetector()
+        self.assertFalse(detector.feed("Thought: t\nAction: submit"))
+        self.assertEqual(detector.get_completed_text(), "Thought: t\nAction: submit")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
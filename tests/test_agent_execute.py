@@ -1,12 +1,15 @@
+import asyncio
 import unittest
-from unittest.mock import AsyncMock, MagicMock
-from src.agents.execute import SQLExecuteAgent, AgentExecute
+from unittest.mock import AsyncMock, MagicMock, patch
+from src.agents.execute import SQLExecuteAgent, AgentExecute, _abandoned_candidates
 from src.mysql.execution_env import SqlEnv
+from src.mysql.execution_env_pool import SqlEnvPool
 from semantic_kernel.kernel import Kernel
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.contents.chat_message_content import ChatMessageContent
 from semantic_kernel.contents.utils.author_role import AuthorRole
 from src.utils.constants import Constants
+from src.groupchat.state_flow_termination_strategy import StateFlowTerminationStrategy
 
 class TestSQLExecuteAgent(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
@@ -36,7 +39,7 @@ class TestSQLExecuteAgent(unittest.IsolatedAsyncioTestCase):
     async def test_invoke_valid_sql(self):
         history = ChatHistory()
         history.add_message(ChatMessageContent(role=AuthorRole.USER, items=[], content=f"{Constants.action_identifier} execute[SELECT * FROM users;]"))
-        self.sql_env.step.return_value=("result", None, None, None)
+        self.sql_env.step_async.return_value=("result", None, None, None)
 
         messages = [message async for message in self.agent.invoke(history)]
         self.assertEqual(len(messages), 1)
@@ -53,11 +56,152 @@ class TestSQLExecuteAgent(unittest.IsolatedAsyncioTestCase):
     async def test_invoke_show_databases(self):
         history = ChatHistory()
         history.add_message(ChatMessageContent(role=AuthorRole.USER, items=[], content=f"{Constants.action_identifier} execute SHOW DATABASES"))
-        self.sql_env.step.return_value=("result", None, None, None)
+        self.sql_env.step_async.return_value=("result", None, None, None)
 
         messages = [message async for message in self.agent.invoke(history)]
         self.assertEqual(len(messages), 1)
         self.assertIn("SHOW DATABASES is not allowed", messages[0].items[0].text)
 
+    async def test_invoke_stream(self):
+        history = ChatHistory()
+        history.add_message(ChatMessageContent(role=AuthorRole.USER, items=[], content=f"{Constants.action_identifier} execute[SELECT * FROM users;]"))
+        self.sql_env.step_async.return_value=("result", None, None, None)
+
+        messages = [message async for message in self.agent.invoke_stream(history)]
+        self.assertEqual(len(messages), 1)
+        self.assertIn("result", messages[0].content)
+        self.assertEqual(messages[0].name, AgentExecute.name)
+        self.assertEqual(len(history.messages), 2)
+
+
+class TestSQLExecuteAgentCandidates(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.sql_env = MagicMock(spec=SqlEnv)
+        self.sql_env.trajectory = []
+        self.pool = MagicMock(spec=SqlEnvPool)
+        self.pooled_envs = [MagicMock(spec=SqlEnv) for _ in range(3)]
+        self.pool.acquire_async.side_effect = self.pooled_envs
+        self.agent = AgentExecute(sql_executor_env=self.sql_env, kernel=MagicMock(spec=Kernel), sql_executor_env_pool=self.pool).get_agent()
+        self.history = ChatHistory()
+        self.history.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, name="select", content=(
+            "Thought: count them\n"
+            f"{Constants.action_identifier} execute[SELECT COUNT(*) FROM user]\n"
+            f"{Constants.action_identifier} execute[SELECT COUNT(*) FROM users]\n"
+            f"{Constants.action_identifier} execute[SELECT COUNT(id) FROM users]"
+        )))
+
+    async def test_invoke_candidates_concurrently(self):
+        self.pooled_envs[0].step_async.return_value = (f"{Constants.sql_error_message}: Unknown table", None, None, None)
+        self.pooled_envs[1].step_async.return_value = ([(42,)], None, None, None)
+        self.pooled_envs[2].step_async.return_value = ([(42,)], None, None, None)
+
+        messages = [message async for message in self.agent.invoke(self.history)]
+
+        self.assertIn("[(42,)]", messages[0].content)
+        # Only the winning candidate is kept in the message of the select agent
+        self.assertEqual(self.history.messages[0].content, f"Thought: count them\n{Constants.action_identifier} execute[SELECT COUNT(*) FROM users]")
+        self.assertEqual(self.pool.release.call_count, 3)
+        self.sql_env.step_async.assert_not_called()
+
+    async def test_invoke_candidates_kills_losing_candidates(self):
+        loop = asyncio.get_running_loop()
+        killed = asyncio.Event()
+
+        async def slow_step(action):
+            await killed.wait()
+            return (f"{Constants.sql_error_message}: Query execution was interrupted", None, None, None)
+
+        for env in self.pooled_envs:
+            env.step_async.side_effect = slow_step
+            env.kill_query.side_effect = lambda: loop.call_soon_threadsafe(killed.set)
+        self.pooled_envs[1].step_async.side_effect = None
+        self.pooled_envs[1].step_async.return_value = ([(42,)], None, None, None)
+
+        messages = [message async for message in self.agent.invoke(self.history)]
+        self.assertIn("[(42,)]", messages[0].content)
+
+        # The losing queries are killed, and their sessions are released once the queries stopped
+        await asyncio.gather(*_abandoned_candidates)
+        self.pooled_envs[0].kill_query.assert_called_once()
+        self.pooled_envs[2].kill_query.assert_called_once()
+        self.pooled_envs[1].kill_query.assert_not_called()
+        self.assertEqual(self.pool.release.call_count, 3)
+
+    @patch('src.agents.execute.state_flow_metrics')
+    async def test_invoke_candidates_records_sql_metrics_by_issuing_state(self, metrics):
+        for env in self.pooled_envs:
+            env.step_async.return_value = ([(42,)], None, None, None)
+
+        [message async for message in self.agent.invoke(self.history)]
+
+        # The SQL cost is broken down by the state that issued the action, not by the executor
+        metrics.record_sql_execution.assert_called()
+        self.assertEqual({call.args[0] for call in metrics.record_sql_execution.call_args_list}, {"select"})
+
+    async def test_invoke_candidates_without_free_session(self):
+        self.pool.acquire_async.side_effect = TimeoutError()
+        self.sql_env.step_async.side_effect = [
+            (f"{Constants.sql_error_message}: Unknown table", None, None, None),
+            ([(42,)], None, None, None),
+        ]
+
+        messages = [message async for message in self.agent.invoke(self.history)]
+
+        # The candidates run one by one on the conversation session until one returns rows
+        self.assertIn("[(42,)]", messages[0].content)
+        self.assertEqual(self.sql_env.step_async.call_count, 2)
+        self.assertIn("FROM users]", self.history.messages[0].content)
+
+    async def test_invoke_candidates_all_failed(self):
+        for env in self.pooled_envs:
+            env.step_async.return_value = (f"{Constants.sql_error_message}: Unknown table", None, None, None)
+
+        messages = [message async for message in self.agent.invoke(self.history)]
+
+        self.assertIn(Constants.sql_error_message, messages[0].content)
+        self.assertIn("FROM user]", self.history.messages[0].content)
+
+    async def test_invoke_candidates_drops_submit(self):
+        self.history.messages[0].content = (
+            f"Thought: t\n{Constants.action_identifier} execute[SELECT 1]\n{Constants.action_identifier} {Constants.action_submit}"
+        )
+        self.pooled_envs[0].step_async.return_value = ([], None, None, None)
+
+        [message async for message in self.agent.invoke(self.history)]
+
+        self.assertEqual(self.history.messages[0].content, f"Thought: t\n{Constants.action_identifier} execute[SELECT 1]")
+        self.assertEqual(self.pool.acquire_async.call_count, 1)
+
+    async def test_invoke_candidates_submit_first_terminates(self):
+        self.history.messages[0].content = (
+            f"Thought: done\n{Constants.action_identifier} {Constants.action_submit}\n{Constants.action_identifier} execute[SELECT 1]"
+        )
+        self.sql_env.step_async.return_value = ("", None, None, None)
+
+        [message async for message in self.agent.invoke(self.history)]
+
+        # Only the submit is kept, so the termination strategy ends the conversation
+        self.assertEqual(self.history.messages[0].content, f"Thought: done\n{Constants.action_identifier} {Constants.action_submit}")
+        self.pool.acquire_async.assert_not_called()
+        self.assertTrue(await StateFlowTerminationStrategy().should_terminate(self.agent, self.history.messages))
+
+    async def test_submit_after_candidates_returns_winning_observation(self):
+        sql_env = SqlEnv({})
+        sql_env.observation = [("users",)]
+        self.agent.env = sql_env
+        self.pooled_envs[0].step_async.return_value = (f"{Constants.sql_error_message}: Unknown table", None, None, None)
+        self.pooled_envs[1].step_async.return_value = ([(42,)], None, None, None)
+        self.pooled_envs[2].step_async.return_value = ([(42,)], None, None, None)
+        [message async for message in self.agent.invoke(self.history)]
+
+        self.history.add_message(ChatMessageContent(
+            role=AuthorRole.ASSISTANT, name="verify", content=f"Thought: answered\n{Constants.action_identifier} {Constants.action_submit}",
+        ))
+        messages = [message async for message in self.agent.invoke(self.history)]
+
+        # The submit answers with the observation of the winning candidate, not the one before it
+        self.assertEqual(messages[0].content, f"{Constants.observation_identifier}[(42,)]")
+        self.assertEqual(sql_env.trajectory, [("SELECT COUNT(*) FROM users", [(42,)]), (Constants.action_submit, None)])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+from src.cache.answer_cache import (
+    AnswerCache,
+    InMemoryAnswerCacheBackend,
+    SchemaFingerprint,
+    SqliteAnswerCacheBackend,
+)
+
+class TestAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = AnswerCache(InMemoryAnswerCacheBackend(max_entries=2), ttl=60)
+        self.fingerprint = AnswerCache.get_schema_fingerprint([("customers",), ("orders",)])
+        self.answer = {"content": "42", "finish_reason": "stop", "is_error": "false"}
+
+    def test_normalize_question(self):
+        self.assertEqual(AnswerCache.normalize_question("  How many\n customers? "), "how many customers")
+        self.assertEqual(AnswerCache.normalize_question("How many customers"), "how many customers")
+
+    def test_get_schema_fingerprint(self):
+        self.assertEqual(self.fingerprint, AnswerCache.get_schema_fingerprint([("customers",), ("orders",)]))
+        self.assertNotEqual(self.fingerprint, AnswerCache.get_schema_fingerprint([("customers",)]))
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("How many customers?", self.fingerprint))
+        self.cache.set("How many customers?", self.fingerprint, self.answer)
+        self.assertEqual(self.cache.get("how many customers", self.fingerprint), self.answer)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_get_expired(self):
+        self.cache.set("How many customers?", self.fingerprint, self.answer)
+        with patch('src.cache.answer_cache.time.time', return_value=10**12):
+            self.assertIsNone(self.cache.get("How many customers?", self.fingerprint))
+
+    def test_set_evicts_least_recently_used(self):
+        self.cache.set("q1", self.fingerprint, self.answer)
+        self.cache.set("q2", self.fingerprint, self.answer)
+        self.cache.get("q1", self.fingerprint)
+        self.cache.set("q3", self.fingerprint, self.answer)
+        self.assertIsNotNone(self.cache.get("q1", self.fingerprint))
+        self.assertIsNone(self.cache.get("q2", self.fingerprint))
+        self.assertIsNotNone(self.cache.get("q3", self.fingerprint))
+
+    def test_schema_change_invalidates(self):
+        self.cache.set("q1", self.fingerprint, self.answer)
+        new_fingerprint = AnswerCache.get_schema_fingerprint([("customers",)])
+        self.assertIsNone(self.cache.get("q1", new_fingerprint))
+        self.assertIsNone(self.cache.get("q1", self.fingerprint))
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "answers.db")
+            cache = AnswerCache(SqliteAnswerCacheBackend(path, max_entries=2), ttl=60)
+            cache.set("q1", self.fingerprint, self.answer)
+            cache.set("q2", self.fingerprint, self.answer)
+            cache.get("q1", self.fingerprint)
+            cache.set("q3", self.fingerprint, self.answer)
+            self.assertIsNone(cache.get("q2", self.fingerprint))
+
+            # The answers survive a restart
+            reopened = AnswerCache(SqliteAnswerCacheBackend(path, max_entries=2), ttl=60)
+            self.assertEqual(reopened.get("q1", self.fingerprint), self.answer)
+            with patch('src.cache.answer_cache.time.time', return_value=10**12):
+                self.assertIsNone(reopened.get("q3", self.fingerprint))
+
+    def test_get_answer_cache_from_environment(self):
+        with patch.dict(AnswerCache.CACHE_CONFIG, {"backend": "none"}):
+            self.assertIsNone(AnswerCache.get_answer_cache_from_environment())
+        with patch.dict(AnswerCache.CACHE_CONFIG, {"backend": "memory"}):
+            self.assertIsInstance(AnswerCache.get_answer_cache_from_environment().backend, InMemoryAnswerCacheBackend)
+        with patch.dict(AnswerCache.CACHE_CONFIG, {"backend": "unknown"}):
+            with self.assertRaises(ValueError):
+                AnswerCache.get_answer_cache_from_environment()
+
+class TestSchemaFingerprint(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.patcher = patch('src.cache.answer_cache.mysql.connector.connect')
+        self.connect = self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.cursor = self.connect.return_value.cursor.return_value
+        self.cursor.fetchall.return_value = [("orders", "amount", "int", "NO", "", None, "")]
+        self.fingerprint = SchemaFingerprint({"host": "h", "port": 3306, "user": "u", "database": "d", "password": "p"}, refresh_interval=60)
+
+    def test_refresh_covers_columns(self):
+        fingerprint = self.fingerprint.refresh()
+        self.cursor.fetchall.return_value = [("orders", "amount", "decimal(10,2)", "NO", "", None, "")]
+        # A changed column type changes the fingerprint, not only a new table
+        self.assertNotEqual(self.fingerprint.refresh(), fingerprint)
+        self.connect.return_value.close.assert_called()
+
+    async def test_get_refreshes_in_background(self):
+        # The first lookup does not wait, the cache is skipped until the fingerprint is known
+        self.assertIsNone(self.fingerprint.get())
+        await asyncio.wait([self.fingerprint._refreshing])
+        fingerprint = self.fingerprint.get()
+        self.assertIsNotNone(fingerprint)
+        self.assertEqual(self.connect.call_count, 1)
+
+        # A stale fingerprint is still returned while it is refreshed
+        self.cursor.fetchall.return_value = [("orders", "total", "int", "NO", "", None, "")]
+        self.fingerprint.refreshed_at -= 61
+        self.assertEqual(self.fingerprint.get(), fingerprint)
+        await asyncio.wait([self.fingerprint._refreshing])
+        self.assertNotEqual(self.fingerprint.get(), fingerprint)
+        self.assertEqual(self.connect.call_count, 2)
+
+    async def test_failed_refresh_keeps_fingerprint(self):
+        fingerprint = self.fingerprint.refresh()
+        self.connect.side_effect = ConnectionError("down")
+        self.fingerprint.refreshed_at -= 61
+        self.assertEqual(self.fingerprint.get(), fingerprint)
+        await asyncio.wait([self.fingerprint._refreshing])
+        self.assertEqual(self.fingerprint.value, fingerprint)
+
+if __name__ == '__main__':
+    unittest.main()
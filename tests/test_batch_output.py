@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "experimentation"))
+
+from exp_src.model.batch_output import BatchOutput, AgentInvokingData, AgentInvokingTrajectory, ConversationMessages
+
+USER_MESSAGE = "USER - user: Question: How many customers?\nThought: list the tables"
+OUTPUTS = [
+    "ASSISTANT - observe: Thought: I should describe customers\nAction: execute[DESC customers]",
+    "ASSISTANT - executor: Observation: [('customerNumber', 'int')]",
+    "ASSISTANT - select: Thought: count them\nAction: execute[SELECT COUNT(*) FROM customers]",
+]
+
+
+class TestConversationMessages(unittest.TestCase):
+
+    def setUp(self):
+        # The history the records copied before the messages were shared
+        self.expected_histories = []
+        conversation_history = f"{USER_MESSAGE}\n"
+        for output in OUTPUTS:
+            self.expected_histories.append(conversation_history)
+            conversation_history += f"{output}\n"
+
+        self.messages = ConversationMessages()
+        history_offset = self.messages.append(USER_MESSAGE)
+        self.outputs = []
+        self.agent_selections = []
+        for output in OUTPUTS:
+            name = output.split(" - ")[1].split(":")[0]
+            self.outputs.append(BatchOutput(
+                role=name, name=name, threadId="thread", parentId="parent", input="How many customers?",
+                output=output, conversation_history=None, experiment="experiment",
+                messages=self.messages, history_offset=history_offset,
+            ))
+            self.agent_selections.append(AgentInvokingData(
+                name=name, conversation_history=None, messages=self.messages, history_offset=history_offset,
+            ))
+            history_offset = self.messages.append(output)
+        self.trajectory = AgentInvokingTrajectory(
+            experiment="experiment", threadId="thread", input="How many customers?", final_output=OUTPUTS[-1],
+            agent_selections=self.agent_selections, messages=self.messages, parentId="parent",
+        )
+
+    def test_history_matches_copied_history(self):
+        self.assertEqual([output.conversation_history for output in self.outputs], self.expected_histories)
+        self.assertEqual([agent.conversation_history for agent in self.agent_selections], self.expected_histories)
+        self.assertEqual(
+            [output.to_dict_without_role()["conversation_history"] for output in self.outputs],
+            self.expected_histories,
+        )
+
+    def test_reference_format_resolves_to_value_format(self):
+        trajectory = json.loads(json.dumps(self.trajectory.to_dict("reference")))
+        self.assertEqual(trajectory["messages"], [USER_MESSAGE, *OUTPUTS])
+        self.assertNotIn("conversation_history", trajectory["agent_selections"][0])
+        # A record in the reference format resolves against the trajectory with the same parentId
+        for output, expected_history in zip(self.outputs, self.expected_histories):
+            record = json.loads(json.dumps(output.to_dict_without_role("reference")))
+            self.assertEqual(record["parentId"], trajectory["parentId"])
+            messages = ConversationMessages(trajectory["messages"])
+            self.assertEqual(messages.get_history(record["conversation_history_offset"]), expected_history)
+
+    def test_from_dict_round_trip(self):
+        for history_format in ("value", "reference"):
+            with self.subTest(history_format=history_format):
+                data = json.loads(json.dumps(self.trajectory.to_dict(history_format)))
+                loaded = AgentInvokingTrajectory.from_dict(data)
+                self.assertEqual(loaded.to_dict("value"), self.trajectory.to_dict("value"))
+                self.assertEqual(loaded.to_flattened_dict(), self.trajectory.to_flattened_dict())
+                self.assertEqual(
+                    [item["conversation_history"] for item in loaded.to_flattened_dict()],
+                    self.expected_histories,
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
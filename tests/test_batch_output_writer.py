@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import importlib.util
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "experimentation"))
+
+from exp_src.model.batch_output import BatchOutput
+from exp_src.persistence.batch_output_writer import BatchOutputWriter
+from exp_src.persistence.batch_columnar_writer import BatchColumnarWriter
+
+STEP = {"experiment": "e", "thread_id": "t", "input_index": 0, "input": "q", "step_index": 0, "role": "select", "output": "o"}
+
+
+class TestBatchOutputWriterColumnarParts(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = self.directory.name
+        self.trajectory = MagicMock()
+        self.trajectory.to_dict.return_value = {"id": "trajectory"}
+
+    def _touch(self, file_name):
+        with open(os.path.join(self.path, file_name), "w") as f:
+            f.write("rows")
+
+    def test_checkpoint_records_columnar_parts(self):
+        columnar_writer = MagicMock(spec=BatchColumnarWriter)
+        columnar_writer.checkpoint.side_effect = [["steps.part-0.parquet"], []]
+        columnar_writer.compact.side_effect = lambda parts: parts
+        with BatchOutputWriter(self.path, checkpoint_interval=1, columnar_writer=columnar_writer) as writer:
+            writer.write_conversation([], self.trajectory, "a", [STEP])
+
+        # A new run drops the parts of the previous run, the steps go to the part of the checkpoint
+        columnar_writer.reset.assert_called_once_with([])
+        columnar_writer.write_steps.assert_called_once_with([STEP])
+        with open(os.path.join(self.path, BatchOutputWriter.manifest_file_name)) as f:
+            checkpoint = json.loads(f.readline())
+        self.assertEqual(checkpoint["completed"], ["a"])
+        self.assertEqual(checkpoint["parts"], ["steps.part-0.parquet"])
+
+    def test_resume_drops_parts_after_the_last_checkpoint(self):
+        columnar_writer = MagicMock(spec=BatchColumnarWriter)
+        columnar_writer.checkpoint.side_effect = [["steps.part-0.parquet"], []]
+        columnar_writer.compact.side_effect = lambda parts: parts
+        with BatchOutputWriter(self.path, checkpoint_interval=1, columnar_writer=columnar_writer) as writer:
+            writer.write_conversation([], self.trajectory, "a", [STEP])
+        self._touch("steps.part-0.parquet")
+        # A killed run leaves a part completed after the manifest and a part without footer
+        self._touch("steps.part-1.parquet")
+        self._touch("steps.part-2.parquet.tmp")
+
+        columnar_writer = MagicMock(spec=BatchColumnarWriter)
+        columnar_writer.checkpoint.return_value = []
+        columnar_writer.compact.side_effect = lambda parts: parts
+        columnar_writer.reset.side_effect = lambda parts: BatchColumnarWriter.drop_uncommitted_parts(self.path, parts)
+        with BatchOutputWriter(self.path, resume=True, columnar_writer=columnar_writer) as writer:
+            self.assertTrue(writer.is_completed("a"))
+
+        columnar_writer.reset.assert_called_once_with(["steps.part-0.parquet"])
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.path) if name.startswith(BatchColumnarWriter.file_prefix)),
+            ["steps.part-0.parquet"],
+        )
+
+    def test_resume_truncates_outputs_after_the_last_checkpoint(self):
+        output = BatchOutput(
+            role="select", name="select", threadId="t", parentId="p", input="q", output="o",
+            conversation_history="h", experiment="e",
+        )
+        columnar_writer = MagicMock(spec=BatchColumnarWriter)
+        columnar_writer.checkpoint.side_effect = [["steps.part-0.parquet"], ["steps.part-1.parquet"]]
+        writer = BatchOutputWriter(self.path, checkpoint_interval=1, columnar_writer=columnar_writer)
+        writer.write_conversation([output], self.trajectory, "a", [STEP])
+        checkpointed_sizes = dict(writer.checkpointed_sizes)
+        # The run is killed after writing the second question, before its checkpoint
+        writer.checkpoint_interval = 10**6
+        writer.write_conversation([output], self.trajectory, "b", [STEP])
+        for f in writer.files.values():
+            f.flush()
+        writer.manifest.close()
+        self._touch("steps.part-1.parquet")
+        self.assertGreater(os.path.getsize(os.path.join(self.path, "select.jsonl")), checkpointed_sizes["select.jsonl"])
+
+        columnar_writer = MagicMock(spec=BatchColumnarWriter)
+        columnar_writer.checkpoint.return_value = []
+        columnar_writer.compact.side_effect = lambda parts: parts
+        columnar_writer.reset.side_effect = lambda parts: BatchColumnarWriter.drop_uncommitted_parts(self.path, parts)
+        with BatchOutputWriter(self.path, resume=True, columnar_writer=columnar_writer) as writer:
+            self.assertTrue(writer.is_completed("a"))
+            self.assertFalse(writer.is_completed("b"))
+            self.assertEqual(writer.checkpointed_sizes, checkpointed_sizes)
+
+        for file_name, size in checkpointed_sizes.items():
+            self.assertEqual(os.path.getsize(os.path.join(self.path, file_name)), size)
+        with open(os.path.join(self.path, "select.jsonl")) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertNotIn("steps.part-1.parquet", os.listdir(self.path))
+
+    def test_close_replaces_parts_with_compacted_part(self):
+        columnar_writer = MagicMock(spec=BatchColumnarWriter)
+        columnar_writer.checkpoint.side_effect = [["steps.part-0.parquet"], ["steps.part-1.parquet"], []]
+        columnar_writer.compact.return_value = ["steps.part-2.parquet"]
+        with BatchOutputWriter(self.path, checkpoint_interval=1, columnar_writer=columnar_writer) as writer:
+            writer.write_conversation([], self.trajectory, "a", [STEP])
+            writer.write_conversation([], self.trajectory, "b", [STEP])
+
+        columnar_writer.compact.assert_called_once_with(["steps.part-0.parquet", "steps.part-1.parquet"])
+        columnar_writer.remove_parts.assert_called_once_with(["steps.part-0.parquet", "steps.part-1.parquet"])
+        # A resumed run only keeps the compacted part
+        columnar_writer = MagicMock(spec=BatchColumnarWriter)
+        columnar_writer.checkpoint.return_value = []
+        columnar_writer.compact.side_effect = lambda parts: parts
+        with BatchOutputWriter(self.path, resume=True, columnar_writer=columnar_writer):
+            pass
+        columnar_writer.reset.assert_called_once_with(["steps.part-2.parquet"])
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_compact_writes_one_part_of_full_row_groups(self):
+        import pyarrow.parquet as pq
+
+        with BatchColumnarWriter(self.path, row_group_size=4) as columnar_writer, \
+                BatchOutputWriter(self.path, checkpoint_interval=1, columnar_writer=columnar_writer) as writer:
+            for index in range(10):
+                writer.write_conversation([], self.trajectory, str(index), [{**STEP, "input_index": index}])
+
+        parts = [name for name in os.listdir(self.path) if name.startswith(BatchColumnarWriter.file_prefix)]
+        self.assertEqual(len(parts), 1)
+        parquet_file = pq.ParquetFile(os.path.join(self.path, parts[0]))
+        self.assertEqual([parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)], [4, 4, 2])
+        self.assertEqual(parquet_file.read().column("input_index").to_pylist(), list(range(10)))
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_resume_writes_each_step_once(self):
+        import pyarrow.parquet as pq
+
+        with BatchColumnarWriter(self.path) as columnar_writer, \
+                BatchOutputWriter(self.path, checkpoint_interval=1, columnar_writer=columnar_writer) as writer:
+            writer.write_conversation([], self.trajectory, "a", [STEP])
+            # The run is killed before the checkpoint of the second question
+            columnar_writer.write_steps([{**STEP, "input": "q2"}])
+            columnar_writer.flush()
+            writer.checkpoint_interval = 10**6
+            writer.write_conversation([], self.trajectory, "b", [])
+            writer.close = writer.manifest.close
+
+        with BatchColumnarWriter(self.path) as columnar_writer, \
+                BatchOutputWriter(self.path, resume=True, columnar_writer=columnar_writer) as writer:
+            self.assertFalse(writer.is_completed("b"))
+            writer.write_conversation([], self.trajectory, "b", [{**STEP, "input": "q2"}])
+
+        table = pq.read_table([os.path.join(self.path, name) for name in sorted(os.listdir(self.path)) if name.endswith(".parquet")])
+        self.assertEqual(table.column("input").to_pylist(), ["q", "q2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
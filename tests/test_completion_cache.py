@@ -0,0 +1,159 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+from openai.types import CompletionUsage
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from semantic_kernel.contents.utils.finish_reason import FinishReason
+from src.cache.completion_cache import CachedChatCompletion, CompletionCache, CompletionCacheMissError
+
+
+class CountingChatCompletion(ChatCompletionClientBase):
+    calls: int = 0
+
+    async def _inner_get_chat_message_contents(self, chat_history, settings):
+        self.calls += 1
+        return [ChatMessageContent(
+            role=AuthorRole.ASSISTANT,
+            content=f"Thought: call {self.calls}\nAction: execute[SHOW TABLES]",
+            ai_model_id=self.ai_model_id,
+            finish_reason=FinishReason.STOP,
+            metadata={"usage": CompletionUsage(prompt_tokens=10, completion_tokens=5, total_tokens=15)},
+        )]
+
+    async def _inner_get_streaming_chat_message_contents(self, chat_history, settings, function_invoke_attempt=0):
+        self.calls += 1
+        for chunk in ("Thought: streamed\n", "Action: ", "execute[SHOW TABLES]"):
+            yield [StreamingChatMessageContent(role=AuthorRole.ASSISTANT, content=chunk, choice_index=0)]
+
+
+class TestCompletionCache(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "completions.db")
+        self.chat = ChatHistory()
+        self.chat.add_user_message("Question: How many customers?")
+        self.settings = PromptExecutionSettings(service_id="observe", extension_data={"temperature": 0})
+
+    def _get_service(self, mode: str) -> tuple[CountingChatCompletion, CachedChatCompletion]:
+        cache = CompletionCache(self.path, mode=mode)
+        self.addCleanup(cache.close)
+        inner = CountingChatCompletion(service_id="observe", ai_model_id="gpt")
+        return inner, CachedChatCompletion.wrap(inner, cache)
+
+    def test_record_then_replay(self):
+        inner, service = self._get_service("record")
+        recorded = asyncio.run(service.get_chat_message_contents(self.chat, self.settings))
+        self.assertEqual(inner.calls, 1)
+        self.assertEqual(service.service_id, "observe")
+        self.assertEqual(service.ai_model_id, "gpt")
+
+        # The completions survive a restart and are replayed without calling the service
+        inner, service = self._get_service("replay")
+        replayed = asyncio.run(service.get_chat_message_contents(self.chat, self.settings))
+        self.assertEqual(inner.calls, 0)
+        self.assertEqual(replayed[0].content, recorded[0].content)
+        self.assertEqual(replayed[0].finish_reason, FinishReason.STOP)
+        self.assertEqual(replayed[0].metadata["usage"].prompt_tokens, 10)
+        self.assertEqual(service.cache.hits, 1)
+
+    def test_replay_miss(self):
+        _, service = self._get_service("replay")
+        with self.assertRaises(CompletionCacheMissError):
+            asyncio.run(service.get_chat_message_contents(self.chat, self.settings))
+        self.assertEqual(service.cache.misses, 1)
+
+    def test_get_key(self):
+        key = CompletionCache.get_key("observe", "gpt", self.settings, self.chat)
+        self.assertEqual(key, CompletionCache.get_key("observe", "gpt", self.settings, self.chat))
+        self.assertNotEqual(key, CompletionCache.get_key("select", "gpt", self.settings, self.chat))
+        self.assertNotEqual(key, CompletionCache.get_key("observe", "gpt-mini", self.settings, self.chat))
+        other_settings = PromptExecutionSettings(service_id="observe", extension_data={"temperature": 1})
+        self.assertNotEqual(key, CompletionCache.get_key("observe", "gpt", other_settings, self.chat))
+        other_chat = ChatHistory()
+        other_chat.add_user_message("Question: How many orders?")
+        self.assertNotEqual(key, CompletionCache.get_key("observe", "gpt", self.settings, other_chat))
+
+    def test_streaming_record_then_replay(self):
+        async def stream(service):
+            chunks = []
+            async for message_list in service.get_streaming_chat_message_contents(self.chat, self.settings):
+                chunks.extend(message.content for message in message_list)
+            return "".join(chunks)
+
+        inner, service = self._get_service("record")
+        recorded = asyncio.run(stream(service))
+        self.assertEqual(inner.calls, 1)
+
+        inner, service = self._get_service("replay")
+        self.assertEqual(asyncio.run(stream(service)), recorded)
+        self.assertEqual(inner.calls, 0)
+
+    def test_streaming_is_keyed_apart(self):
+        async def stream(service):
+            async for _ in service.get_streaming_chat_message_contents(self.chat, self.settings):
+                pass
+
+        _, service = self._get_service("record")
+        asyncio.run(stream(service))
+        self.assertNotEqual(
+            CompletionCache.get_key("observe", "gpt", self.settings, self.chat),
+            CompletionCache.get_key("observe", "gpt", self.settings, self.chat, streaming=True),
+        )
+
+        # A streamed completion may be cut short by the agents, it is not replayed to a non-streaming call
+        _, service = self._get_service("replay")
+        with self.assertRaises(CompletionCacheMissError):
+            asyncio.run(service.get_chat_message_contents(self.chat, self.settings))
+
+    def test_streaming_closed_early_is_recorded(self):
+        async def first_chunk(service):
+            stream = service.get_streaming_chat_message_contents(self.chat, self.settings)
+            message_list = await stream.__anext__()
+            await stream.aclose()
+            return message_list[0].content
+
+        _, service = self._get_service("record")
+        self.assertEqual(asyncio.run(first_chunk(service)), "Thought: streamed\n")
+        self.assertEqual(service.cache.recorded, 1)
+
+    def test_streaming_failure_is_not_recorded(self):
+        async def failing_stream(chat_history, settings, **kwargs):
+            yield [StreamingChatMessageContent(role=AuthorRole.ASSISTANT, content="Thought: cut", choice_index=0)]
+            raise TimeoutError("Read timed out")
+
+        async def stream(service):
+            async for _ in service.get_streaming_chat_message_contents(self.chat, self.settings):
+                pass
+
+        inner, service = self._get_service("record")
+        with patch.object(type(inner), "get_streaming_chat_message_contents", side_effect=failing_stream):
+            with self.assertRaises(TimeoutError):
+                asyncio.run(stream(service))
+        self.assertEqual(service.cache.recorded, 0)
+
+        _, service = self._get_service("replay")
+        with self.assertRaises(CompletionCacheMissError):
+            asyncio.run(stream(service))
+
+    def test_get_completion_cache_from_environment(self):
+        with patch.dict(CompletionCache.CACHE_CONFIG, {"mode": "passthrough"}):
+            self.assertIsNone(CompletionCache.get_completion_cache_from_environment())
+        with patch.dict(CompletionCache.CACHE_CONFIG, {"mode": "replay", "path": self.path}):
+            cache = CompletionCache.get_completion_cache_from_environment()
+            self.assertEqual(cache.mode, "replay")
+            cache.close()
+        with patch.dict(CompletionCache.CACHE_CONFIG, {"mode": "unknown", "path": self.path}):
+            with self.assertRaises(ValueError):
+                CompletionCache.get_completion_cache_from_environment()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
 import os
+import time
+import asyncio
+import threading
 import unittest
 from unittest.mock import patch, MagicMock
 from src.mysql.execution_env import SqlEnv
@@ -92,5 +95,144 @@ class TestSqlEnv(unittest.TestCase):
         expected_result = f"Question: {query}\n{Constants.init_thought}\nAction: execute[{Constants.sql_show_tables}]\nObservation: Initial Observation"
         self.assertEqual(result, expected_result)
 
+class TestSqlEnvAsync(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.config = {
+            "host": "localhost",
+            "port": 3306,
+            "user": "root",
+            "database": "test_db",
+            "password": "password"
+        }
+        self.sql_env = SqlEnv(self.config)
+        self.sql_env.cnx = MagicMock()
+        self.sql_env.cursor = MagicMock()
+        self.sql_env.cursor.fetchall.return_value = [("row1",)]
+
+    @patch('src.mysql.execution_env.SqlEnv.get_init_observation')
+    async def test_attach_init_observation_async(self, mock_get_init_observation):
+        loop_thread = threading.get_ident()
+        threads = []
+        mock_get_init_observation.side_effect = lambda: threads.append(threading.get_ident()) or "Initial Observation"
+        result = await self.sql_env.attach_init_observation_async("question")
+        self.assertTrue(result.endswith("Observation: Initial Observation"))
+        # The catalog refresh or the SHOW TABLES must not block the event loop
+        self.assertNotEqual(threads, [loop_thread])
+
+    async def test_step_async(self):
+        observation, reward, done, info = await self.sql_env.step_async("SELECT * FROM test_table")
+        self.sql_env.cursor.execute.assert_called_once_with("SELECT * FROM test_table")
+        self.assertEqual(observation, [("row1",)])
+        self.assertEqual(reward, 0)
+        self.assertFalse(done)
+        self.assertTrue(info["action_executed"])
+        self.assertFalse(self.sql_env.interrupted)
+
+    @patch('src.mysql.execution_env.SqlEnv.kill_query')
+    async def test_step_async_timeout(self, mock_kill_query):
+        self.sql_env.cursor.execute.side_effect = lambda action: time.sleep(0.5)
+        observation, _, done, info = await self.sql_env.step_async("SELECT SLEEP(10)", timeout=0.05)
+        mock_kill_query.assert_called_once()
+        self.assertIn(Constants.sql_error_message, observation)
+        self.assertFalse(done)
+        self.assertIsInstance(info["error"], TimeoutError)
+        self.assertTrue(self.sql_env.interrupted)
+
+    @patch('src.mysql.execution_env.SqlEnv.kill_query')
+    async def test_step_async_cancelled(self, mock_kill_query):
+        self.sql_env.cursor.execute.side_effect = lambda action: time.sleep(0.5)
+        task = asyncio.ensure_future(self.sql_env.step_async("SELECT SLEEP(10)"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.gather(*SqlEnv._interrupt_tasks)
+        mock_kill_query.assert_called_once()
+        self.assertTrue(self.sql_env.interrupted)
+
+    @patch('src.mysql.execution_env.mysql.connector.connect')
+    def test_kill_query(self, mock_connect):
+        self.sql_env.cnx.connection_id = 42
+        killer_cursor = mock_connect.return_value.cursor.return_value
+        self.sql_env.kill_query()
+        killer_cursor.execute.assert_called_once_with("KILL QUERY 42")
+        mock_connect.return_value.close.assert_called_once()
+
+class TestSqlEnvStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.sql_env = SqlEnv({"host": "localhost", "port": 3306, "user": "root", "database": "test_db", "password": "password"})
+        self.sql_env.fetch_mode = "streaming"
+        self.sql_env.fetch_limit = False
+        self.sql_env.cnx = MagicMock()
+        self.sql_env.cursor = MagicMock()
+        self.rows = [(i,) for i in range(Constants.observation_max_rows)]
+        self.sql_env.cursor.fetchmany.return_value = self.rows
+
+    @patch('src.mysql.execution_env.mysql.connector.connect')
+    def test_connect_unbuffered(self, mock_connect):
+        self.sql_env.connect()
+        mock_connect.return_value.cursor.assert_called_once_with(buffered=False)
+
+    @patch('src.mysql.execution_env.SqlEnv.kill_query')
+    def test_fetch_observation_cancels_large_rest(self, mock_kill_query):
+        rows = [(i,) for i in range(Constants.observation_max_rows + 1)]
+        self.sql_env.cursor.fetchmany.side_effect = [rows, [(0,)] * (SqlEnv.FETCH_DRAIN_ROWS + 1)]
+        observation, _, _, _ = self.sql_env.step("SHOW PROCESSLIST")
+        # The extra row tells the agent the observation is truncated
+        self.assertEqual(observation, rows)
+        self.sql_env.cursor.fetchmany.assert_any_call(Constants.observation_max_rows + 1)
+        self.sql_env.cursor.fetchall.assert_not_called()
+        mock_kill_query.assert_called_once()
+        self.sql_env.cnx.close.assert_called_once()
+
+    @patch('src.mysql.execution_env.SqlEnv.kill_query')
+    def test_fetch_observation_drains_small_rest(self, mock_kill_query):
+        rows = [(i,) for i in range(Constants.observation_max_rows + 1)]
+        self.sql_env.cursor.fetchmany.side_effect = [rows, [(0,)] * 10]
+        observation, _, _, _ = self.sql_env.step("SHOW PROCESSLIST")
+        self.assertEqual(observation, rows)
+        self.sql_env.cursor.fetchmany.assert_called_with(SqlEnv.FETCH_DRAIN_ROWS + 1)
+        # The connection stays usable for the next action
+        mock_kill_query.assert_not_called()
+        self.sql_env.cnx.close.assert_not_called()
+
+    @patch('src.mysql.execution_env.SqlEnv.kill_query')
+    def test_fetch_observation_complete_result(self, mock_kill_query):
+        observation, _, _, _ = self.sql_env.step("SHOW PROCESSLIST")
+        self.assertEqual(observation, self.rows)
+        self.sql_env.cursor.fetchmany.assert_called_once_with(Constants.observation_max_rows + 1)
+        mock_kill_query.assert_not_called()
+        self.sql_env.cnx.close.assert_not_called()
+
+    @patch('src.mysql.execution_env.SqlEnv.kill_query')
+    def test_fetch_limit(self, mock_kill_query):
+        self.sql_env.fetch_limit = True
+        rows = [(i,) for i in range(Constants.observation_max_rows + 1)]
+        self.sql_env.cursor.fetchmany.side_effect = [rows, []]
+        self.sql_env.step("SELECT id FROM big_table;")
+        self.sql_env.cursor.execute.assert_called_once_with(f"SELECT id FROM big_table LIMIT {Constants.observation_max_rows + 1}")
+        mock_kill_query.assert_not_called()
+        self.sql_env.cnx.close.assert_not_called()
+
+    def test_fetch_limit_defaults_to_streaming(self):
+        with patch.object(SqlEnv, "FETCH_LIMIT", ""):
+            with patch.object(SqlEnv, "FETCH_MODE", "streaming"):
+                self.assertTrue(SqlEnv({}).fetch_limit)
+            with patch.object(SqlEnv, "FETCH_MODE", "buffered"):
+                self.assertFalse(SqlEnv({}).fetch_limit)
+        with patch.object(SqlEnv, "FETCH_LIMIT", "false"), patch.object(SqlEnv, "FETCH_MODE", "streaming"):
+            self.assertFalse(SqlEnv({}).fetch_limit)
+
+    def test_limit_action(self):
+        self.assertEqual(self.sql_env.limit_action("SELECT * FROM t LIMIT 5"), "SELECT * FROM t LIMIT 5")
+        self.assertEqual(self.sql_env.limit_action("SELECT * FROM t LIMIT 5, 10"), "SELECT * FROM t LIMIT 5, 10")
+        self.assertEqual(self.sql_env.limit_action("DESC t"), "DESC t")
+        self.assertEqual(
+            self.sql_env.limit_action("WITH c AS (SELECT 1 LIMIT 1) SELECT * FROM c"),
+            f"WITH c AS (SELECT 1 LIMIT 1) SELECT * FROM c LIMIT {Constants.observation_max_rows + 1}",
+        )
+
 if __name__ == '__main__':
     unittest.main()
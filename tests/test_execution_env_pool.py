@@ -0,0 +1,124 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+from src.mysql.execution_env import SqlEnv
+from src.mysql.execution_env_pool import SqlEnvPool
+
+class TestSqlEnvPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.config = {
+            "host": "localhost",
+            "port": 3306,
+            "user": "root",
+            "database": "test_db",
+            "password": "password"
+        }
+        patcher = patch('src.mysql.execution_env.mysql.connector.connect')
+        self.mock_connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_connect.side_effect = lambda **kwargs: MagicMock()
+        self.pool = SqlEnvPool(self.config, max_size=2, acquire_timeout=0.05)
+
+    def test_acquire_returns_isolated_sessions(self):
+        env_1 = self.pool.acquire()
+        env_2 = self.pool.acquire()
+        self.assertIsInstance(env_1, SqlEnv)
+        self.assertIsNot(env_1, env_2)
+        self.assertIsNot(env_1.cnx, env_2.cnx)
+        self.assertEqual(self.pool.size, 2)
+        self.assertEqual(self.mock_connect.call_count, 2)
+
+    def test_acquire_reuses_released_session(self):
+        env = self.pool.acquire()
+        env.trajectory.append(("SELECT 1", [(1,)]))
+        self.pool.release(env)
+        self.assertEqual(self.pool.idle_count, 1)
+        reused = self.pool.acquire()
+        self.assertIs(reused, env)
+        self.assertEqual(reused.trajectory, [])
+        self.assertEqual(self.mock_connect.call_count, 1)
+
+    def test_acquire_times_out_when_pool_is_exhausted(self):
+        self.pool.acquire()
+        self.pool.acquire()
+        with self.assertRaises(TimeoutError):
+            self.pool.acquire()
+
+    def test_acquire_replaces_unhealthy_session(self):
+        env = self.pool.acquire()
+        self.pool.release(env)
+        env.cnx.is_connected.return_value = False
+        replacement = self.pool.acquire()
+        self.assertIsNot(replacement, env)
+        env.cnx.close.assert_called_once()
+        self.assertEqual(self.pool.size, 1)
+
+    def test_acquire_evicts_idle_session(self):
+        self.pool.idle_timeout = 0
+        env = self.pool.acquire()
+        self.pool.release(env)
+        replacement = self.pool.acquire()
+        self.assertIsNot(replacement, env)
+        env.cnx.close.assert_called_once()
+
+    def test_release_closes_session_past_max_lifetime(self):
+        self.pool.max_lifetime = 0
+        env = self.pool.acquire()
+        self.pool.release(env)
+        self.assertEqual(self.pool.idle_count, 0)
+        self.assertEqual(self.pool.size, 0)
+        env.cnx.close.assert_called_once()
+
+    def test_release_shares_initial_observation(self):
+        env = self.pool.acquire()
+        env.initial_observation = [("customers",)]
+        self.pool.release(env, discard=True)
+        other = self.pool.acquire()
+        self.assertIsNot(other, env)
+        self.assertEqual(other.initial_observation, [("customers",)])
+
+    def test_release_unknown_session(self):
+        with self.assertRaises(ValueError):
+            self.pool.release(SqlEnv(self.config))
+
+    def test_close(self):
+        env = self.pool.acquire()
+        self.pool.release(env)
+        self.pool.close()
+        env.cnx.close.assert_called_once()
+        with self.assertRaises(RuntimeError):
+            self.pool.acquire()
+
+    async def test_lease(self):
+        async with self.pool.lease() as env:
+            self.assertIsInstance(env, SqlEnv)
+            self.assertEqual(self.pool.idle_count, 0)
+        self.assertEqual(self.pool.idle_count, 1)
+
+    async def test_lease_waits_outside_default_executor(self):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+        self.pool.acquire_timeout = 5
+        envs = [self.pool.acquire(), self.pool.acquire()]
+        waiters = [asyncio.ensure_future(self.pool.acquire_async()) for _ in range(3)]
+        await asyncio.sleep(0.05)
+
+        # The waiting conversations leave the default executor free to kill queries
+        self.assertEqual(await asyncio.wait_for(loop.run_in_executor(None, lambda: "killed"), 1), "killed")
+        for env in envs:
+            self.pool.release(env)
+        done, pending = await asyncio.wait(waiters, timeout=1)
+        self.assertEqual(len(done), 2)
+        self.pool.release(done.pop().result())
+        self.assertIsInstance(await asyncio.wait_for(pending.pop(), 1), SqlEnv)
+
+    async def test_acquire_async_times_out(self):
+        self.pool.acquire()
+        self.pool.acquire()
+        with self.assertRaises(TimeoutError):
+            await self.pool.acquire_async()
+
+if __name__ == '__main__':
+    unittest.main()
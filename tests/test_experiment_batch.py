@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import unittest
+import contextlib
+from unittest.mock import AsyncMock, MagicMock, patch
+import httpx
+from openai import RateLimitError
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "experimentation"))
+
+import app_experiment_batch
+from app_experiment_batch import RateLimitCoolDown, run_query
+
+
+def get_rate_limit_error(retry_after: str | None = None) -> RateLimitError:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://example.com"))
+    return RateLimitError("Too Many Requests", response=response, body=None)
+
+
+class TestRateLimitCoolDown(unittest.IsolatedAsyncioTestCase):
+
+    def test_get_rate_limit_error_unwraps_causes(self):
+        rate_limit_error = get_rate_limit_error()
+        try:
+            try:
+                raise rate_limit_error
+            except RateLimitError as err:
+                raise RuntimeError("Service failed") from err
+        except RuntimeError as err:
+            self.assertIs(RateLimitCoolDown.get_rate_limit_error(err), rate_limit_error)
+        self.assertIsNone(RateLimitCoolDown.get_rate_limit_error(ValueError("Unknown table")))
+
+    @patch('app_experiment_batch.time.monotonic', return_value=100.0)
+    def test_trip_uses_retry_after(self, _):
+        cool_down = RateLimitCoolDown()
+        delay = cool_down.trip(get_rate_limit_error("10"), attempt=0)
+        self.assertTrue(10 <= delay <= 12.5)
+        self.assertEqual(cool_down.resume_at, 100.0 + delay)
+
+    @patch('app_experiment_batch.time.monotonic', return_value=100.0)
+    def test_trip_backs_off_exponentially(self, _):
+        cool_down = RateLimitCoolDown(base_delay=2.0, max_delay=60.0)
+        self.assertTrue(8 <= cool_down.trip(get_rate_limit_error(), attempt=2) <= 10)
+        self.assertTrue(60 <= cool_down.trip(get_rate_limit_error(), attempt=10) <= 75)
+        # A shorter delay of another worker does not shorten the cool-down
+        resume_at = cool_down.resume_at
+        cool_down.trip(get_rate_limit_error("1"), attempt=0)
+        self.assertEqual(cool_down.resume_at, resume_at)
+
+
+class TestRunQuery(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pool = MagicMock()
+        self.pool.lease.side_effect = self._lease
+
+    @contextlib.asynccontextmanager
+    async def _lease(self):
+        yield MagicMock()
+
+    @patch('app_experiment_batch.run_conversation', new_callable=AsyncMock)
+    async def test_retries_after_rate_limit(self, run_conversation):
+        run_conversation.side_effect = [get_rate_limit_error("0"), ([], "trajectory", [])]
+        cool_down = RateLimitCoolDown()
+
+        result = await run_query(0, "question", self.pool, cool_down, "experiment", "thread")
+
+        self.assertEqual(result, ([], "trajectory", []))
+        self.assertEqual(run_conversation.await_count, 2)
+        self.assertEqual(self.pool.lease.call_count, 2)
+
+    @patch('app_experiment_batch.run_conversation', new_callable=AsyncMock)
+    async def test_gives_up_after_max_retries(self, run_conversation):
+        run_conversation.side_effect = get_rate_limit_error("0")
+
+        with self.assertRaises(RateLimitError):
+            await run_query(0, "question", self.pool, RateLimitCoolDown(max_retries=2), "experiment", "thread")
+        self.assertEqual(run_conversation.await_count, 3)
+
+    @patch('app_experiment_batch.run_conversation', new_callable=AsyncMock)
+    async def test_raises_other_errors_at_once(self, run_conversation):
+        run_conversation.side_effect = ValueError("Unknown table")
+
+        with self.assertRaises(ValueError):
+            await run_query(0, "question", self.pool, RateLimitCoolDown(), "experiment", "thread")
+        run_conversation.assert_awaited_once()
+
+
+class TestMain(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output_path = directory.name
+        self.input_file = os.path.join(directory.name, "queries.jsonl")
+        with open(self.input_file, "w") as f:
+            for index in range(6):
+                f.write(json.dumps({"input": f"question {index}"}) + "\n")
+        self.failing_query = None
+        # The later questions finish first
+        self.delays = [0.01 * (6 - index) for index in range(6)]
+        self.pool = MagicMock()
+        for target, value in (
+            ('app_experiment_batch.SqlEnvPool.get_sql_executor_env_pool_from_environment', self.pool),
+            ('app_experiment_batch.ThoughtActionParser.get_sql_candidates_from_environment', 1),
+            ('app_experiment_batch.print_completion_cache_stats', None),
+        ):
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def _run_query(self, index, input_query, *_):
+        await asyncio.sleep(self.delays[index])
+        if input_query == self.failing_query:
+            raise ValueError("Unknown table")
+        trajectory = MagicMock()
+        trajectory.to_dict.return_value = {"input": input_query}
+        return [], trajectory, []
+
+    def _read_inputs(self) -> list[str]:
+        with open(os.path.join(self.output_path, "all_agents.jsonl")) as f:
+            return [json.loads(line)["input"] for line in f]
+
+    async def test_writes_outputs_in_input_order(self):
+        with patch('app_experiment_batch.run_query', side_effect=self._run_query):
+            await app_experiment_batch.main(self.input_file, self.output_path, "experiment", concurrency=6)
+
+        self.assertEqual(self._read_inputs(), [f"question {index}" for index in range(6)])
+        self.pool.close.assert_called_once()
+
+    async def test_worker_error_stops_the_run(self):
+        self.failing_query = "question 4"
+        self.delays = [0.01 * index for index in range(6)]
+        with patch('app_experiment_batch.run_query', side_effect=self._run_query):
+            with self.assertRaises(ValueError):
+                await app_experiment_batch.main(self.input_file, self.output_path, "experiment", concurrency=6)
+
+        # The questions finished before the failure are written, the others are run again on resume
+        self.assertEqual(self._read_inputs(), [f"question {index}" for index in range(4)])
+        self.pool.close.assert_called_once()
+        with open(self.input_file) as f:
+            keys = [app_experiment_batch.BatchOutputWriter.get_input_key(line) for line in f]
+        writer = app_experiment_batch.BatchOutputWriter(self.output_path, resume=True)
+        self.addCleanup(writer.close)
+        self.assertEqual([writer.is_completed(key) for key in keys], [True] * 4 + [False] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
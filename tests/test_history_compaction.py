@@ -0,0 +1,113 @@
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+from semantic_kernel.kernel import Kernel
+from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from src.agents.base import StateFlowBaseAgent
+from src.agents.history_compaction import HistoryCompactor
+from src.utils.constants import Constants
+
+DESC_OBSERVATION = "Observation: [('id', 'int', 'NO', 'PRI', None, ''), ('amount', 'decimal(10,2)', 'NO', '', None, '')] References: customer_id -> customers.id"
+ROWS_OBSERVATION = "Observation: " + str([(index, f"customer {index}", index * 10.5) for index in range(25)])
+
+
+def get_message(name: str, content: str) -> ChatMessageContent:
+    return ChatMessageContent(role=AuthorRole.ASSISTANT, name=name, content=content)
+
+
+def get_history(select_turns: int = 1) -> ChatHistory:
+    messages = [
+        ChatMessageContent(role=AuthorRole.SYSTEM, name="select", content="instructions"),
+        ChatMessageContent(role=AuthorRole.USER, content=f"Question: Total order value\n{Constants.init_thought}\nAction: execute[SHOW TABLES]\nObservation: [('orders',)]"),
+        get_message("observe", "Thought: orders\nAction: execute[DESC orders]"),
+        get_message("executor", DESC_OBSERVATION),
+        get_message("select", "Thought: sum\nAction: execute[SELECT SUM(total) FROM orders]"),
+        get_message("executor", f"Observation: {Constants.sql_error_message}: Unknown column 'total'"),
+    ]
+    for index in range(select_turns):
+        messages.append(get_message("verify", f"Thought: check {index}\nAction: execute[SELECT * FROM orders LIMIT {index}]"))
+        messages.append(get_message("executor", ROWS_OBSERVATION))
+    return ChatHistory(messages=messages)
+
+
+class TestHistoryCompactor(unittest.TestCase):
+
+    def test_keeps_short_history(self):
+        history = ChatHistory(messages=get_history().messages[:4])
+        compacted = HistoryCompactor(keep_turns=2).compact(history)
+        self.assertEqual(len(compacted.messages), 4)
+        for message, original in zip(compacted.messages, history.messages):
+            self.assertIs(message, original)
+
+    def test_collapses_desc_and_failed_attempts(self):
+        history = get_history(select_turns=2)
+        compacted = HistoryCompactor(token_budget=100_000, keep_turns=1).compact(history).messages
+        self.assertIs(compacted[0], history.messages[0])
+        self.assertIs(compacted[1], history.messages[1])
+        summary = compacted[2].content
+        self.assertTrue(summary.startswith(Constants.history_summary_thought))
+        self.assertIn("Schema: orders(id int, amount decimal(10,2); references customer_id -> customers.id)", summary)
+        self.assertIn("Failed: execute[SELECT SUM(total) FROM orders] -> Error executing query: Unknown column 'total'", summary)
+        # The older successful query fits the budget and stays verbatim, followed by the latest turn
+        self.assertEqual([message.content for message in compacted[3:]], [message.content for message in history.messages[-4:]])
+
+    def test_collapses_successful_queries_over_budget(self):
+        history = get_history(select_turns=3)
+        compactor = HistoryCompactor(token_budget=600, keep_turns=1, note_max_chars=40)
+        compacted = compactor.compact(history).messages
+        self.assertLessEqual(HistoryCompactor.get_token_count(compacted), 600)
+        self.assertIn("Done: execute[SELECT * FROM orders LIMIT 0]", compacted[2].content)
+        self.assertIs(compacted[-1], history.messages[-1])
+
+    def test_prompt_size_is_bounded(self):
+        compactor = HistoryCompactor(token_budget=800, keep_turns=2, note_max_chars=40)
+        token_counts = [
+            HistoryCompactor.get_token_count(compactor.compact(get_history(select_turns)).messages)
+            for select_turns in range(2, 12)
+        ]
+        self.assertLessEqual(max(token_counts), 800)
+        self.assertGreater(HistoryCompactor.get_token_count(get_history(11).messages), 2 * 800)
+
+    def test_summarizes_earlier_questions(self):
+        history = get_history()
+        history.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content="Observation: [(1050.5,)]"))
+        history.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content="The total is 1050.5"))
+        history.add_message(ChatMessageContent(role=AuthorRole.USER, content="Question: Number of orders"))
+        compacted = HistoryCompactor(keep_turns=2).compact(history).messages
+        self.assertEqual(len(compacted), 3)
+        self.assertIn("Earlier question: Total order value", compacted[1].content)
+        self.assertIn("Earlier answer: The total is 1050.5", compacted[1].content)
+        self.assertIs(compacted[2], history.messages[-1])
+
+    def test_drops_oldest_questions_over_budget(self):
+        history = get_history()
+        for index in range(50):
+            history.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content=f"The answer is {index}"))
+            history.add_message(ChatMessageContent(role=AuthorRole.USER, content=f"Question: Question number {index}"))
+        compacted = HistoryCompactor(token_budget=300).compact(history).messages
+        self.assertLessEqual(HistoryCompactor.get_token_count(compacted), 300)
+        self.assertIn("Omitted:", compacted[1].content)
+        self.assertIn("Earlier question: Question number 48", compacted[1].content)
+
+    @patch.dict(os.environ, {"HISTORY_TOKEN_BUDGET_SELECT": "1200"})
+    def test_get_history_compactor_from_environment(self):
+        with patch.dict(HistoryCompactor.COMPACTION_CONFIG, {"enabled": True, "token_budget": 3000}):
+            self.assertEqual(HistoryCompactor.get_history_compactor_from_environment("select").token_budget, 1200)
+            self.assertEqual(HistoryCompactor.get_history_compactor_from_environment("verify").token_budget, 3000)
+        with patch.dict(HistoryCompactor.COMPACTION_CONFIG, {"enabled": False}):
+            self.assertIsNone(HistoryCompactor.get_history_compactor_from_environment("select"))
+
+    def test_agent_compacts_history(self):
+        agent = StateFlowBaseAgent(
+            service_id="select",
+            kernel=MagicMock(spec=Kernel),
+            name="select",
+            instructions="instructions",
+            history_compactor=HistoryCompactor(token_budget=100_000, keep_turns=1),
+        )
+        history = get_history(select_turns=2)
+        chat = agent._setup_agent_chat_history(ChatHistory(messages=history.messages[1:]))
+        self.assertEqual(chat.messages[0].content, "instructions")
+        self.assertTrue(chat.messages[2].content.startswith(Constants.history_summary_thought))
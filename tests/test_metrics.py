@@ -0,0 +1,76 @@
+import unittest
+from types import SimpleNamespace
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from src.logging.metrics import StateFlowMetrics, METER_NAME
+from src.logging.telemetry import _get_metric_views
+from src.utils.constants import Constants
+
+class TestStateFlowMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = InMemoryMetricReader()
+        self.meter_provider = MeterProvider(metric_readers=[self.reader], views=_get_metric_views())
+        self.metrics = StateFlowMetrics(self.meter_provider.get_meter(METER_NAME))
+        self.other_counter = self.meter_provider.get_meter("other").create_counter("other.counter")
+
+    def _get_data_points(self) -> dict:
+        data_points = {}
+        for resource_metrics in self.reader.get_metrics_data().resource_metrics:
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    data_points[metric.name] = list(metric.data.data_points)
+        return data_points
+
+    def test_record_llm_call(self):
+        self.metrics.record_llm_call("observe", 120.0, SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+        self.metrics.record_llm_call("select", 80.0)
+        data_points = self._get_data_points()
+        self.assertEqual(
+            {point.attributes["state"]: point.sum for point in data_points["state_flow.llm.duration"]},
+            {"observe": 120.0, "select": 80.0},
+        )
+        self.assertEqual(data_points["state_flow.llm.prompt_tokens"][0].sum, 100)
+        self.assertEqual(data_points["state_flow.llm.completion_tokens"][0].sum, 20)
+
+    def test_record_sql_execution(self):
+        self.metrics.record_sql_execution("executor", 5.0, [("row1",), ("row2",)])
+        self.metrics.record_sql_execution("executor", 7.0, f"{Constants.sql_error_message}: Unknown table")
+        data_points = self._get_data_points()
+        self.assertEqual(
+            {point.attributes["error"]: point.count for point in data_points["state_flow.sql.duration"]},
+            {False: 1, True: 1},
+        )
+        self.assertEqual(data_points["state_flow.sql.rows"][0].sum, 2)
+
+    def test_record_observation_truncation_and_termination(self):
+        self.metrics.record_observation_truncation("executor", "rows")
+        self.metrics.record_termination(6, "submit")
+        self.metrics.record_termination(15, "max_iterations")
+        data_points = self._get_data_points()
+        self.assertEqual(data_points["state_flow.observation.truncations"][0].value, 1)
+        self.assertEqual(
+            {point.attributes["reason"]: point.sum for point in data_points["state_flow.conversation.iterations"]},
+            {"submit": 6, "max_iterations": 15},
+        )
+
+    def test_record_output_fallback(self):
+        self.metrics.record_output_fallback("select", "missing")
+        self.metrics.record_output_fallback("select", "missing")
+        self.metrics.record_output_fallback("verify", "lenient")
+        data_points = self._get_data_points()
+        self.assertEqual(
+            {(point.attributes["state"], point.attributes["format"]): point.value
+             for point in data_points["state_flow.llm.output_fallbacks"]},
+            {("select", "missing"): 2, ("verify", "lenient"): 1},
+        )
+
+    def test_views_drop_other_instruments(self):
+        self.other_counter.add(1)
+        self.metrics.record_termination(6, "submit")
+        data_points = self._get_data_points()
+        self.assertNotIn("other.counter", data_points)
+        self.assertIn("state_flow.conversation.terminations", data_points)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from src.mysql.execution_env import SqlEnv
+from src.mysql.result_cache import SqlResultCache
+
+class TestSqlResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SqlResultCache(max_bytes=1024, metadata_ttl=100, select_ttl=10)
+        self.scope = ("localhost", 3306, "test_db")
+
+    def test_normalize(self):
+        self.assertEqual(SqlResultCache.normalize("  SELECT  name\n FROM t ;"), "SELECT name FROM t")
+        self.assertEqual(SqlResultCache.normalize("SELECT * FROM t WHERE a = 'x  y'"), "SELECT * FROM t WHERE a = 'x  y'")
+
+    def test_get_statement_class(self):
+        self.assertEqual(self.cache.get_statement_class("DESC customers"), "metadata")
+        self.assertEqual(self.cache.get_statement_class("SHOW TABLES"), "metadata")
+        self.assertEqual(self.cache.get_statement_class("SELECT name FROM t"), "select")
+        self.assertIsNone(self.cache.get_statement_class("SELECT NOW()"))
+        self.assertIsNone(self.cache.get_statement_class("UPDATE t SET a = 1"))
+
+    def test_get_statement_class_schema_statements(self):
+        for action in ("DESC customers", "DESCRIBE customers", "SHOW TABLES", "show full tables",
+                       "SHOW COLUMNS FROM customers", "SHOW FULL FIELDS FROM customers", "SHOW CREATE TABLE customers"):
+            with self.subTest(action=action):
+                self.assertEqual(self.cache.get_statement_class(action), "metadata")
+
+    def test_get_statement_class_volatile_statements(self):
+        # The server state changes between two statements, it is never served from the cache
+        for action in ("SHOW PROCESSLIST", "SHOW FULL PROCESSLIST", "SHOW STATUS", "SHOW GLOBAL STATUS",
+                       "SHOW VARIABLES LIKE 'max_connections'", "SHOW TABLE STATUS", "SHOW CREATE VIEW v"):
+            with self.subTest(action=action):
+                self.assertIsNone(self.cache.get_statement_class(action))
+                self.cache.set(self.scope, action, [("row",)], 0)
+                self.assertIs(self.cache.get(self.scope, action, 1), SqlResultCache.MISS)
+
+    def test_explain_uses_select_ttl(self):
+        self.assertEqual(self.cache.get_statement_class("EXPLAIN SELECT * FROM t"), "select")
+        self.assertIsNone(self.cache.get_statement_class("EXPLAIN SELECT NOW()"))
+        self.cache.set(self.scope, "EXPLAIN SELECT * FROM t", [("plan",)], 0)
+        self.assertEqual(self.cache.get(self.scope, "EXPLAIN SELECT * FROM t", 5), [("plan",)])
+        self.assertIs(self.cache.get(self.scope, "EXPLAIN SELECT * FROM t", 50), SqlResultCache.MISS)
+
+    def test_get_set(self):
+        self.assertIs(self.cache.get(self.scope, "SELECT a FROM t", 0), SqlResultCache.MISS)
+        self.cache.set(self.scope, "SELECT a FROM t;", [(1,)], 0)
+        self.assertEqual(self.cache.get(self.scope, "SELECT  a FROM t", 1), [(1,)])
+        self.assertIs(self.cache.get(("other", 3306, "test_db"), "SELECT a FROM t", 1), SqlResultCache.MISS)
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_ttl_per_statement_class(self):
+        self.cache.set(self.scope, "SELECT a FROM t", [(1,)], 0)
+        self.cache.set(self.scope, "DESC t", [("a", "int")], 0)
+        self.assertIs(self.cache.get(self.scope, "SELECT a FROM t", 50), SqlResultCache.MISS)
+        self.assertEqual(self.cache.get(self.scope, "DESC t", 50), [("a", "int")])
+        self.assertIs(self.cache.get(self.scope, "DESC t", 150), SqlResultCache.MISS)
+
+    def test_size_bound_evicts_least_recently_used(self):
+        rows = [("x" * 400,)]
+        self.cache.set(self.scope, "SELECT a FROM t1", rows, 0)
+        self.cache.set(self.scope, "SELECT a FROM t2", rows, 0)
+        self.cache.get(self.scope, "SELECT a FROM t1", 0)
+        self.cache.set(self.scope, "SELECT a FROM t3", rows, 0)
+        self.assertLessEqual(self.cache.size_bytes, 1024)
+        self.assertIsNot(self.cache.get(self.scope, "SELECT a FROM t1", 0), SqlResultCache.MISS)
+        self.assertIs(self.cache.get(self.scope, "SELECT a FROM t2", 0), SqlResultCache.MISS)
+        self.assertEqual(self.cache.get_stats()["evictions"], 1)
+
+    def test_set_skips_oversized_result(self):
+        self.cache.set(self.scope, "SELECT a FROM t", [("x" * 2048,)], 0)
+        self.assertEqual(self.cache.get_stats()["entries"], 0)
+
+    @patch('src.mysql.execution_env.mysql.connector.connect')
+    def test_sql_env_uses_cache(self, mock_connect):
+        mock_cursor = mock_connect.return_value.cursor.return_value
+        mock_cursor.fetchall.return_value = [("row1",)]
+        sql_env = SqlEnv({"host": "localhost", "port": 3306, "user": "root", "database": "test_db", "password": "password"}, result_cache=self.cache)
+        self.assertEqual(sql_env.step("SELECT * FROM t")[0], [("row1",)])
+        self.assertEqual(sql_env.step("SELECT *  FROM t;")[0], [("row1",)])
+        mock_cursor.execute.assert_called_once_with("SELECT * FROM t")
+        self.assertEqual(len(sql_env.trajectory), 2)
+
+if __name__ == '__main__':
+    unittest.main()
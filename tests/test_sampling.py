@@ -0,0 +1,71 @@
+import time
+import unittest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import Status, StatusCode, set_span_in_context
+from src.logging.sampling import TailSamplingSpanProcessor, DEBUG_ATTRIBUTE
+
+class TestTailSamplingSpanProcessor(unittest.TestCase):
+
+    def _get_tracer(self, sample_ratio: float = 0.0, slow_threshold_millis: float = 10_000, max_traces: int = 1024):
+        self.exporter = InMemorySpanExporter()
+        self.processor = TailSamplingSpanProcessor(
+            [SimpleSpanProcessor(self.exporter)], sample_ratio, slow_threshold_millis, max_traces
+        )
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(self.processor)
+        return tracer_provider.get_tracer("test")
+
+    def _get_span_names(self) -> list[str]:
+        return [span.name for span in self.exporter.get_finished_spans()]
+
+    def test_drops_fast_successful_trace(self):
+        tracer = self._get_tracer()
+        with tracer.start_as_current_span("root"):
+            with tracer.start_as_current_span("state_flow.observe"):
+                pass
+        self.assertEqual(self._get_span_names(), [])
+        self.assertEqual(len(self.processor.traces), 0)
+
+    def test_keeps_whole_trace_with_error(self):
+        tracer = self._get_tracer()
+        with tracer.start_as_current_span("root"):
+            with tracer.start_as_current_span("state_flow.executor") as span:
+                span.set_status(Status(StatusCode.ERROR))
+            with tracer.start_as_current_span("state_flow.error"):
+                pass
+        self.assertEqual(self._get_span_names(), ["state_flow.executor", "state_flow.error", "root"])
+
+    def test_keeps_debug_trace(self):
+        tracer = self._get_tracer()
+        with tracer.start_as_current_span("root") as span:
+            span.set_attribute(DEBUG_ATTRIBUTE, True)
+        self.assertEqual(self._get_span_names(), ["root"])
+
+    def test_keeps_slow_trace(self):
+        tracer = self._get_tracer(slow_threshold_millis=1)
+        with tracer.start_as_current_span("root"):
+            time.sleep(0.01)
+        self.assertEqual(self._get_span_names(), ["root"])
+
+    def test_keeps_sampled_trace(self):
+        tracer = self._get_tracer(sample_ratio=1.0)
+        with tracer.start_as_current_span("root"):
+            pass
+        self.assertEqual(self._get_span_names(), ["root"])
+
+    def test_late_span_follows_decision(self):
+        tracer = self._get_tracer()
+        with tracer.start_as_current_span("root") as root:
+            root.set_attribute(DEBUG_ATTRIBUTE, True)
+            late_span = tracer.start_span("late")
+        late_span.end()
+        self.assertEqual(self._get_span_names(), ["root", "late"])
+
+    def test_buffer_is_bounded(self):
+        tracer = self._get_tracer(max_traces=2)
+        for index in range(3):
+            root = tracer.start_span(f"root{index}")
+            tracer.start_span("child", context=set_span_in_context(root)).end()
+        self.assertEqual(len(self.processor.traces), 2)
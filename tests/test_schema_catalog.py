@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from src.mysql.execution_env import SqlEnv
+from src.mysql.schema_catalog import SchemaCatalog
+from src.utils.constants import Constants
+
+class TestSchemaCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {"host": "localhost", "port": 3306, "user": "root", "database": "test_db", "password": "password"}
+        self.patcher = patch('src.mysql.schema_catalog.mysql.connector.connect')
+        self.mock_connect = self.patcher.start()
+        self.mock_cursor = self.mock_connect.return_value.cursor.return_value
+        self.mock_cursor.fetchall.side_effect = lambda: [
+            [("customers",), ("orders",)],
+            [
+                ("customers", "customerNumber", "int", "NO", "PRI", None, ""),
+                ("customers", "customerName", "varchar(50)", "NO", "", None, ""),
+                ("orders", "orderNumber", "int", "NO", "PRI", None, ""),
+                ("orders", "customerNumber", "int", "NO", "MUL", None, ""),
+            ],
+            [("orders", "customerNumber", "customers", "customerNumber")],
+        ][self.mock_cursor.execute.call_count % 3 - 1]
+        self.catalog = SchemaCatalog(self.config, refresh_interval=600, inject_tables=2)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_refresh(self):
+        self.catalog.refresh()
+        self.assertEqual(list(self.catalog.tables), ["customers", "orders"])
+        self.assertEqual(self.catalog.tables["customers"].columns[0], ("customerNumber", "int", "NO", "PRI", None, ""))
+        self.assertEqual(self.catalog.tables["orders"].foreign_keys, [("customerNumber", "customers", "customerNumber")])
+        self.assertEqual(
+            self.catalog.tables["orders"].get_observation(),
+            "[('orderNumber', 'int', 'NO', 'PRI', None, ''), ('customerNumber', 'int', 'NO', 'MUL', None, '')] "
+            "References: customerNumber -> customers.customerNumber",
+        )
+        self.mock_connect.return_value.close.assert_called_once()
+
+    def test_get_observation(self):
+        self.assertEqual(self.catalog.get_observation("SHOW TABLES"), [("customers",), ("orders",)])
+        self.assertEqual(self.catalog.get_observation("describe `Customers`;"), self.catalog.tables["customers"].columns)
+        self.assertIsNone(self.catalog.get_observation("DESC products"))
+        self.assertIsNone(self.catalog.get_observation("SELECT * FROM customers"))
+        self.assertEqual(self.mock_connect.call_count, 1)
+
+    def test_refresh_if_stale(self):
+        with patch('src.mysql.schema_catalog.time.monotonic', return_value=0):
+            self.catalog.refresh_if_stale()
+            self.catalog.refresh_if_stale()
+        self.assertEqual(self.mock_connect.call_count, 1)
+        with patch('src.mysql.schema_catalog.time.monotonic', return_value=600):
+            self.catalog.refresh_if_stale()
+        self.assertEqual(self.mock_connect.call_count, 2)
+
+    def test_attach_table_definitions(self):
+        definitions = self.catalog.attach_table_definitions("How many orders per customer?")
+        self.assertIn("Action: execute[DESC customers]", definitions)
+        self.assertIn("Action: execute[DESC orders]", definitions)
+        self.assertTrue(definitions.startswith(f"\n{Constants.catalog_thought}"))
+        self.assertEqual(self.catalog.attach_table_definitions("What is the weather?"), "")
+
+        self.catalog.inject_tables = 0
+        self.assertEqual(self.catalog.attach_table_definitions("How many orders?"), "")
+
+    def test_sql_env_serves_metadata_from_catalog(self):
+        sql_env = SqlEnv(self.config, schema_catalog=self.catalog)
+        observation, _, done, info = sql_env.step("DESC orders")
+        self.assertEqual(observation, self.catalog.tables["orders"].columns)
+        self.assertFalse(done)
+        self.assertTrue(info["action_executed"])
+        self.assertEqual(sql_env.trajectory, [("DESC orders", observation)])
+        self.assertEqual(sql_env.get_init_observation(), [("customers",), ("orders",)])
+        # Only the catalog introspection connected to the database
+        self.assertEqual(self.mock_connect.call_count, 1)
+        self.mock_connect.return_value.cursor.assert_called_once_with()
+
+        self.assertIn("Action: execute[DESC customers]", sql_env.attach_init_observation("List the customers"))
+
+    def test_refresh_failure_serves_last_schema(self):
+        with patch('src.mysql.schema_catalog.time.monotonic', return_value=0):
+            self.catalog.refresh_if_stale()
+        self.mock_connect.side_effect = ConnectionError("Lost connection")
+        with patch('src.mysql.schema_catalog.time.monotonic', return_value=600):
+            self.assertEqual(self.catalog.get_observation("SHOW TABLES"), [("customers",), ("orders",)])
+        # The failed refresh is retried after the next interval, not on every statement
+        with patch('src.mysql.schema_catalog.time.monotonic', return_value=700):
+            self.catalog.get_observation("SHOW TABLES")
+        self.assertEqual(self.mock_connect.call_count, 2)
+
+    def test_sql_env_falls_back_when_catalog_fails(self):
+        self.catalog.refresh = MagicMock(side_effect=ConnectionError("Access denied to information_schema"))
+        self.mock_cursor.fetchall.side_effect = None
+        self.mock_cursor.fetchall.return_value = [("customers",)]
+        sql_env = SqlEnv(self.config, schema_catalog=self.catalog)
+
+        observation, _, done, _ = sql_env.step("DESC customers")
+        # The statement runs on the database instead of failing the request
+        self.assertEqual(observation, [("customers",)])
+        self.assertFalse(done)
+        self.mock_cursor.execute.assert_called_once_with("DESC customers")
+        self.assertEqual(sql_env.get_init_observation(), [("customers",)])
+        self.assertNotIn(Constants.catalog_thought, sql_env.attach_init_observation("List the customers"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from src.groupchat.state_flow_chat import get_chat_client, _create_kernel_with_chat_completion
+from src.groupchat.state_flow_chat import get_chat_client, get_shared_kernel, get_state_flow_agents, _create_kernel_with_chat_completion
 from src.mysql.execution_env import SqlEnv
 from semantic_kernel.agents import AgentGroupChat
 from semantic_kernel.agents import Agent
@@ -10,6 +10,12 @@ from src.groupchat.state_flow_selection_strategy import StateFlowSelectionStrate
 
 class TestStateFlowChat(unittest.TestCase):
 
+    def setUp(self):
+        get_shared_kernel.cache_clear()
+        get_state_flow_agents.cache_clear()
+        self.addCleanup(get_shared_kernel.cache_clear)
+        self.addCleanup(get_state_flow_agents.cache_clear)
+
     @patch('src.groupchat.state_flow_chat.AzureChatCompletion')
     @patch('src.groupchat.state_flow_chat.Kernel')
     def test_create_kernel_with_chat_completion(self, MockKernel, MockAzureChatCompletion):
@@ -35,7 +41,7 @@ class TestStateFlowChat(unittest.TestCase):
     @patch('src.groupchat.state_flow_chat.AgentExecute')
     @patch('src.groupchat.state_flow_chat.StateFlowSelectionStrategy')
     @patch('src.groupchat.state_flow_chat.StateFlowTerminationStrategy')
-    @patch('src.groupchat.state_flow_chat._create_kernel_with_chat_completion')
+    @patch('src.groupchat.state_flow_chat.get_shared_kernel')
     def test_get_chat_client(self, mock_create_kernel, MockStateFlowTerminationStrategy, MockStateFlowSelectionStrategy, MockAgentExecute, MockAgentSelect, MockAgentVerify, MockAgentError, MockAgentObserve):
         mock_sql_env = MagicMock(spec=SqlEnv)
         mock_kernel = MagicMock(spec=Kernel)
@@ -60,5 +66,42 @@ class TestStateFlowChat(unittest.TestCase):
         self.assertIsInstance(chat_client, AgentGroupChat)
         self.assertEqual(len(chat_client.agents), 5)
 
+        # The LLM agents are built once, only the executor agent is created per conversation
+        get_chat_client(mock_sql_env)
+        self.assertEqual(MockAgentObserve.call_count, 1)
+        self.assertEqual(MockAgentSelect.call_count, 1)
+        self.assertEqual(MockAgentExecute.call_count, 2)
+
+    @patch('src.groupchat.state_flow_chat.AzureChatCompletion')
+    def test_get_shared_kernel(self, MockAzureChatCompletion):
+        services = [MagicMock(service_id=service_id) for service_id in ("observe", "error", "verify", "select")]
+        MockAzureChatCompletion.side_effect = services
+
+        with patch.dict('os.environ', {}, clear=True), patch('src.groupchat.state_flow_chat.Kernel') as MockKernel:
+            kernel = get_shared_kernel()
+            self.assertIs(get_shared_kernel(), kernel)
+            self.assertEqual(MockKernel.call_count, 1)
+            self.assertEqual(kernel.add_service.call_count, 4)
+
+        # Every service after the first one reuses the client of the first one
+        self.assertIsNone(MockAzureChatCompletion.call_args_list[0].kwargs["async_client"])
+        for call in MockAzureChatCompletion.call_args_list[1:]:
+            self.assertIs(call.kwargs["async_client"], services[0].client)
+
+    @patch('src.groupchat.state_flow_chat.CachedChatCompletion')
+    @patch('src.groupchat.state_flow_chat.CompletionCache')
+    @patch('src.groupchat.state_flow_chat.AzureChatCompletion')
+    def test_get_shared_kernel_with_completion_cache(self, MockAzureChatCompletion, MockCompletionCache, MockCachedChatCompletion):
+        MockCompletionCache.get_completion_cache_from_environment.return_value = MagicMock()
+
+        with patch.dict('os.environ', {}, clear=True), patch('src.groupchat.state_flow_chat.Kernel'):
+            kernel = get_shared_kernel()
+
+        # Every service records or replays its completions through the same cache
+        self.assertEqual(MockCachedChatCompletion.wrap.call_count, 4)
+        for call in MockCachedChatCompletion.wrap.call_args_list:
+            self.assertIs(call.args[1], MockCompletionCache.get_completion_cache_from_environment.return_value)
+        kernel.add_service.assert_called_with(MockCachedChatCompletion.wrap.return_value)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
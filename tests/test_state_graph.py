@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import MagicMock
+from semantic_kernel.agents import Agent
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from src.groupchat.state_graph import STATE_FLOW_GRAPH, StateGraph, get_state_flow_graph, parse_action
+from src.groupchat.state_flow_selection_strategy import StateFlowSelectionStrategy
+from src.groupchat.state_flow_termination_strategy import StateFlowTerminationStrategy
+from src.agents.observe import AgentObserve
+from src.agents.select import AgentSelect
+from src.agents.verify import AgentVerify
+from src.agents.execute import AgentExecute
+from src.utils.constants import Constants
+
+class TestStateGraph(unittest.IsolatedAsyncioTestCase):
+
+    def _get_history(self, state: str, action: str) -> list[ChatMessageContent]:
+        return [
+            ChatMessageContent(content=f"Thought: t\n{Constants.action_identifier} {action}", name=state, role=AuthorRole.ASSISTANT),
+            ChatMessageContent(content="Observation: [(1,)]", name=AgentExecute.name, role=AuthorRole.ASSISTANT),
+        ]
+
+    def test_parse_action(self):
+        self.assertEqual(parse_action(f"Thought: t\n{Constants.action_identifier} execute[SELECT 1]"), ("execute[SELECT 1]", "select"))
+        self.assertEqual(parse_action(f"{Constants.action_identifier} execute[DESC submissions]"), ("execute[DESC submissions]", "execute"))
+        self.assertEqual(parse_action(f"{Constants.action_identifier} {Constants.action_submit}"), (Constants.action_submit, "submit"))
+        self.assertEqual(parse_action(None), ("", "other"))
+
+    def test_compiled_transitions(self):
+        graph = get_state_flow_graph()
+        self.assertIs(graph, get_state_flow_graph())
+        self.assertEqual(graph.transitions[(AgentSelect.name, "select")], AgentVerify.name)
+        self.assertEqual(graph.transitions[(AgentSelect.name, "execute")], AgentSelect.name)
+        self.assertEqual(graph.transitions[(AgentObserve.name, "submit")], AgentSelect.name)
+        self.assertEqual(graph.get_next_state(self._get_history(AgentVerify.name, "execute[SELECT 1]")), AgentVerify.name)
+
+    def test_is_final(self):
+        graph = get_state_flow_graph()
+        self.assertTrue(graph.is_final(self._get_history(AgentVerify.name, Constants.action_submit)))
+        self.assertFalse(graph.is_final(self._get_history(AgentObserve.name, Constants.action_submit)))
+        # A query reading a column named like the action does not end the conversation
+        self.assertFalse(graph.is_final(self._get_history(AgentSelect.name, "execute[SELECT submitted_at FROM orders]")))
+
+    def test_unknown_action_type(self):
+        with self.assertRaises(ValueError):
+            StateGraph({**STATE_FLOW_GRAPH, "transitions": {AgentObserve.name: {"delete": AgentSelect.name}}})
+
+    async def test_new_state(self):
+        # A planner state between observe and select is only a change of the graph
+        graph = StateGraph({
+            **STATE_FLOW_GRAPH,
+            "transitions": {
+                **STATE_FLOW_GRAPH["transitions"],
+                AgentObserve.name: {"*": "planner"},
+                "planner": {"*": AgentSelect.name},
+            },
+        })
+        agents = [MagicMock(spec=Agent) for _ in range(3)]
+        for agent, name in zip(agents, (AgentExecute.name, "planner", AgentSelect.name)):
+            agent.name = name
+        strategy = StateFlowSelectionStrategy(state_graph=graph)
+
+        self.assertEqual((await strategy.next(agents, self._get_history(AgentObserve.name, "execute[DESC t]"))).name, "planner")
+        self.assertEqual((await strategy.next(agents, self._get_history("planner", "other"))).name, AgentSelect.name)
+        with self.assertRaises(ValueError):
+            await strategy.next(agents[:1], self._get_history("planner", "other"))
+        # An agent added to the same list of agents is indexed
+        agent_verify = MagicMock(spec=Agent)
+        agent_verify.name = AgentVerify.name
+        agents.append(agent_verify)
+        self.assertIs(await strategy.next(agents, self._get_history(AgentSelect.name, "execute[SELECT 1]")), agent_verify)
+
+    async def test_termination_uses_graph(self):
+        graph = StateGraph({**STATE_FLOW_GRAPH, "final_actions": {AgentObserve.name: ["submit"]}})
+        strategy = StateFlowTerminationStrategy(state_graph=graph)
+        agent = MagicMock(spec=Agent)
+        agent.id = "test_agent"
+        self.assertTrue(await strategy.should_terminate(agent, self._get_history(AgentObserve.name, Constants.action_submit)))
+        self.assertFalse(await strategy.should_terminate(agent, self._get_history(AgentSelect.name, Constants.action_submit)))
+
+if __name__ == '__main__':
+    unittest.main()
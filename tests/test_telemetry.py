@@ -0,0 +1,116 @@
+import os
+import json
+import logging
+import tempfile
+import unittest
+import unittest.mock
+from unittest.mock import patch
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+from src.logging.payload import LogPayload
+from src.logging.telemetry import (
+    RotatingJsonLinesFile,
+    get_telemetry_config_from_environment,
+    _get_span_exporters,
+    _get_json_line,
+    _get_sampler,
+)
+
+class TestTelemetryConfig(unittest.TestCase):
+
+    @patch.dict(os.environ, {"APPLICATIONINSIGHTS_CONNECTION_STRING": "InstrumentationKey=test"}, clear=True)
+    def test_defaults_to_azure_with_connection_string(self):
+        self.assertEqual(get_telemetry_config_from_environment()["exporters"], ["azure"])
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_defaults_to_none(self):
+        self.assertEqual(get_telemetry_config_from_environment()["exporters"], [])
+
+    @patch.dict(os.environ, {"TELEMETRY_EXPORTER": "Console, file", "TELEMETRY_TRACE_SAMPLE_RATIO": "0.1"}, clear=True)
+    def test_exporters_and_sampling(self):
+        config = get_telemetry_config_from_environment()
+        self.assertEqual(config["exporters"], ["console", "file"])
+        self.assertEqual(config["trace_sample_ratio"], 0.1)
+
+    @patch.dict(os.environ, {"TELEMETRY_EXPORTER": "jaeger"}, clear=True)
+    def test_unknown_exporter(self):
+        with self.assertRaises(ValueError):
+            get_telemetry_config_from_environment()
+
+    @patch.dict(os.environ, {"TELEMETRY_EXPORTER": "azure"}, clear=True)
+    def test_azure_without_connection_string(self):
+        with self.assertRaises(ValueError):
+            get_telemetry_config_from_environment()
+
+    @patch.dict(os.environ, {"TELEMETRY_TAIL_SAMPLING": "true", "TELEMETRY_TRACE_SAMPLE_RATIO": "0.1"}, clear=True)
+    def test_tail_sampling_rejects_head_sampling(self):
+        with self.assertRaises(ValueError):
+            get_telemetry_config_from_environment()
+
+    @patch.dict(os.environ, {"TELEMETRY_TAIL_SAMPLING": "true"}, clear=True)
+    def test_tail_sampling_records_every_trace(self):
+        # A caller that did not sample its trace does not hide a slow or failed conversation
+        self.assertIs(_get_sampler(get_telemetry_config_from_environment()), ALWAYS_ON)
+
+
+class TestRotatingJsonLinesFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "traces.jsonl")
+
+    def test_rotation(self):
+        file = RotatingJsonLinesFile(self.path, max_bytes=20, backup_count=2)
+        for index in range(4):
+            file.write(json.dumps({"line": index}) + "\n")
+        file.close()
+        with open(self.path, encoding="utf-8") as current, open(f"{self.path}.1", encoding="utf-8") as rotated:
+            self.assertEqual(current.read(), '{"line": 3}\n')
+            self.assertEqual(rotated.read(), '{"line": 2}\n')
+        with open(f"{self.path}.2", encoding="utf-8") as oldest:
+            self.assertEqual(oldest.read(), '{"line": 1}\n')
+        self.assertFalse(os.path.exists(f"{self.path}.3"))
+
+    def test_file_span_exporter(self):
+        config = {
+            "exporters": ["file"],
+            "file_path": self.directory.name,
+            "file_max_bytes": 1024 * 1024,
+            "file_backup_count": 1,
+        }
+        exporters = _get_span_exporters(config)
+        self.assertIsInstance(exporters[0], ConsoleSpanExporter)
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(exporters[0]))
+        with tracer_provider.get_tracer("test").start_as_current_span("state_flow.select_next"):
+            pass
+        tracer_provider.shutdown()
+        with open(self.path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["name"], "state_flow.select_next")
+
+    def test_json_line(self):
+        class Item:
+            def to_json(self, indent=4):
+                return json.dumps({"a": 1}, indent=indent)
+        self.assertEqual(_get_json_line(Item()), '{"a": 1}' + os.linesep)
+
+
+class TestLogPayload(unittest.TestCase):
+
+    def test_cuts_long_payload(self):
+        self.assertEqual(str(LogPayload("x" * 10, 4)), "xxxx... [10 chars]")
+
+    def test_keeps_short_payload(self):
+        self.assertEqual(str(LogPayload({"content": "answer"}, 100)), "{'content': 'answer'}")
+        self.assertEqual(str(LogPayload("x" * 10, None)), "x" * 10)
+
+    def test_formats_lazily(self):
+        value = unittest.mock.MagicMock()
+        logger = logging.getLogger("test_log_payload")
+        logger.setLevel(logging.INFO)
+        logger.debug("Observation: %s", LogPayload(value, 10))
+        value.__str__.assert_not_called()
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+from src.agents.thought_action import ThoughtActionParser
+
+class TestThoughtActionParser(unittest.TestCase):
+
+    def test_parse_json(self):
+        self.assertEqual(
+            ThoughtActionParser.parse('{"thought": "count them", "action": "execute[SELECT COUNT(*) FROM t]"}'),
+            ("Thought: count them", "execute[SELECT COUNT(*) FROM t]", "json"),
+        )
+        self.assertEqual(
+            ThoughtActionParser.parse('```json\n{"thought": "done", "action": "submit"}\n```'),
+            ("Thought: done", "submit", "json"),
+        )
+
+    def test_parse_cut_json(self):
+        self.assertEqual(
+            ThoughtActionParser.parse('{"thought": "a \\"quoted\\" name", "action": "execute[SELECT 1]", "extra'),
+            ('Thought: a "quoted" name', "execute[SELECT 1]", "json"),
+        )
+
+    def test_parse_text(self):
+        self.assertEqual(
+            ThoughtActionParser.parse("Thought: count them\nAction: execute[SELECT COUNT(*) FROM t]"),
+            ("Thought: count them", "execute[SELECT COUNT(*) FROM t]", "text"),
+        )
+
+    def test_parse_lenient(self):
+        self.assertEqual(
+            ThoughtActionParser.parse("Thought: done\n**action**:submit"),
+            ("Thought: done", "submit", "lenient"),
+        )
+        self.assertEqual(
+            ThoughtActionParser.parse("I should count them. execute[SELECT COUNT(*) FROM t]"),
+            ("Thought: I should count them.", "execute[SELECT COUNT(*) FROM t]", "lenient"),
+        )
+
+    def test_parse_missing(self):
+        self.assertEqual(ThoughtActionParser.parse("test_thought"), ("Thought: test_thought", "", "missing"))
+        self.assertEqual(ThoughtActionParser.parse('{"thought": "no action"}'), ('Thought: {"thought": "no action"}', "", "missing"))
+
+    def test_parse_candidates(self):
+        self.assertEqual(
+            ThoughtActionParser.parse_candidates("Thought: t\nAction: execute[SELECT 1]\nAction: execute[SELECT 2]\nAction: execute[SELECT 3]", 2),
+            ("Thought: t", ["execute[SELECT 1]", "execute[SELECT 2]"], "text"),
+        )
+        self.assertEqual(
+            ThoughtActionParser.parse_candidates('{"thought": "t", "actions": ["execute[SELECT 1]", "execute[SELECT 2]"]}', 3),
+            ("Thought: t", ["execute[SELECT 1]", "execute[SELECT 2]"], "json"),
+        )
+        self.assertEqual(ThoughtActionParser.parse_candidates("test_thought", 3), ("Thought: test_thought", [""], "missing"))
+
+    def test_get_structured_output_from_environment(self):
+        with patch.dict(ThoughtActionParser.OUTPUT_CONFIG, {"structured": True}):
+            self.assertTrue(ThoughtActionParser.get_structured_output_from_environment())
+        with patch.dict(ThoughtActionParser.OUTPUT_CONFIG, {"structured": False}):
+            self.assertFalse(ThoughtActionParser.get_structured_output_from_environment())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from semantic_kernel.kernel import Kernel
+from semantic_kernel.contents.chat_history import ChatHistory
+from openai.types import CompletionUsage
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+from src.agents.base import StateFlowBaseAgent
+from src.agents.execute import AgentExecute
+from src.agents.observe import AgentObserve
+from src.groupchat.state_flow_selection_strategy import StateFlowSelectionStrategy
+from src.logging.tracing import (
+    TRACER_NAME,
+    get_sql_hash,
+    STATE_ATTRIBUTE,
+    ITERATION_ATTRIBUTE,
+    SQL_HASH_ATTRIBUTE,
+    ROW_COUNT_ATTRIBUTE,
+)
+from src.mysql.execution_env import SqlEnv
+from src.utils.constants import Constants
+
+class TestStateFlowTracing(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        tracer = tracer_provider.get_tracer(TRACER_NAME)
+        for module in ("src.agents.base", "src.agents.execute", "src.groupchat.state_flow_selection_strategy"):
+            patcher = patch(f"{module}.tracer", tracer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get_spans(self) -> dict:
+        return {span.name: span for span in self.exporter.get_finished_spans()}
+
+    def test_get_sql_hash(self):
+        self.assertEqual(get_sql_hash("SELECT *\n  FROM users"), get_sql_hash("SELECT * FROM users"))
+        self.assertNotEqual(get_sql_hash("SELECT * FROM users"), get_sql_hash("SELECT * FROM orders"))
+        self.assertEqual(len(get_sql_hash("SELECT 1")), 16)
+
+    async def test_selection_span(self):
+        history = [ChatMessageContent(content="Hello", name="user", role=AuthorRole.USER)]
+        agents = [AgentObserve().get_agent(), AgentExecute(None).get_agent()]
+
+        await StateFlowSelectionStrategy().next(agents, history)
+
+        span = self._get_spans()["state_flow.select_next"]
+        self.assertEqual(span.attributes[STATE_ATTRIBUTE], "user")
+        self.assertEqual(span.attributes[ITERATION_ATTRIBUTE], 1)
+        self.assertEqual(span.attributes["state_flow.next_state"], AgentObserve.name)
+
+    async def test_agent_spans(self):
+        kernel = MagicMock(spec=Kernel)
+        chat_completion_service = MagicMock(spec=ChatCompletionClientBase)
+        chat_completion_service.get_chat_message_contents = AsyncMock(
+            return_value=[ChatMessageContent(content="test_thought", role="assistant", name="observe")]
+        )
+        kernel.get_service.return_value = chat_completion_service
+        agent = StateFlowBaseAgent(
+            service_id="observe", kernel=kernel, name="observe", instructions="instructions",
+            execution_settings=MagicMock(spec=PromptExecutionSettings),
+        )
+        history = ChatHistory()
+        history.add_user_message("question")
+
+        [message async for message in agent.invoke(history)]
+
+        spans = self._get_spans()
+        state_span = spans["state_flow.observe"]
+        self.assertEqual(state_span.attributes[STATE_ATTRIBUTE], "observe")
+        self.assertEqual(state_span.attributes[ITERATION_ATTRIBUTE], 1)
+        # The instructions are not counted, both spans of the turn carry the same iteration
+        self.assertEqual(spans["state_flow.llm_call"].attributes[ITERATION_ATTRIBUTE], 1)
+        # A reply with only a thought gets an empty action, the LLM is not called again
+        self.assertEqual(spans["state_flow.llm_call"].parent.span_id, state_span.context.span_id)
+        self.assertNotIn("state_flow.llm_retry", spans)
+        chat_completion_service.get_chat_message_contents.assert_awaited_once()
+
+    async def test_agent_stream_spans(self):
+        kernel = MagicMock(spec=Kernel)
+        chat_completion_service = MagicMock(spec=ChatCompletionClientBase)
+
+        async def stream(**kwargs):
+            yield [StreamingChatMessageContent(role="assistant", choice_index=0, content="Thought: t\nAction: submit")]
+            yield [StreamingChatMessageContent(
+                role="assistant", choice_index=0, content="",
+                metadata={"usage": CompletionUsage(prompt_tokens=10, completion_tokens=5, total_tokens=15)},
+            )]
+
+        chat_completion_service.get_streaming_chat_message_contents = MagicMock(side_effect=stream)
+        kernel.get_service.return_value = chat_completion_service
+        agent = StateFlowBaseAgent(
+            service_id="observe", kernel=kernel, name="observe", instructions="instructions",
+            execution_settings=MagicMock(spec=PromptExecutionSettings),
+        )
+        history = ChatHistory()
+        history.add_user_message("question")
+
+        with patch("src.agents.base.state_flow_metrics") as metrics:
+            [message async for message in agent.invoke_stream(history)]
+
+        # A streamed turn has the same spans as an invoked one, with the usage of the last chunk
+        spans = self._get_spans()
+        state_span = spans["state_flow.observe"]
+        llm_span = spans["state_flow.llm_call"]
+        self.assertEqual(state_span.attributes[ITERATION_ATTRIBUTE], 1)
+        self.assertEqual(llm_span.attributes[ITERATION_ATTRIBUTE], 1)
+        self.assertEqual(llm_span.parent.span_id, state_span.context.span_id)
+        self.assertEqual(llm_span.attributes["gen_ai.usage.input_tokens"], 10)
+        self.assertEqual(llm_span.attributes["gen_ai.usage.output_tokens"], 5)
+        self.assertEqual(metrics.record_llm_call.call_args.args[2].completion_tokens, 5)
+
+    async def test_executor_spans(self):
+        sql_env = MagicMock(spec=SqlEnv)
+        sql_env.step_async.return_value = ([(row,) for row in range(Constants.observation_max_rows + 5)], None, None, None)
+        agent = AgentExecute(sql_executor_env=sql_env, kernel=MagicMock(spec=Kernel)).get_agent()
+        history = ChatHistory()
+        history.add_message(ChatMessageContent(
+            role=AuthorRole.ASSISTANT, name="select",
+            content=f"Thought: query\n{Constants.action_identifier} execute[SELECT * FROM users;]",
+        ))
+
+        [message async for message in agent.invoke(history)]
+
+        spans = self._get_spans()
+        state_span = spans[f"state_flow.{AgentExecute.name}"]
+        self.assertEqual(state_span.attributes[ITERATION_ATTRIBUTE], 1)
+        for name in ("state_flow.parse", "state_flow.guardrail", "state_flow.sql_execute", "state_flow.truncate"):
+            self.assertEqual(spans[name].parent.span_id, state_span.context.span_id)
+        self.assertEqual(spans["state_flow.sql_execute"].attributes[SQL_HASH_ATTRIBUTE], get_sql_hash("SELECT * FROM users"))
+        self.assertEqual(spans["state_flow.sql_execute"].attributes[ROW_COUNT_ATTRIBUTE], Constants.observation_max_rows + 5)
+        self.assertEqual(spans["state_flow.truncate"].attributes["state_flow.truncated"], "rows")
+
+    async def test_executor_spans_dml(self):
+        sql_env = MagicMock(spec=SqlEnv)
+        agent = AgentExecute(sql_executor_env=sql_env, kernel=MagicMock(spec=Kernel)).get_agent()
+        history = ChatHistory()
+        history.add_message(ChatMessageContent(
+            role=AuthorRole.ASSISTANT, name="select",
+            content=f"Thought: query\n{Constants.action_identifier} execute[DELETE FROM users]",
+        ))
+
+        [message async for message in agent.invoke(history)]
+
+        spans = self._get_spans()
+        self.assertTrue(spans["state_flow.guardrail"].attributes["state_flow.blocked"])
+        self.assertNotIn("state_flow.sql_execute", spans)
+        sql_env.step_async.assert_not_called()